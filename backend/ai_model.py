@@ -7,6 +7,8 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import JsonOutputParser
 
+from extraction_cache import ExtractionCache
+
 load_dotenv()
 
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
@@ -21,18 +23,7 @@ llm = ChatGoogleGenerativeAI(
 )
 
 
-def extract_activities(message):
-    """
-    Extracts activities from a given message using the Gemini API with Langchain and returns a JSON object.
-
-    Args:
-        message: The input message containing activities.
-
-    Returns:
-        A JSON object containing a list of activities.
-    """
-
-    template = """
+EXTRACTION_TEMPLATE = """
     Todays date is {date}
     You are a precise assistant designed to extract all activities from a user's message.
     
@@ -58,17 +49,154 @@ def extract_activities(message):
     }}
     """
 
-    prompt = PromptTemplate.from_template(template)
+# Compiled once and shared by every call; runnables are safe to invoke concurrently
+prompt = PromptTemplate.from_template(EXTRACTION_TEMPLATE)
+activity_extractor = RunnablePassthrough() | prompt | llm | JsonOutputParser()
+
+# Set as "error" on results of failed calls, which must not be stored as answers
+EXTRACTION_FAILED = "Extraction failed"
+
+# Maximum number of Gemini calls in flight for a single batch
+BATCH_MAX_CONCURRENCY = int(os.getenv("EXTRACTION_MAX_CONCURRENCY", "4"))
+
+# Results only depend on the message and the date the prompt is rendered with
+extraction_cache = ExtractionCache(
+    maxsize=int(os.getenv("EXTRACTION_CACHE_SIZE", "5000")),
+    ttl=int(os.getenv("EXTRACTION_CACHE_TTL", "86400")),
+    db_path=os.getenv("EXTRACTION_CACHE_DB"),
+)
 
-    activity_extractor = RunnablePassthrough() | prompt | llm | JsonOutputParser()
+
+def extract_activities(message):
+    """
+    Extracts activities from a given message using the Gemini API with Langchain and returns a JSON object.
+
+    Args:
+        message: The input message containing activities.
+
+    Returns:
+        A JSON object containing a list of activities.
+    """
+
+    now = datetime.now()
+    cached = extraction_cache.get(message, now.date())
+    if cached is not None:
+        return cached
 
     try:
         result = activity_extractor.invoke(
-            {"message": message, "date": datetime.now()},
+            {"message": message, "date": now},
+        )
+
+        extracted = {"activities": result.get("activities", [])}
+        extraction_cache.set(message, now.date(), extracted)
+        return extracted
+
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return {"activities": [], "error": EXTRACTION_FAILED}
+
+
+async def aextract_activities(message):
+    """
+    Async version of extract_activities, awaiting Gemini with ainvoke.
+
+    Args:
+        message: The input message containing activities.
+
+    Returns:
+        A JSON object containing a list of activities.
+    """
+
+    now = datetime.now()
+    cached = extraction_cache.get(message, now.date())
+    if cached is not None:
+        return cached
+
+    try:
+        result = await activity_extractor.ainvoke(
+            {"message": message, "date": now},
         )
 
-        return {"activities": result.get("activities", [])}
+        extracted = {"activities": result.get("activities", [])}
+        extraction_cache.set(message, now.date(), extracted)
+        return extracted
 
     except Exception as e:
         print(f"An error occurred: {e}")
-        return {"activities": []}
+        return {"activities": [], "error": EXTRACTION_FAILED}
+
+
+def _start_batch(messages, today):
+    """Return the cached results, None where missing, and {cache key: (message,
+    [indexes])} of the distinct uncached messages"""
+    extracted = [extraction_cache.get(message, today) for message in messages]
+    pending = {}
+    for index, message in enumerate(messages):
+        if extracted[index] is None:
+            key = extraction_cache.make_key(message, today)
+            pending.setdefault(key, (message, []))[1].append(index)
+    return extracted, pending
+
+
+def _finish_batch(extracted, pending, results, today):
+    """Fill extracted with the batch results of pending, caching the good ones"""
+    for (message, indexes), result in zip(pending.values(), results):
+        if isinstance(result, Exception):
+            print(f"An error occurred: {result}")
+            activities = {"activities": [], "error": EXTRACTION_FAILED}
+        elif not isinstance(result, dict):
+            # The parser returns whatever JSON the model produced
+            print(f"Unexpected extraction result: {result!r}")
+            activities = {"activities": [], "error": EXTRACTION_FAILED}
+        else:
+            activities = {"activities": result.get("activities", [])}
+            extraction_cache.set(message, today, activities)
+        for index in indexes:
+            extracted[index] = activities
+    return extracted
+
+
+def extract_activities_batch(messages, max_concurrency=BATCH_MAX_CONCURRENCY):
+    """
+    Extracts activities from several messages in parallel.
+
+    Args:
+        messages: The input messages containing activities.
+        max_concurrency: Maximum number of concurrent Gemini calls.
+
+    Returns:
+        A list of JSON objects, one per message, in input order.
+    """
+
+    now = datetime.now()
+    # Only send uncached messages to Gemini, once per distinct cache key
+    extracted, pending = _start_batch(messages, now.date())
+    results = activity_extractor.batch(
+        [{"message": message, "date": now} for message, _ in pending.values()],
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+    return _finish_batch(extracted, pending, results, now.date())
+
+
+async def aextract_activities_batch(messages, max_concurrency=BATCH_MAX_CONCURRENCY):
+    """
+    Async version of extract_activities_batch, awaiting Gemini with abatch.
+
+    Args:
+        messages: The input messages containing activities.
+        max_concurrency: Maximum number of concurrent Gemini calls.
+
+    Returns:
+        A list of JSON objects, one per message, in input order.
+    """
+
+    now = datetime.now()
+    extracted, pending = _start_batch(messages, now.date())
+    results = await activity_extractor.abatch(
+        [{"message": message, "date": now} for message, _ in pending.values()],
+        config={"max_concurrency": max_concurrency},
+        return_exceptions=True,
+    )
+    return _finish_batch(extracted, pending, results, now.date())
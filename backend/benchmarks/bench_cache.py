@@ -0,0 +1,130 @@
+"""Benchmark: read-through cache hit ratio, latency and staleness per backend.
+
+Two DataHandlers stand in for two workers serving one user with a read-heavy
+mix of task and list lookups and occasional updates. Entries are keyed by
+data version, and the version is cached alongside them. The Redis stand-in is
+shared between the workers, so writes from either one never surface as stale
+hits; the local LRU is private to each worker and serves stale hits until its
+copy of the version expires. Mongo round trips are counted per lookup, so a
+hit that still has to ask Mongo for anything shows up. Needs a MongoDB server:
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_cache.py
+"""
+
+import os
+import random
+import statistics
+import sys
+import time
+
+from pymongo import monitoring
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mongo.data_handler import DataHandler
+from mongo.indexes import migrate
+from read_cache import InMemoryRedis, ReadThroughCache, make_backend
+
+BACKENDS = ("none", "local", "memory-redis")
+TASKS = 200
+OPERATIONS = 5_000
+WRITE_SHARE = 0.05
+VERIFY_RATE = 0.1
+
+
+class CommandCounter(monitoring.CommandListener):
+    """Count commands sent to MongoDB by every client"""
+
+    def __init__(self):
+        self.commands = 0
+
+    def started(self, event):
+        self.commands += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+def make_workers(backend_name):
+    database_name = os.getenv("BENCH_DATABASE_NAME", "todo_app_bench")
+    workers = [DataHandler(os.getenv("MONGO_URL"), database_name) for _ in range(2)]
+    shared = InMemoryRedis() if backend_name == "memory-redis" else None
+    for worker in workers:
+        backend = shared if shared is not None else make_backend(backend_name)
+        worker.read_cache = ReadThroughCache(backend, verify_rate=VERIFY_RATE)
+    return workers
+
+
+def run(workers, user_id, task_ids, counter):
+    """Return (latency samples in ms, Mongo round trips made by the lookups)"""
+    random.seed(len(task_ids))
+    samples = []
+    round_trips = 0
+    for i in range(OPERATIONS):
+        worker = random.choice(workers)
+        task_id = random.choice(task_ids)
+        if random.random() < WRITE_SHARE:
+            worker.update_task(task_id, user_id, {"title": f"Task {i}"})
+            continue
+        commands = counter.commands
+        started = time.perf_counter()
+        if i % 4 == 0:
+            worker.get_task_lists(user_id)
+        else:
+            worker.get_task_by_id(task_id, user_id)
+        samples.append((time.perf_counter() - started) * 1000)
+        round_trips += counter.commands - commands
+    return samples, round_trips
+
+
+def main():
+    counter = CommandCounter()
+    # Registered before any client is created, so every client reports to it
+    monitoring.register(counter)
+    setup = DataHandler(
+        os.getenv("MONGO_URL"), os.getenv("BENCH_DATABASE_NAME", "todo_app_bench")
+    )
+    for name in ("users", "tasks", "task_lists", "data_versions"):
+        setup.db[name].drop()
+    migrate(setup.db)
+    user_id = setup.create_user("bench@example.com", "bench-password")
+    list_id = str(setup.get_task_lists(user_id)[0]["_id"])
+    task_ids = [
+        setup.create_task(
+            {"title": f"Task {i}", "user_id": user_id, "list_ids": [list_id]}
+        )
+        for i in range(TASKS)
+    ]
+
+    print(
+        f"{'backend':14} {'p50 ms':>8} {'p99 ms':>8} {'hit rate':>9} "
+        f"{'verified':>9} {'stale rate':>11} {'mongo/lookup':>13}"
+    )
+    for backend_name in BACKENDS:
+        workers = make_workers(backend_name)
+        samples, round_trips = run(workers, user_id, task_ids, counter)
+        samples.sort()
+        stats = [worker.read_cache.stats() for worker in workers]
+        hits = sum(s["hits"] for s in stats)
+        lookups = hits + sum(s["misses"] for s in stats)
+        verified = sum(s["verified"] for s in stats)
+        stale = sum(s["stale"] for s in stats)
+        print(
+            f"{backend_name:14} {statistics.median(samples):>8.3f} "
+            f"{samples[int(len(samples) * 0.99)]:>8.3f} "
+            f"{hits / lookups if lookups else 0.0:>9.1%} {verified:>9} "
+            f"{stale / verified if verified else 0.0:>11.1%} "
+            f"{round_trips / len(samples):>13.2f}"
+        )
+        for worker in workers:
+            worker.close_connection()
+
+    for name in ("users", "tasks", "task_lists", "data_versions"):
+        setup.db[name].drop()
+    setup.close_connection()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""Micro-benchmark: stdlib jsonify path vs orjson encoding of task documents.
+
+The legacy path stringifies every _id in a loop and encodes with Flask's
+default provider; the new one hands the raw Mongo documents to orjson.
+Run from the backend directory:  python benchmarks/bench_json.py
+"""
+
+import copy
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from flask import Flask
+from flask.json.provider import DefaultJSONProvider
+
+from serialization import encode
+
+SIZES = (1_000, 50_000)
+RUNS = 10
+
+
+def make_tasks(size):
+    """Documents shaped like Task._find_tasks results, before serialization"""
+    user_id = str(ObjectId())
+    list_id = str(ObjectId())
+    now = datetime.utcnow()
+    return [
+        {
+            "_id": ObjectId(),
+            "title": f"Task number {i}",
+            "note": "Remember to bring the documents" if i % 3 == 0 else None,
+            "user_id": user_id,
+            "list_ids": [list_id],
+            "list_id": list_id,
+            "isCompleted": i % 4 == 0,
+            "isImportant": i % 7 == 0,
+            "dueDate": now + timedelta(days=i % 30) if i % 2 else None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for i in range(size)
+    ]
+
+
+def legacy(provider, tasks):
+    for task in tasks:
+        task["_id"] = str(task["_id"])
+    return provider.dumps({"success": True, "tasks": tasks}).encode("utf-8")
+
+
+def orjson_path(tasks):
+    return encode({"success": True, "tasks": tasks})
+
+
+def timed(fn, tasks):
+    samples = []
+    body = b""
+    for _ in range(RUNS):
+        # The legacy path mutates its input, so every run gets a fresh copy
+        batch = copy.deepcopy(tasks)
+        started = time.perf_counter()
+        body = fn(batch)
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples), len(body)
+
+
+def main():
+    provider = DefaultJSONProvider(Flask(__name__))
+    print(f"{'tasks':>8} {'encoder':8} {'median ms':>10} {'bytes':>12} {'speedup':>8}")
+    for size in SIZES:
+        tasks = make_tasks(size)
+        legacy_ms, legacy_bytes = timed(lambda batch: legacy(provider, batch), tasks)
+        orjson_ms, orjson_bytes = timed(orjson_path, tasks)
+        print(f"{size:>8} {'stdlib':8} {legacy_ms:>10.2f} {legacy_bytes:>12} {'':>8}")
+        speedup = legacy_ms / orjson_ms
+        print(
+            f"{size:>8} {'orjson':8} {orjson_ms:>10.2f} {orjson_bytes:>12} "
+            f"{speedup:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Load test: GET /tasks against the Flask and the ASGI server at N connections.
+
+Start both servers against the same MongoDB, then point the benchmark at them:
+    gunicorn -w 4 -b 0.0.0.0:5000 server:app
+    hypercorn -w 4 --bind 0.0.0.0:8000 server_async:app
+    python benchmarks/bench_load.py http://localhost:5000 http://localhost:8000
+
+The servers may also come from SYNC_URL / ASYNC_URL.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import time
+import uuid
+
+import httpx
+
+CONNECTIONS = (10, 100, 500)
+DURATION_SECONDS = 10
+SEED_TASKS = 200
+
+
+async def seed_user(client, base_url):
+    """Register a throwaway user with SEED_TASKS tasks, returning its id"""
+    email = f"bench-{uuid.uuid4().hex}@example.com"
+    response = await client.post(
+        f"{base_url}/auth/register", json={"email": email, "password": "benchmark"}
+    )
+    response.raise_for_status()
+    user_id = response.json()["userId"]
+    tasks = [{"title": f"Benchmark task {i}"} for i in range(SEED_TASKS)]
+    response = await client.post(
+        f"{base_url}/tasks/bulk", json={"tasks": tasks}, headers={"X-User-ID": user_id}
+    )
+    response.raise_for_status()
+    return user_id
+
+
+async def worker(client, url, headers, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        try:
+            response = await client.get(url, headers=headers)
+            if response.status_code != 200:
+                errors.append(response.status_code)
+                continue
+        except httpx.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+
+async def run(base_url, connections, duration):
+    limits = httpx.Limits(max_connections=connections)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        user_id = await seed_user(client, base_url)
+        headers = {"X-User-ID": user_id}
+        latencies = []
+        errors = []
+        started = time.perf_counter()
+        deadline = started + duration
+        url = f"{base_url}/tasks"
+        await asyncio.gather(
+            *(
+                worker(client, url, headers, deadline, latencies, errors)
+                for _ in range(connections)
+            )
+        )
+        elapsed = time.perf_counter() - started
+
+    if len(latencies) < 2:
+        return len(latencies) / elapsed, float("nan"), float("nan"), len(errors)
+    percentiles = statistics.quantiles(latencies, n=100)
+    return len(latencies) / elapsed, percentiles[49], percentiles[98], len(errors)
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("sync_url", nargs="?", default=os.getenv("SYNC_URL"))
+    parser.add_argument("async_url", nargs="?", default=os.getenv("ASYNC_URL"))
+    parser.add_argument("--duration", type=float, default=DURATION_SECONDS)
+    parser.add_argument("--connections", type=int, nargs="+", default=CONNECTIONS)
+    args = parser.parse_args()
+
+    servers = {"flask": args.sync_url, "asgi": args.async_url}
+    print(
+        f"{'server':8} {'conns':>6} {'req/s':>10} "
+        f"{'p50 ms':>9} {'p99 ms':>9} {'errors':>7}"
+    )
+    for connections in args.connections:
+        for name, base_url in servers.items():
+            if not base_url:
+                continue
+            throughput, p50, p99, errors = await run(
+                base_url.rstrip("/"), connections, args.duration
+            )
+            print(
+                f"{name:8} {connections:>6} {throughput:>10.1f} "
+                f"{p50:>9.1f} {p99:>9.1f} {errors:>7}"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,98 @@
+"""Benchmark: legacy unanchored $regex search vs text index and prefix search.
+
+Needs a MongoDB server. Seeds synthetic tasks into a throwaway database:
+    MONGO_URL=mongodb://localhost:27017 python benchmarks/bench_search.py
+"""
+
+import os
+import random
+import re
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from pymongo import MongoClient
+
+from mongo.indexes import migrate
+from mongo.models import Task, normalize_title
+
+SIZES = (10_000, 100_000)
+WORDS = (
+    "dentist gym milk groceries invoice report meeting call mom dad rent car "
+    "service laundry passport flight hotel birthday gift doctor review email"
+).split()
+QUERIES = ("dentist", "dent", "passport renewal", "rep")
+RUNS = 20
+
+
+def seed(task_model, user_id, size):
+    random.seed(size)
+    task_model.create_tasks(
+        [
+            {
+                "title": " ".join(random.sample(WORDS, 3)),
+                "note": " ".join(random.sample(WORDS, 6)),
+                "user_id": user_id,
+                "list_ids": ["bench"],
+            }
+            for _ in range(size)
+        ],
+        chunk_size=5000,
+    )
+
+
+def timed(fn):
+    samples = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - started) * 1000)
+    return statistics.median(samples)
+
+
+def docs_examined(collection, query):
+    plan = collection.find(query).explain()
+    return plan["executionStats"]["totalDocsExamined"]
+
+
+def main():
+    client = MongoClient(os.getenv("MONGO_URL", "mongodb://localhost:27017"))
+    db = client[os.getenv("BENCH_DATABASE_NAME", "todo_app_bench")]
+    db.tasks.drop()
+    migrate(db)
+    task_model = Task(db)
+    collection = task_model.collection
+
+    header = f"{'tasks':>8} {'query':18} {'mode':8} {'median ms':>10} {'examined':>14}"
+    print(header)
+    for size in SIZES:
+        user_id = str(ObjectId())
+        seed(task_model, user_id, size)
+        for term in QUERIES:
+            queries = {
+                "regex": {
+                    "user_id": user_id,
+                    "title": {"$regex": term, "$options": "i"},
+                },
+                "text": {"user_id": user_id, "$text": {"$search": term}},
+                "prefix": {
+                    "user_id": user_id,
+                    "title_lower": {"$regex": "^" + re.escape(normalize_title(term))},
+                },
+            }
+            for mode, query in queries.items():
+                median = timed(lambda: list(collection.find(query)))
+                examined = docs_examined(collection, query)
+                print(f"{size:>8} {term:18} {mode:8} {median:>10.2f} {examined:>14}")
+            median = timed(lambda: task_model.search_tasks(user_id, term))
+            print(f"{size:>8} {term:18} {'ranked':8} {median:>10.2f} {'-':>14}")
+
+    db.tasks.drop()
+    client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Micro-benchmark: validating a Telegram update from the raw body vs decoded JSON.
+
+Run from the backend directory:  python benchmarks/bench_validate.py
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils import parse_update
+
+UPDATE = {
+    "update_id": 123456789,
+    "message": {
+        "message_id": 42,
+        "from": {
+            "id": 1111,
+            "is_bot": False,
+            "first_name": "Ada",
+            "last_name": "Lovelace",
+            "language_code": "en",
+        },
+        "chat": {
+            "id": 1111,
+            "first_name": "Ada",
+            "last_name": "Lovelace",
+            "type": "private",
+        },
+        "date": 1717200000,
+        "text": "buy milk tomorrow and call the dentist on friday",
+    },
+}
+
+RAW = json.dumps(UPDATE).encode("utf-8")
+
+
+def decoded():
+    return parse_update(json.loads(RAW))
+
+
+def compiled():
+    return parse_update(RAW)
+
+
+def main(number=50000):
+    assert decoded() is not None and compiled() is not None
+    candidates = (("json.loads + parse_update", decoded), ("parse_update", compiled))
+    for name, fn in candidates:
+        seconds = min(timeit.repeat(fn, number=number, repeat=5))
+        print(f"{name:32s} {seconds / number * 1e6:8.2f} us/update")
+
+
+if __name__ == "__main__":
+    main()
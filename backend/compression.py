@@ -0,0 +1,208 @@
+import threading
+import time
+import zlib
+
+import zstandard
+
+# Content-Encoding values in order of preference
+ENCODINGS = ("zstd", "gzip")
+COMPRESSIBLE_MIMETYPES = {"application/json", "application/x-ndjson"}
+# Streamed bodies are compressed in blocks of at least this many bytes
+STREAM_BLOCK_BYTES = 16 * 1024
+
+
+def route_name(request):
+    """Stats key for a request: method and URL rule, never the raw path"""
+    rule = request.url_rule.rule if request.url_rule else "<unmatched>"
+    return f"{request.method} {rule}"
+
+
+class _RouteStats:
+    def __init__(self):
+        self.responses = {}
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.cpu_seconds = 0.0
+
+
+class _StreamEncoder:
+    """Incremental compression of one streamed body"""
+
+    def __init__(self, compressor, encoding, route):
+        self.compressor = compressor
+        self.encoding = encoding
+        self.route = route
+        self._zstd = None
+        if encoding == "zstd":
+            self._zstd = compressor._acquire_zstd()
+            self._compressobj = self._zstd.compressobj()
+            self._block_flush = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._compressobj = zlib.compressobj(
+                compressor.gzip_level, zlib.DEFLATED, 31
+            )
+            self._block_flush = zlib.Z_SYNC_FLUSH
+        self._pending = []
+        self._pending_size = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.cpu_seconds = 0.0
+
+    def _compress_pending(self, flush_mode=None):
+        started = time.thread_time()
+        out = self._compressobj.compress(b"".join(self._pending))
+        if flush_mode is None:
+            out += self._compressobj.flush()
+        else:
+            out += self._compressobj.flush(flush_mode)
+        self._pending = []
+        self._pending_size = 0
+        self.compressed_bytes += len(out)
+        self.cpu_seconds += time.thread_time() - started
+        return out
+
+    def feed(self, chunk):
+        """Buffer a chunk, returning a compressed block once enough is pending"""
+        self._pending.append(chunk)
+        self._pending_size += len(chunk)
+        self.raw_bytes += len(chunk)
+        if self._pending_size < STREAM_BLOCK_BYTES:
+            return b""
+        return self._compress_pending(self._block_flush)
+
+    def finish(self):
+        out = self._compress_pending()
+        self.compressor.record(
+            self.route,
+            self.encoding,
+            self.raw_bytes,
+            self.compressed_bytes,
+            self.cpu_seconds,
+        )
+        return out
+
+    def close(self):
+        if self._zstd is not None:
+            self.compressor._release_zstd(self._zstd)
+            self._zstd = None
+
+
+class ResponseCompressor:
+    """Compress JSON and NDJSON responses with zstd or gzip.
+
+    Buffered bodies under min_size go out as they are. Streamed bodies have no
+    known size, so they are always compressed, flushing a block whenever
+    STREAM_BLOCK_BYTES have accumulated so lines still reach the client
+    promptly. zstd contexts are pooled per thread and reused across responses.
+    """
+
+    def __init__(self, min_size=1024, zstd_level=3, gzip_level=6):
+        self.min_size = min_size
+        self.zstd_level = zstd_level
+        self.gzip_level = gzip_level
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    @staticmethod
+    def compressible(response):
+        """Whether the response body may be compressed at all"""
+        return (
+            response.mimetype in COMPRESSIBLE_MIMETYPES
+            and response.status_code >= 200
+            and response.status_code not in (204, 304)
+            and "Content-Encoding" not in response.headers
+        )
+
+    @staticmethod
+    def choose(accept_encodings):
+        """Pick a Content-Encoding from the request's Accept-Encoding, or None"""
+        return accept_encodings.best_match(ENCODINGS)
+
+    def _zstd_pool(self):
+        # A stream holds its context until it finishes, and several streams
+        # may interleave on one thread under asyncio, hence a pool
+        pool = getattr(self._local, "zstd", None)
+        if pool is None:
+            pool = self._local.zstd = []
+        return pool
+
+    def _acquire_zstd(self):
+        pool = self._zstd_pool()
+        if pool:
+            return pool.pop()
+        return zstandard.ZstdCompressor(level=self.zstd_level)
+
+    def _release_zstd(self, compressor):
+        self._zstd_pool().append(compressor)
+
+    def compress(self, body, encoding, route):
+        """Compress a buffered body"""
+        started = time.thread_time()
+        if encoding == "zstd":
+            compressor = self._acquire_zstd()
+            try:
+                compressed = compressor.compress(body)
+            finally:
+                self._release_zstd(compressor)
+        else:
+            compressobj = zlib.compressobj(self.gzip_level, zlib.DEFLATED, 31)
+            compressed = compressobj.compress(body) + compressobj.flush()
+        self.record(
+            route, encoding, len(body), len(compressed), time.thread_time() - started
+        )
+        return compressed
+
+    def stream(self, chunks, encoding, route):
+        """Compress an iterable of byte chunks"""
+        encoder = _StreamEncoder(self, encoding, route)
+        try:
+            for chunk in chunks:
+                out = encoder.feed(chunk)
+                if out:
+                    yield out
+            yield encoder.finish()
+        finally:
+            encoder.close()
+
+    async def astream(self, chunks, encoding, route):
+        """Compress an async iterable of byte chunks"""
+        encoder = _StreamEncoder(self, encoding, route)
+        try:
+            async for chunk in chunks:
+                out = encoder.feed(chunk)
+                if out:
+                    yield out
+            yield encoder.finish()
+        finally:
+            encoder.close()
+
+    def record(self, route, encoding, raw_bytes, compressed_bytes, cpu_seconds):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = _RouteStats()
+            stats.responses[encoding] = stats.responses.get(encoding, 0) + 1
+            stats.raw_bytes += raw_bytes
+            stats.compressed_bytes += compressed_bytes
+            stats.cpu_seconds += cpu_seconds
+
+    def stats(self):
+        """Per-route compressed responses, byte counts, ratio and CPU cost"""
+        with self._lock:
+            routes = {}
+            for route, stats in self._routes.items():
+                count = sum(stats.responses.values())
+                routes[route] = {
+                    "responses": dict(stats.responses),
+                    "rawBytes": stats.raw_bytes,
+                    "compressedBytes": stats.compressed_bytes,
+                    "ratio": (
+                        stats.raw_bytes / stats.compressed_bytes
+                        if stats.compressed_bytes
+                        else 0.0
+                    ),
+                    "cpuMs": stats.cpu_seconds * 1000,
+                    "avgCpuMs": stats.cpu_seconds / count * 1000 if count else 0.0,
+                }
+            return {"minSize": self.min_size, "routes": routes}
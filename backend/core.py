@@ -1,11 +1,114 @@
-from utils import validate_object, extract_text_from_object
-from ai_model import extract_activities
+from utils import TelegramUpdate, parse_update
+from ai_model import (
+    aextract_activities,
+    aextract_activities_batch,
+    extract_activities,
+    extract_activities_batch,
+)
+from extractors import ExtractionPipeline, extract_activities_fast
 
+# Trivial messages are parsed by rules, everything else goes to Gemini
+extraction_pipeline = ExtractionPipeline(
+    extract_activities,
+    pre_extractors=[extract_activities_fast],
+    async_fallback=aextract_activities,
+    batch_fallback=extract_activities_batch,
+    async_batch_fallback=aextract_activities_batch,
+)
 
-def inboundTelegramHandler(data):
-    if validate_object(data):
-        activity_desc_string = extract_text_from_object(data)
-        activities = extract_activities(activity_desc_string)
-        return activities
-    else:
-        return None
+
+def _parse_updates(updates):
+    return [
+        data if isinstance(data, TelegramUpdate) else parse_update(data)
+        for data in updates
+    ]
+
+
+def inboundTelegramHandler(data, data_handler=None):
+    return inboundTelegramBatchHandler([data], data_handler)[0]
+
+
+def inboundTelegramBatchHandler(updates, data_handler=None):
+    """inboundTelegramHandler for a burst of updates, returning a result per
+    update; messages the rules cannot parse go to Gemini in one parallel batch"""
+    updates = _parse_updates(updates)
+    results = [None] * len(updates)
+    claimed = []
+    for index, update in enumerate(updates):
+        if update is None:
+            continue
+        # Telegram redelivers updates; only the delivery that claims the
+        # update extracts it, the others get the stored result
+        if data_handler is not None and not data_handler.claim_telegram_update(
+            update.update_id
+        ):
+            results[index] = data_handler.get_telegram_update_result(update.update_id)
+            continue
+        claimed.append(index)
+
+    try:
+        extracted = extraction_pipeline.extract_batch(
+            [updates[index].text for index in claimed]
+        )
+    except Exception:
+        # Don't leave the updates claimed until the claim times out
+        if data_handler is not None:
+            for index in claimed:
+                data_handler.release_telegram_update(updates[index].update_id)
+        raise
+    for index, activities in zip(claimed, extracted):
+        results[index] = activities
+        if data_handler is None:
+            continue
+        if activities.get("error"):
+            # Let a redelivery retry rather than replay the failure
+            data_handler.release_telegram_update(updates[index].update_id)
+        else:
+            data_handler.save_telegram_update_result(
+                updates[index].update_id, activities
+            )
+    return results
+
+
+async def ainboundTelegramHandler(data, data_handler=None):
+    """inboundTelegramHandler for asyncio servers, with an AsyncDataHandler"""
+    return (await ainboundTelegramBatchHandler([data], data_handler))[0]
+
+
+async def ainboundTelegramBatchHandler(updates, data_handler=None):
+    """inboundTelegramBatchHandler for asyncio servers, with an AsyncDataHandler"""
+    updates = _parse_updates(updates)
+    results = [None] * len(updates)
+    claimed = []
+    for index, update in enumerate(updates):
+        if update is None:
+            continue
+        if data_handler is not None and not await data_handler.claim_telegram_update(
+            update.update_id
+        ):
+            results[index] = await data_handler.get_telegram_update_result(
+                update.update_id
+            )
+            continue
+        claimed.append(index)
+
+    try:
+        extracted = await extraction_pipeline.aextract_batch(
+            [updates[index].text for index in claimed]
+        )
+    except Exception:
+        if data_handler is not None:
+            for index in claimed:
+                await data_handler.release_telegram_update(updates[index].update_id)
+        raise
+    for index, activities in zip(claimed, extracted):
+        results[index] = activities
+        if data_handler is None:
+            continue
+        if activities.get("error"):
+            await data_handler.release_telegram_update(updates[index].update_id)
+        else:
+            await data_handler.save_telegram_update_result(
+                updates[index].update_id, activities
+            )
+    return results
@@ -0,0 +1,124 @@
+import copy
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from cache import LRUTTLCache
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_message(message):
+    """Collapse whitespace and case so that trivially different phrasings share a key"""
+    return _WHITESPACE.sub(" ", message).strip().lower()
+
+
+class ExtractionCache:
+    """Cache of extraction results keyed on the normalized message and the
+    reference date the prompt was rendered with.
+
+    Lookups go to an in-memory LRU+TTL tier first and, when db_path is set,
+    fall back to a SQLite tier that survives restarts. Expired SQLite rows are
+    deleted by set() at most once every sweep_interval seconds. Results are
+    copied in and out, so callers never share a cached object.
+    """
+
+    def __init__(self, maxsize=5000, ttl=86400, db_path=None, sweep_interval=3600):
+        self.ttl = ttl
+        self.memory = LRUTTLCache(maxsize=maxsize, ttl=ttl)
+        self.disk_hits = 0
+        self.swept = 0
+        self.sweep_interval = sweep_interval
+        self._last_sweep = time.time()
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            self._conn = sqlite3.connect(db_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS extractions_created_at "
+                "ON extractions (created_at)"
+            )
+            self._conn.commit()
+            # Rows left behind by earlier runs
+            self._sweep()
+
+    @staticmethod
+    def make_key(message, reference_date):
+        return f"{reference_date.isoformat()}|{normalize_message(message)}"
+
+    def get(self, message, reference_date):
+        """Return the cached result or None"""
+        key = self.make_key(message, reference_date)
+        result = self.memory.get(key)
+        if result is not None or self._conn is None:
+            return copy.deepcopy(result)
+
+        try:
+            with self._lock:
+                row = self._conn.execute(
+                    "SELECT result, created_at FROM extractions WHERE key = ?", (key,)
+                ).fetchone()
+        except sqlite3.Error as e:
+            print(f"Error reading extraction cache: {e}")
+            return None
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+
+        result = json.loads(row[0])
+        with self._lock:
+            self.disk_hits += 1
+        self.memory.set(key, copy.deepcopy(result))
+        return result
+
+    def set(self, message, reference_date, result):
+        key = self.make_key(message, reference_date)
+        self.memory.set(key, copy.deepcopy(result))
+        if self._conn is None:
+            return
+        try:
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO extractions (key, result, created_at) "
+                    "VALUES (?, ?, ?)",
+                    (key, json.dumps(result), time.time()),
+                )
+                self._conn.commit()
+        except sqlite3.Error as e:
+            print(f"Error writing extraction cache: {e}")
+        if time.time() - self._last_sweep >= self.sweep_interval:
+            self._sweep()
+
+    def _sweep(self):
+        """Delete SQLite rows past the TTL"""
+        try:
+            with self._lock:
+                self._last_sweep = time.time()
+                deleted = self._conn.execute(
+                    "DELETE FROM extractions WHERE created_at < ?",
+                    (self._last_sweep - self.ttl,),
+                ).rowcount
+                self._conn.commit()
+                self.swept += deleted
+        except sqlite3.Error as e:
+            print(f"Error sweeping extraction cache: {e}")
+
+    def stats(self):
+        """Return per-tier and overall hit counters"""
+        memory = self.memory.stats()
+        lookups = memory["hits"] + memory["misses"]
+        hits = memory["hits"] + self.disk_hits
+        return {
+            "memory": memory,
+            "diskEnabled": self._conn is not None,
+            "diskHits": self.disk_hits,
+            "diskSwept": self.swept,
+            "hits": hits,
+            "misses": lookups - hits,
+            "hitRate": hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,302 @@
+import re
+import threading
+from datetime import date, datetime, timedelta
+
+DATE_FORMAT = "%d-%m-%y"
+
+WEEKDAYS = [
+    "monday",
+    "tuesday",
+    "wednesday",
+    "thursday",
+    "friday",
+    "saturday",
+    "sunday",
+]
+
+# Leading phrases that carry no activity information
+_FILLER = re.compile(
+    r"^(?:(?:please|pls|i\s+(?:need|have|want)\s+to|i\s+must|i\s+should|"
+    r"remind\s+me\s+to|don'?t\s+forget\s+to|remember\s+to|need\s+to|have\s+to)\s+)+"
+)
+# Verbs the LLM prompt asks us to drop ("activity name only, not the verb")
+_VERB = re.compile(
+    r"^(?:buy|get|grab|call|ring|phone|pay|book|visit|meet|email|text|message|"
+    r"clean|fix|finish|submit|send|watch|read|attend|go\s+to|pick\s+up|drop\s+off)\s+"
+)
+# Negated or cancelled plans need the LLM, not a new task
+_NEGATION = re.compile(r"\b(?:no|not|don'?t|never|cancel|skip)\b")
+_ARTICLE = re.compile(r"^(?:the|a|an|my|some)\s+")
+# Chit-chat the LLM prompt answers with no activities at all
+_STOP_LIST = frozenset(
+    [
+        "hi",
+        "hi there",
+        "hello",
+        "hello there",
+        "hey",
+        "hey there",
+        "yo",
+        "sup",
+        "what's up",
+        "whats up",
+        "good morning",
+        "good afternoon",
+        "good evening",
+        "good night",
+        "how are you",
+        "thanks",
+        "thank you",
+        "thx",
+        "ty",
+        "ok",
+        "okay",
+        "k",
+        "kk",
+        "cool",
+        "nice",
+        "great",
+        "sure",
+        "yes",
+        "yeah",
+        "yep",
+        "no",
+        "nope",
+        "lol",
+        "haha",
+        "bye",
+        "see you",
+    ]
+)
+
+_RELATIVE_DATES = [
+    (re.compile(r"\b(?:on\s+)?day\s+after\s+tomorrow\b"), 2),
+    (re.compile(r"\b(?:on\s+)?(?:tomorrow|tmrw|tmr)\b"), 1),
+    (re.compile(r"\b(?:today|tonight|this\s+evening|this\s+morning)\b"), 0),
+]
+_IN_DAYS = re.compile(r"\bin\s+(\d{1,2})\s+days?\b")
+_WEEKDAY = re.compile(r"\b(?:on\s+)?(this\s+|next\s+)?(" + "|".join(WEEKDAYS) + r")\b")
+_DAY_MONTH = r"(\d{1,2})[-/](\d{1,2})(?:[-/](\d{2}|\d{4}))?"
+# Only after "on" or at the very end, so quantities, ranges and decimals such
+# as "2.5 kg" or "1-2 chapters" are not mistaken for dates
+_ABSOLUTE_DATE = re.compile(
+    rf"\bon\s+{_DAY_MONTH}(?![\d./-])|(?<![\d./-])\b{_DAY_MONTH}$"
+)
+_TIME = re.compile(
+    r"\b(?:at\s+)?\d{1,2}(?::\d{2})?\s*(?:am|pm)\b|\bat\s+\d{1,2}:\d{2}\b"
+)
+
+# Anything that hints at more than one activity or at free-form prose
+_COMPOUND = re.compile(r"\band\b|\bthen\b|\balso\b|[,;&?!\n]|\bor\b")
+_ACTIVITY = re.compile(r"^[a-z0-9][a-z0-9' ]*$")
+# Leftover prepositions mean there is context the rules would mangle
+_PREPOSITION = re.compile(r"\b(?:at|with|for|to|from|in|on|by|before|after|until)\b")
+
+MAX_MESSAGE_LENGTH = 60
+MAX_ACTIVITY_WORDS = 3
+
+
+def _extract_date(text, today):
+    """Find and remove one date expression, returning (remaining text, date).
+
+    The date is None when the text has no date expression, and ValueError is
+    raised for one that is not a calendar date, such as 31-02.
+    """
+    for pattern, offset in _RELATIVE_DATES:
+        match = pattern.search(text)
+        if match:
+            return _remove(text, match), today + timedelta(days=offset)
+
+    match = _IN_DAYS.search(text)
+    if match:
+        return _remove(text, match), today + timedelta(days=int(match.group(1)))
+
+    match = _WEEKDAY.search(text)
+    if match:
+        days_ahead = (WEEKDAYS.index(match.group(2)) - today.weekday()) % 7
+        if days_ahead == 0 or (match.group(1) or "").startswith("next"):
+            days_ahead += 7
+        return _remove(text, match), today + timedelta(days=days_ahead)
+
+    match = _ABSOLUTE_DATE.search(text)
+    if match:
+        # The pattern has one set of groups per alternative
+        day, month, year = match.groups()[:3] if match.group(1) else match.groups()[3:]
+        if year is None:
+            activity_date = date(today.year, int(month), int(day))
+            # A bare dd-mm that has already passed means next year
+            if activity_date < today:
+                activity_date = date(today.year + 1, int(month), int(day))
+            return _remove(text, match), activity_date
+        if len(year) == 2:
+            year = 2000 + int(year)
+        return _remove(text, match), date(int(year), int(month), int(day))
+
+    return text, None
+
+
+def _remove(text, match):
+    return (text[: match.start()] + " " + text[match.end() :]).strip()
+
+
+def extract_activities_fast(message, today=None):
+    """
+    Deterministically extracts a single activity from short, simple messages.
+
+    Args:
+        message: The input message containing activities.
+        today: Reference date, defaults to the current date.
+
+    Returns:
+        The same {"activities": [...]} shape as ai_model.extract_activities,
+        or None when the message is not simple enough to parse confidently.
+        Only messages with a known action verb or an explicit date are
+        answered here; anything else may be chit-chat and goes to the LLM.
+    """
+    today = today or datetime.now().date()
+    text = " ".join(message.lower().split())
+    if (
+        not text
+        or len(text) > MAX_MESSAGE_LENGTH
+        or _COMPOUND.search(text)
+        or text in _STOP_LIST
+    ):
+        return None
+
+    text = _TIME.sub(" ", text).strip()
+    try:
+        text, activity_date = _extract_date(text, today)
+    except ValueError:
+        return None
+
+    text = _FILLER.sub("", text)
+    if _NEGATION.search(text):
+        return None
+    has_verb = _VERB.match(text) is not None
+    if activity_date is None:
+        if not has_verb:
+            return None
+        # Same default as the LLM prompt: no date means the next day
+        activity_date = today + timedelta(days=1)
+
+    text = _VERB.sub("", text)
+    text = _ARTICLE.sub("", text)
+    activity = " ".join(text.split())
+
+    if (
+        not _ACTIVITY.match(activity)
+        or activity in _STOP_LIST
+        or len(activity.split()) > MAX_ACTIVITY_WORDS
+        or _PREPOSITION.search(activity)
+    ):
+        return None
+
+    return {
+        "activities": [
+            {"activity": activity, "date": activity_date.strftime(DATE_FORMAT)}
+        ]
+    }
+
+
+class ExtractionPipeline:
+    """Runs cheap pre-extractors before falling back to the LLM extractor.
+
+    Each pre-extractor takes the message and returns an extraction result, or
+    None when it is not confident enough to answer on its own. async_fallback
+    is the coroutine counterpart of fallback used by aextract(); batch_fallback
+    and async_batch_fallback take a list of messages and return a result per
+    message, for extract_batch() and aextract_batch().
+    """
+
+    def __init__(
+        self,
+        fallback,
+        pre_extractors=None,
+        async_fallback=None,
+        batch_fallback=None,
+        async_batch_fallback=None,
+    ):
+        self.fallback = fallback
+        self.async_fallback = async_fallback
+        self.batch_fallback = batch_fallback
+        self.async_batch_fallback = async_batch_fallback
+        self.pre_extractors = list(pre_extractors or [])
+        self._lock = threading.Lock()
+        self.counters = {"fallback": 0}
+
+    def register(self, pre_extractor):
+        self.pre_extractors.append(pre_extractor)
+
+    def _count(self, path, calls=1):
+        with self._lock:
+            self.counters[path] = self.counters.get(path, 0) + calls
+
+    def _pre_extract(self, message):
+        for pre_extractor in self.pre_extractors:
+            try:
+                result = pre_extractor(message)
+            except Exception as e:
+                print(f"Error in pre-extractor {pre_extractor.__name__}: {e}")
+                continue
+            if result is not None:
+                self._count(pre_extractor.__name__)
+                return result
+        return None
+
+    def extract(self, message):
+        result = self._pre_extract(message)
+        if result is not None:
+            return result
+
+        self._count("fallback")
+        return self.fallback(message)
+
+    async def aextract(self, message):
+        """extract() for asyncio servers; pre-extractors are cheap and run inline"""
+        result = self._pre_extract(message)
+        if result is not None:
+            return result
+
+        self._count("fallback")
+        return await self.async_fallback(message)
+
+    def _pre_extract_batch(self, messages):
+        """Return the pre-extracted results, None where the fallback is needed,
+        and the indexes of those messages"""
+        results = [self._pre_extract(message) for message in messages]
+        rest = [index for index, result in enumerate(results) if result is None]
+        self._count("fallback", len(rest))
+        return results, rest
+
+    def extract_batch(self, messages):
+        """extract() for several messages, sending every message the
+        pre-extractors cannot answer to batch_fallback in a single call"""
+        results, rest = self._pre_extract_batch(messages)
+        if rest:
+            fallback = self.batch_fallback([messages[index] for index in rest])
+            for index, result in zip(rest, fallback):
+                results[index] = result
+        return results
+
+    async def aextract_batch(self, messages):
+        """extract_batch() for asyncio servers"""
+        results, rest = self._pre_extract_batch(messages)
+        if rest:
+            fallback = await self.async_batch_fallback(
+                [messages[index] for index in rest]
+            )
+            for index, result in zip(rest, fallback):
+                results[index] = result
+        return results
+
+    def stats(self):
+        """Return per-path counters and the share of calls that skipped the LLM"""
+        with self._lock:
+            counters = dict(self.counters)
+        total = sum(counters.values())
+        saved = total - counters["fallback"]
+        return {
+            "paths": counters,
+            "fallbackCallsSaved": saved,
+            "savedRate": saved / total if total else 0.0,
+        }
@@ -0,0 +1,299 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def trigrams(text):
+    """Set of character trigrams of the normalized text, padded at the edges"""
+    padded = f"  {' '.join(str(text or '').lower().split())}  "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class UserTrigramIndex:
+    """Trigram inverted index over one user's task titles.
+
+    Postings are int32 arrays of slots, scored with NumPy. Additions are
+    buffered and merged into the arrays lazily; deletions only clear the
+    slot's alive flag until dead slots dominate and the index is rebuilt.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        # Callers hold self.lock across a rebuild, so it must survive this
+        self._task_ids = []
+        self._titles = []
+        self._slots = {}
+        self._gram_counts = []
+        self._alive = []
+        self._postings = {}
+        self._pending = {}
+        self._dirty = False
+        self._gram_count_array = np.zeros(0, dtype=np.int32)
+        self._alive_array = np.zeros(0, dtype=bool)
+        self._postings_bytes = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def add(self, task_id, title):
+        if task_id in self._slots:
+            self.remove(task_id)
+        slot = len(self._task_ids)
+        grams = trigrams(title)
+        self._task_ids.append(task_id)
+        self._titles.append(title)
+        self._slots[task_id] = slot
+        self._gram_counts.append(len(grams))
+        self._alive.append(True)
+        for gram in grams:
+            self._pending.setdefault(gram, []).append(slot)
+        self._dirty = True
+
+    def remove(self, task_id):
+        slot = self._slots.pop(task_id, None)
+        if slot is not None:
+            self._alive[slot] = False
+            self._dirty = True
+
+    def _compact(self):
+        if not self._dirty:
+            return
+        if len(self._slots) * 2 < len(self._task_ids):
+            # Mostly dead slots, rebuild from the live entries
+            live = [
+                (task_id, self._titles[slot]) for task_id, slot in self._slots.items()
+            ]
+            self._reset()
+            for task_id, title in live:
+                self.add(task_id, title)
+        for gram, slots in self._pending.items():
+            new = np.asarray(slots, dtype=np.int32)
+            current = self._postings.get(gram)
+            self._postings[gram] = (
+                new if current is None else np.concatenate([current, new])
+            )
+            self._postings_bytes += new.nbytes
+        self._pending = {}
+        self._gram_count_array = np.asarray(self._gram_counts, dtype=np.int32)
+        self._alive_array = np.asarray(self._alive, dtype=bool)
+        self._dirty = False
+
+    def search(self, query, limit=50, threshold=0.5):
+        """Return [(task_id, score)] best first.
+
+        score is the share of the query's trigrams found in the title, so
+        "dentst" still matches "dentist appointment"; ties are broken by
+        Jaccard similarity, which prefers titles close to the query length.
+        """
+        self._compact()
+        grams = trigrams(query)
+        postings = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not postings:
+            return []
+
+        counts = np.bincount(np.concatenate(postings), minlength=len(self._task_ids))
+        containment = counts / len(grams)
+        jaccard = counts / (len(grams) + self._gram_count_array - counts)
+        containment[~self._alive_array] = 0
+
+        candidates = np.flatnonzero(containment >= threshold)
+        order = np.lexsort((-jaccard[candidates], -containment[candidates]))
+        return [
+            (self._task_ids[slot], float(containment[slot]))
+            for slot in candidates[order[:limit]]
+        ]
+
+    def nbytes(self):
+        """Approximate memory held by the index, in constant time"""
+        # Rough per-entry overhead of the Python side tables
+        return (
+            self._postings_bytes + 200 * len(self._task_ids) + 100 * len(self._postings)
+        )
+
+
+class FuzzySearchIndex:
+    """Per-user trigram indexes, built lazily from a loader and evicted LRU
+    once their combined size exceeds max_bytes.
+
+    loader(user_id) must return an iterable of (task_id, title) pairs; asearch()
+    takes a coroutine function instead, for titles loaded by an async driver.
+    Saves and deletes that arrive while a user's titles are being loaded are
+    buffered and replayed on the new index, so it never misses them.
+    """
+
+    def __init__(self, loader, max_bytes=64 * 1024 * 1024):
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self._indexes = OrderedDict()
+        # {user_id: bytes of the index when last sized}, summed in self._bytes
+        self._sizes = {}
+        self._bytes = 0
+        # {user_id: {"builders": n, "writes": [(task_id, title or None)],
+        # "stale": bool}} for users whose titles are being loaded
+        self._builds = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.builds = 0
+        self.evictions = 0
+
+    def _get(self, user_id):
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+                self.hits += 1
+            return index
+
+    def _begin_build(self, user_id):
+        """Start buffering the user's writes, before their titles are loaded"""
+        with self._lock:
+            build = self._builds.setdefault(
+                user_id, {"builders": 0, "writes": [], "stale": False}
+            )
+            build["builders"] += 1
+
+    def _end_build(self, user_id):
+        """Return the buffered (writes, stale); the caller holds self._lock"""
+        build = self._builds[user_id]
+        build["builders"] -= 1
+        if not build["builders"]:
+            del self._builds[user_id]
+        return list(build["writes"]), build["stale"]
+
+    def _cancel_build(self, user_id):
+        with self._lock:
+            self._end_build(user_id)
+
+    def _build(self, user_id, titles):
+        """Index titles for a build started with _begin_build()"""
+        index = UserTrigramIndex()
+        try:
+            for task_id, title in titles:
+                index.add(task_id, title)
+        except Exception:
+            self._cancel_build(user_id)
+            raise
+        with self._lock:
+            writes, stale = self._end_build(user_id)
+            # Writes that raced with loading, in order, so the last one wins
+            for task_id, title in writes:
+                if title is None:
+                    index.remove(task_id)
+                else:
+                    index.add(task_id, title)
+            if stale:
+                # invalidate() ran meanwhile, the titles may predate it; answer
+                # this search but leave the next one to rebuild
+                return index
+            # Another thread may have built it meanwhile, keep the first one
+            registered = self._indexes.setdefault(user_id, index)
+            self._indexes.move_to_end(user_id)
+            self.builds += 1
+            self._resize(user_id, registered)
+        self._evict()
+        return registered
+
+    def _resize(self, user_id, index):
+        """Update the running byte total; the caller holds self._lock"""
+        if self._indexes.get(user_id) is not index:
+            return
+        size = index.nbytes()
+        self._bytes += size - self._sizes.get(user_id, 0)
+        self._sizes[user_id] = size
+
+    def _changed(self, user_id, index):
+        """Account for an index that grew or shrank and evict if over budget"""
+        with self._lock:
+            self._resize(user_id, index)
+        self._evict()
+
+    def _evict(self):
+        with self._lock:
+            while self._bytes > self.max_bytes and len(self._indexes) > 1:
+                user_id, _ = self._indexes.popitem(last=False)
+                self._bytes -= self._sizes.pop(user_id, 0)
+                self.evictions += 1
+
+    def _search(self, user_id, index, query, limit):
+        with index.lock:
+            matches = index.search(query, limit)
+        # Searching merges buffered additions, which can grow the index
+        self._changed(user_id, index)
+        return matches
+
+    def search(self, user_id, query, limit=50):
+        """Search the user's index, building it from the loader if needed"""
+        index = self._get(user_id)
+        if index is None:
+            self._begin_build(user_id)
+            try:
+                titles = self.loader(user_id)
+            except Exception:
+                self._cancel_build(user_id)
+                raise
+            index = self._build(user_id, titles)
+        return self._search(user_id, index, query, limit)
+
+    async def asearch(self, user_id, query, limit=50, load=None):
+        """search() building the index from a coroutine function load(user_id)"""
+        index = self._get(user_id)
+        if index is None:
+            self._begin_build(user_id)
+            try:
+                titles = await load(user_id)
+            except BaseException:
+                # Including cancellation, or the build would stay open
+                self._cancel_build(user_id)
+                raise
+            index = self._build(user_id, titles)
+        return self._search(user_id, index, query, limit)
+
+    def _buffer(self, user_id, task_id, title):
+        """Return the user's index, or buffer the write for a build in progress"""
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if index is not None:
+                self._indexes.move_to_end(user_id)
+                self.hits += 1
+            elif user_id in self._builds:
+                self._builds[user_id]["writes"].append((task_id, title))
+            return index
+
+    def on_task_saved(self, user_id, task_id, title):
+        """Index a created or retitled task if the user's index is loaded or
+        being built"""
+        index = self._buffer(user_id, task_id, title)
+        if index is not None:
+            with index.lock:
+                index.add(task_id, title)
+            self._changed(user_id, index)
+
+    def on_task_deleted(self, user_id, task_id):
+        index = self._buffer(user_id, task_id, None)
+        if index is not None:
+            with index.lock:
+                index.remove(task_id)
+            self._changed(user_id, index)
+
+    def invalidate(self, user_id):
+        """Drop the user's index, e.g. after a bulk change; it is rebuilt on demand"""
+        with self._lock:
+            self._indexes.pop(user_id, None)
+            self._bytes -= self._sizes.pop(user_id, 0)
+            if user_id in self._builds:
+                self._builds[user_id]["stale"] = True
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._indexes),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "builds": self.builds,
+                "evictions": self.evictions,
+            }
@@ -0,0 +1,179 @@
+import asyncio
+import queue
+import threading
+import time
+
+
+class IngestQueue:
+    """Bounded in-process queue drained by a pool of worker threads.
+
+    submit() never blocks: when the queue is full the item is rejected so
+    the caller can push back (e.g. answer 503 and let the sender retry).
+
+    With batch_size > 1 a worker takes whatever is queued, up to batch_size
+    items, and passes them to handler as one list, so bursts can be handled
+    together.
+    """
+
+    def __init__(self, handler, workers=4, maxsize=1000, name="ingest", batch_size=1):
+        self.handler = handler
+        self.workers = workers
+        self.name = name
+        self.batch_size = batch_size
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._lock = threading.Lock()
+        self._threads = []
+        self.submitted = 0
+        self.rejected = 0
+        self.processed = 0
+        self.batches = 0
+        self.failed = 0
+        self._total_wait = 0.0
+        self._total_processing = 0.0
+        self._max_processing = 0.0
+
+    def start(self):
+        for index in range(self.workers - len(self._threads)):
+            thread = threading.Thread(
+                target=self._work, name=f"{self.name}-{index}", daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, item):
+        """Enqueue item for processing, returning False if the queue is full"""
+        try:
+            self._queue.put_nowait((time.monotonic(), item))
+        except queue.Full:
+            with self._lock:
+                self.rejected += 1
+            return False
+        with self._lock:
+            self.submitted += 1
+        return True
+
+    def join(self):
+        """Block until every queued item has been processed"""
+        self._queue.join()
+
+    def _items(self, entries):
+        """What the handler is called with for a batch of queue entries"""
+        items = [item for _, item in entries]
+        return items if self.batch_size > 1 else items[0]
+
+    def _record(self, entries, started_at, failed):
+        processing = time.monotonic() - started_at
+        with self._lock:
+            self.processed += len(entries)
+            self.batches += 1
+            self.failed += failed * len(entries)
+            self._total_wait += sum(started_at - queued_at for queued_at, _ in entries)
+            # Every item in the batch waited for the whole batch
+            self._total_processing += processing * len(entries)
+            self._max_processing = max(self._max_processing, processing)
+
+    def _next_batch(self):
+        entries = [self._queue.get()]
+        while len(entries) < self.batch_size:
+            try:
+                entries.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return entries
+
+    def _work(self):
+        while True:
+            entries = self._next_batch()
+            started_at = time.monotonic()
+            failed = False
+            try:
+                self.handler(self._items(entries))
+            except Exception as e:
+                failed = True
+                print(f"Error processing {self.name} item: {e}")
+            finally:
+                self._record(entries, started_at, failed)
+                for _ in entries:
+                    self._queue.task_done()
+
+    def stats(self):
+        """Return queue depth, throughput counters and latency in milliseconds"""
+        with self._lock:
+            processed = self.processed
+            return {
+                "depth": self._queue.qsize(),
+                "maxDepth": self._queue.maxsize,
+                "workers": len(self._threads),
+                "submitted": self.submitted,
+                "rejected": self.rejected,
+                "processed": processed,
+                "avgBatchSize": processed / self.batches if self.batches else 0.0,
+                "failed": self.failed,
+                "avgWaitMs": self._total_wait / processed * 1000 if processed else 0.0,
+                "avgProcessingMs": (
+                    self._total_processing / processed * 1000 if processed else 0.0
+                ),
+                "maxProcessingMs": self._max_processing * 1000,
+            }
+
+
+class AsyncIngestQueue(IngestQueue):
+    """IngestQueue for asyncio servers: a bounded asyncio.Queue drained by
+    worker tasks running a coroutine handler on the event loop.
+
+    start() must be called from the running loop, e.g. at server startup.
+    """
+
+    def __init__(self, handler, workers=4, maxsize=1000, name="ingest", batch_size=1):
+        super().__init__(handler, workers, maxsize, name, batch_size)
+        self._queue = asyncio.Queue(maxsize=maxsize)
+
+    def start(self):
+        for index in range(self.workers - len(self._threads)):
+            self._threads.append(
+                asyncio.create_task(self._work(), name=f"{self.name}-{index}")
+            )
+
+    def submit(self, item):
+        """Enqueue item for processing, returning False if the queue is full"""
+        try:
+            self._queue.put_nowait((time.monotonic(), item))
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.submitted += 1
+        return True
+
+    async def join(self):
+        """Wait until every queued item has been processed"""
+        await self._queue.join()
+
+    async def stop(self):
+        for task in self._threads:
+            task.cancel()
+        await asyncio.gather(*self._threads, return_exceptions=True)
+        self._threads = []
+
+    async def _next_batch(self):
+        entries = [await self._queue.get()]
+        while len(entries) < self.batch_size:
+            try:
+                entries.append(self._queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        return entries
+
+    async def _work(self):
+        while True:
+            entries = await self._next_batch()
+            started_at = time.monotonic()
+            failed = False
+            try:
+                await self.handler(self._items(entries))
+            except Exception as e:
+                failed = True
+                print(f"Error processing {self.name} item: {e}")
+            finally:
+                self._record(entries, started_at, failed)
+                for _ in entries:
+                    self._queue.task_done()
@@ -0,0 +1,730 @@
+import asyncio
+from datetime import datetime
+from bson import ObjectId
+import bcrypt
+from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from .models import (
+    BULK_CHUNK_SIZE,
+    DEFAULT_LISTS,
+    DataVersion,
+    SEARCH_RESULT_LIMIT,
+    STREAM_BATCH_SIZE,
+    Task,
+    TaskList,
+    TelegramUpdateLog,
+    User,
+    to_stats,
+)
+from .pagination import (
+    DEFAULT_SORT,
+    apply_cursor,
+    build_projection,
+    is_paginated,
+    sort_spec,
+)
+
+# Async counterparts of the models in models.py for a pymongo AsyncDatabase.
+# Query building and document normalization are inherited, only the I/O
+# methods are redefined as coroutines.
+
+
+class AsyncDataVersion(DataVersion):
+    async def current(self, user_id):
+        """Opaque version token for the user's tasks and lists, None on error"""
+        try:
+            doc = await self.collection.find_one({"_id": user_id})
+            if doc is None:
+                doc = await self.collection.find_one_and_update(
+                    {"_id": user_id},
+                    {"$setOnInsert": {"version": 0, "epoch": str(ObjectId())}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            return self._token(doc)
+        except Exception as e:
+            print(f"Error getting data version: {e}")
+            return None
+
+    async def bump(self, user_id):
+        try:
+            await self.collection.update_one(
+                {"_id": user_id},
+                {
+                    "$inc": {"version": 1},
+                    "$setOnInsert": {"epoch": str(ObjectId())},
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Error bumping data version: {e}")
+
+
+class AsyncUser(User):
+    async def create_user(self, email, password, name=None):
+        """Create a new user with hashed password"""
+        try:
+            # bcrypt is deliberately slow, keep it off the event loop
+            hashed_password = await asyncio.to_thread(
+                bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt()
+            )
+
+            user_data = {
+                "email": email.lower().strip(),
+                "password": hashed_password,
+                "name": name or email.split("@")[0],
+                "created_at": datetime.utcnow(),
+                "updated_at": datetime.utcnow(),
+            }
+
+            result = await self.collection.insert_one(user_data)
+            return str(result.inserted_id)
+        except Exception as e:
+            print(f"Error creating user: {e}")
+            return None
+
+    async def authenticate_user(self, email, password):
+        """Authenticate user with email and password"""
+        try:
+            user = await self.collection.find_one({"email": email.lower().strip()})
+            if user and await asyncio.to_thread(
+                bcrypt.checkpw, password.encode("utf-8"), user["password"]
+            ):
+                return str(user["_id"])
+            return None
+        except Exception as e:
+            print(f"Error authenticating user: {e}")
+            return None
+
+    async def get_user_by_id(self, user_id):
+        """Get user by ID"""
+        try:
+            user = await self.collection.find_one({"_id": ObjectId(user_id)})
+            if user:
+                user.pop("password", None)
+                return user
+            return None
+        except Exception as e:
+            print(f"Error getting user: {e}")
+            return None
+
+    async def get_user_by_email(self, email):
+        """Get user by email (without password)"""
+        try:
+            user = await self.collection.find_one({"email": email.lower().strip()})
+            if user:
+                user.pop("password", None)
+                return user
+            return None
+        except Exception as e:
+            print(f"Error getting user by email: {e}")
+            return None
+
+
+class AsyncTask(Task):
+    version_class = AsyncDataVersion
+
+    async def create_task(self, task_data):
+        """Create a new task with user_id"""
+        try:
+            result = await self.collection.insert_one(self._prepare_task(task_data))
+            await self.versions.bump(task_data.get("user_id"))
+            return str(result.inserted_id)
+        except Exception as e:
+            print(f"Error creating task: {e}")
+            return None
+
+    async def create_tasks(self, tasks_data, chunk_size=BULK_CHUNK_SIZE):
+        """Insert many tasks in unordered insert_many chunks"""
+        results = []
+        for start in range(0, len(tasks_data), chunk_size):
+            chunk = [
+                self._prepare_task(dict(task_data, _id=ObjectId()))
+                for task_data in tasks_data[start : start + chunk_size]
+            ]
+            chunk_results = [{"taskId": str(task["_id"])} for task in chunk]
+            try:
+                await self.collection.insert_many(chunk, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    chunk_results[error["index"]] = {"error": error["errmsg"]}
+            except Exception as e:
+                print(f"Error creating tasks: {e}")
+                chunk_results = [{"error": str(e)} for _ in chunk]
+            results.extend(chunk_results)
+        for user_id in self._created_user_ids(tasks_data, results):
+            await self.versions.bump(user_id)
+        return results
+
+    async def _find_tasks(
+        self, query, limit=None, after=None, sort=None, fields=None, stream=False
+    ):
+        """Run a task query with optional keyset pagination and field projection.
+
+        With stream=True an async generator is returned that normalizes
+        documents as the cursor fetches them.
+        """
+        projection = build_projection(fields, sort or DEFAULT_SORT)
+        if is_paginated(limit, after, sort):
+            sort = sort or DEFAULT_SORT
+            cursor = self.collection.find(
+                apply_cursor(query, sort, after), projection
+            ).sort(sort_spec(sort))
+            if limit:
+                cursor = cursor.limit(limit)
+        else:
+            cursor = self.collection.find(query, projection)
+        fill_lists = not fields or "list_ids" in fields
+        if stream:
+            cursor = cursor.batch_size(STREAM_BATCH_SIZE)
+            return (self._normalize_task(task, fill_lists) async for task in cursor)
+        return [self._normalize_task(task, fill_lists) async for task in cursor]
+
+    async def get_tasks(
+        self,
+        user_id,
+        list_id=None,
+        limit=None,
+        after=None,
+        sort=None,
+        fields=None,
+        stream=False,
+    ):
+        """Get tasks for a user, optionally filtered by list_id"""
+        try:
+            query = {"user_id": user_id}
+            if list_id:
+                query["list_ids"] = list_id
+
+            return await self._find_tasks(query, limit, after, sort, fields, stream)
+        except Exception as e:
+            print(f"Error getting tasks: {e}")
+            return []
+
+    async def get_task_by_id(self, task_id, user_id):
+        """Get a specific task by ID and user_id"""
+        try:
+            task = await self.collection.find_one(
+                {"_id": ObjectId(task_id), "user_id": user_id}
+            )
+            if task:
+                return self._normalize_task(task)
+            return None
+        except Exception as e:
+            print(f"Error getting task: {e}")
+            return None
+
+    async def get_task_titles(self, user_id):
+        """Get (task_id, title) for every task of a user, for the fuzzy index"""
+        cursor = self.collection.find(
+            {"user_id": user_id}, {"title": 1}, batch_size=STREAM_BATCH_SIZE
+        )
+        return [(str(task["_id"]), task.get("title", "")) async for task in cursor]
+
+    async def update_task(self, task_id, user_id, update_data):
+        """Update a task"""
+        try:
+            result = await self.collection.update_one(
+                {"_id": ObjectId(task_id), "user_id": user_id},
+                {"$set": self._prepare_update(update_data)},
+            )
+            if result.modified_count > 0:
+                await self.versions.bump(user_id)
+            return result.modified_count > 0
+        except Exception as e:
+            print(f"Error updating task: {e}")
+            return False
+
+    async def delete_task(self, task_id, user_id):
+        """Delete a task"""
+        try:
+            result = await self.collection.delete_one(
+                {"_id": ObjectId(task_id), "user_id": user_id}
+            )
+            if result.deleted_count > 0:
+                await self._record_tombstones([ObjectId(task_id)], user_id)
+                await self.versions.bump(user_id)
+            return result.deleted_count > 0
+        except Exception as e:
+            print(f"Error deleting task: {e}")
+            return False
+
+    async def delete_multiple_tasks(self, task_ids, user_id):
+        """Delete multiple tasks"""
+        try:
+            object_ids = [ObjectId(task_id) for task_id in task_ids]
+            result = await self.collection.delete_many(
+                {"_id": {"$in": object_ids}, "user_id": user_id}
+            )
+            if result.deleted_count > 0:
+                await self._record_tombstones(object_ids, user_id)
+                await self.versions.bump(user_id)
+            return result.deleted_count
+        except Exception as e:
+            print(f"Error deleting multiple tasks: {e}")
+            return 0
+
+    async def add_task_to_list(self, task_id, user_id, list_id):
+        """Add a task to an additional list"""
+        try:
+            result = await self.collection.update_one(
+                {
+                    "_id": ObjectId(task_id),
+                    "user_id": user_id,
+                    "list_ids": {"$ne": list_id},
+                },
+                {
+                    "$addToSet": {"list_ids": list_id},
+                    "$set": {"updated_at": datetime.utcnow()},
+                },
+            )
+            if result.modified_count > 0:
+                await self.versions.bump(user_id)
+            return result.modified_count > 0
+        except Exception as e:
+            print(f"Error adding task to list: {e}")
+            return False
+
+    async def add_tasks_to_lists(self, task_ids, user_id, list_ids):
+        """Add several tasks to one or more lists with a single update"""
+        if not task_ids or not list_ids:
+            return {"matchedCount": 0, "modifiedCount": 0}
+        return await self.update_tasks_by_filter(
+            user_id, {"taskIds": task_ids}, {}, add_list_ids=list_ids
+        )
+
+    async def update_tasks_by_filter(
+        self, user_id, task_filter, set_fields, add_list_ids=(), remove_list_ids=()
+    ):
+        """Apply one restricted update to every task matching a filter"""
+        try:
+            pipeline = self._filter_update_pipeline(
+                set_fields, add_list_ids, remove_list_ids
+            )
+            if pipeline is None:
+                return {"matchedCount": 0, "modifiedCount": 0}
+            result = await self.collection.update_many(
+                self._filter_query(user_id, task_filter), pipeline
+            )
+            if result.modified_count > 0:
+                await self.versions.bump(user_id)
+            return {
+                "matchedCount": result.matched_count,
+                "modifiedCount": result.modified_count,
+            }
+        except Exception as e:
+            print(f"Error updating tasks by filter: {e}")
+            return None
+
+    async def _mutation_targets(self, user_id, mutations):
+        """{task ID: list_ids} of the user's tasks a batch refers to"""
+        return {
+            str(task["_id"]): task.get("list_ids", [])
+            async for task in self.collection.find(
+                self._mutation_targets_query(user_id, mutations), {"list_ids": 1}
+            )
+        }
+
+    async def apply_mutations(self, user_id, mutations):
+        """Apply an ordered batch of validated mutations with one ordered bulk_write"""
+        if not mutations:
+            return []
+        statuses = [{"status": "applied"} for _ in mutations]
+        unmatched = [None for _ in mutations]
+        try:
+            requests = [
+                self._mutation_request(user_id, mutation) for mutation in mutations
+            ]
+            unmatched = self._unmatched_mutations(
+                mutations, await self._mutation_targets(user_id, mutations)
+            )
+            await self.collection.bulk_write(requests, ordered=True)
+        except BulkWriteError as e:
+            statuses = self._failed_mutation_statuses(e, len(mutations))
+        except Exception as e:
+            print(f"Error applying mutations: {e}")
+            statuses = [{"status": "error", "error": str(e)} for _ in mutations]
+        statuses = self._matched_statuses(statuses, unmatched)
+
+        deleted_ids = self._deleted_ids(mutations, statuses)
+        if deleted_ids:
+            await self._record_tombstones(deleted_ids, user_id)
+        if any(status["status"] == "applied" for status in statuses):
+            await self.versions.bump(user_id)
+        return statuses
+
+    async def get_tasks_by_ids(self, task_ids, user_id):
+        """Get the tasks with the given IDs that belong to the user"""
+        try:
+            object_ids = [
+                ObjectId(task_id) for task_id in task_ids if ObjectId.is_valid(task_id)
+            ]
+            return [
+                self._normalize_task(task)
+                async for task in self.collection.find(
+                    {"_id": {"$in": object_ids}, "user_id": user_id}
+                )
+            ]
+        except Exception as e:
+            print(f"Error getting tasks by IDs: {e}")
+            return []
+
+    async def remove_task_from_list(self, task_id, user_id, list_id):
+        """Remove a task from a specific list (but keep in other lists)"""
+        try:
+            task = await self.get_task_by_id(task_id, user_id)
+            if not task:
+                return False
+
+            if len(task.get("list_ids", [])) <= 1:
+                # Don't remove if it's the only list - would orphan the task
+                return False
+
+            result = await self.collection.update_one(
+                {"_id": ObjectId(task_id), "user_id": user_id, "list_ids": list_id},
+                {
+                    "$pull": {"list_ids": list_id},
+                    "$set": {"updated_at": datetime.utcnow()},
+                },
+            )
+            if result.modified_count > 0:
+                await self.versions.bump(user_id)
+            return result.modified_count > 0
+        except Exception as e:
+            print(f"Error removing task from list: {e}")
+            return False
+
+    async def get_important_tasks(
+        self, user_id, limit=None, after=None, sort=None, fields=None, stream=False
+    ):
+        """Get all important tasks for a user"""
+        try:
+            return await self._find_tasks(
+                {"user_id": user_id, "isImportant": True},
+                limit,
+                after,
+                sort,
+                fields,
+                stream,
+            )
+        except Exception as e:
+            print(f"Error getting important tasks: {e}")
+            return []
+
+    async def get_completed_tasks(
+        self, user_id, limit=None, after=None, sort=None, fields=None, stream=False
+    ):
+        """Get all completed tasks for a user"""
+        try:
+            return await self._find_tasks(
+                {"user_id": user_id, "isCompleted": True},
+                limit,
+                after,
+                sort,
+                fields,
+                stream,
+            )
+        except Exception as e:
+            print(f"Error getting completed tasks: {e}")
+            return []
+
+    async def search_tasks(
+        self,
+        user_id,
+        search_term,
+        limit=None,
+        after=None,
+        sort=None,
+        fields=None,
+        stream=False,
+    ):
+        """Search tasks by title and note for a user, ranked unless paginated"""
+        try:
+            text_query, prefix_query = self._search_queries(user_id, search_term)
+            if after is not None or sort is not None:
+                query = self._paged_search_query(user_id, search_term)
+                return await self._find_tasks(query, limit, after, sort, fields, stream)
+
+            limit = limit or SEARCH_RESULT_LIMIT
+            projection = build_projection(fields) or {}
+            ranked = (
+                await self.collection.find(
+                    text_query, {**projection, "score": {"$meta": "textScore"}}
+                )
+                .sort([("score", {"$meta": "textScore"})])
+                .limit(limit)
+                .to_list()
+            )
+            prefix_matches = []
+            if len(ranked) < limit:
+                prefix_matches = (
+                    await self.collection.find(prefix_query, projection or None)
+                    .limit(limit)
+                    .to_list()
+                )
+
+            tasks = self._merge_ranked(ranked, prefix_matches, limit, fields)
+            if stream:
+                return _aiter(tasks)
+            return tasks
+        except Exception as e:
+            print(f"Error searching tasks: {e}")
+            return []
+
+    async def get_list_stats(self, user_id, list_id):
+        """Count total and completed tasks in a list with a single aggregation"""
+        try:
+            cursor = await self.collection.aggregate(
+                self._list_stats_pipeline(user_id, list_id)
+            )
+            result = await anext(cursor, None)
+            if result is None:
+                return to_stats(0, 0)
+            return to_stats(result["totalTasks"], result["completedTasks"])
+        except Exception as e:
+            print(f"Error getting list stats: {e}")
+            return None
+
+    async def delete_tasks_by_list(self, list_id, user_id):
+        """Delete all tasks in a specific list for a user"""
+        try:
+            query = {"list_id": list_id, "user_id": user_id}
+            object_ids = [
+                task["_id"] async for task in self.collection.find(query, {"_id": 1})
+            ]
+            if not object_ids:
+                return 0
+            result = await self.collection.delete_many(
+                {"_id": {"$in": object_ids}, "user_id": user_id}
+            )
+            await self._record_tombstones(object_ids, user_id)
+            await self.versions.bump(user_id)
+            return result.deleted_count
+        except Exception as e:
+            print(f"Error deleting tasks by list: {e}")
+            return 0
+
+    async def _record_tombstones(self, object_ids, user_id):
+        """Remember deleted task IDs so delta sync can propagate deletions"""
+        try:
+            await self.tombstones.bulk_write(
+                self._tombstone_requests(object_ids, user_id), ordered=False
+            )
+        except Exception as e:
+            print(f"Error recording tombstones: {e}")
+
+    async def get_changes(self, user_id, since):
+        """Get tasks changed and task IDs deleted at or after since"""
+        try:
+            tasks = [
+                self._normalize_task(task)
+                async for task in self.collection.find(
+                    {"user_id": user_id, "updated_at": {"$gte": since}}
+                )
+            ]
+            deleted_task_ids = [
+                str(tombstone["_id"])
+                async for tombstone in self.tombstones.find(
+                    {"user_id": user_id, "deleted_at": {"$gte": since}}, {"_id": 1}
+                )
+            ]
+            return {"tasks": tasks, "deletedTaskIds": deleted_task_ids}
+        except Exception as e:
+            print(f"Error getting task changes: {e}")
+            return None
+
+
+class AsyncTaskList(TaskList):
+    version_class = AsyncDataVersion
+
+    async def create_task_list(self, list_data):
+        """Create a new task list with user_id"""
+        try:
+            list_data["created_at"] = datetime.utcnow()
+            list_data["updated_at"] = datetime.utcnow()
+            if "isDefault" not in list_data:
+                list_data["isDefault"] = False
+
+            result = await self.collection.insert_one(list_data)
+            if list_data["isDefault"]:
+                self.default_list_cache.invalidate(list_data.get("user_id"))
+            await self.versions.bump(list_data.get("user_id"))
+            return str(result.inserted_id)
+        except Exception as e:
+            print(f"Error creating task list: {e}")
+            return None
+
+    async def get_task_lists(self, user_id, default_only=False):
+        """Get task lists for a user"""
+        try:
+            query = {"user_id": user_id}
+            if default_only:
+                query["isDefault"] = True
+
+            return await self.collection.find(query).to_list()
+        except Exception as e:
+            print(f"Error getting task lists: {e}")
+            return []
+
+    async def get_task_list_by_id(self, list_id, user_id):
+        """Get a specific task list by ID and user_id"""
+        try:
+            return await self.collection.find_one(
+                {"_id": ObjectId(list_id), "user_id": user_id}
+            )
+        except Exception as e:
+            print(f"Error getting task list: {e}")
+            return None
+
+    async def update_task_list(self, list_id, user_id, update_data):
+        """Update a task list"""
+        try:
+            update_data["updated_at"] = datetime.utcnow()
+            result = await self.collection.update_one(
+                {"_id": ObjectId(list_id), "user_id": user_id}, {"$set": update_data}
+            )
+            self.default_list_cache.invalidate(user_id)
+            if result.modified_count > 0:
+                await self.versions.bump(user_id)
+            return result.modified_count > 0
+        except Exception as e:
+            print(f"Error updating task list: {e}")
+            return False
+
+    async def delete_task_list(self, list_id, user_id):
+        """Delete a task list (only if not default)"""
+        try:
+            task_list = await self.get_task_list_by_id(list_id, user_id)
+            if task_list and task_list.get("isDefault", False):
+                return False  # Cannot delete default lists
+
+            result = await self.collection.delete_one(
+                {
+                    "_id": ObjectId(list_id),
+                    "user_id": user_id,
+                    "isDefault": {"$ne": True},
+                }
+            )
+            self.default_list_cache.invalidate(user_id)
+            if result.deleted_count > 0:
+                await self.versions.bump(user_id)
+            return result.deleted_count > 0
+        except Exception as e:
+            print(f"Error deleting task list: {e}")
+            return False
+
+    async def create_default_lists(self, user_id):
+        """Create default lists for a new user"""
+        try:
+            created_ids = []
+            for list_data in DEFAULT_LISTS:
+                list_id = await self.create_task_list(dict(list_data, user_id=user_id))
+                if list_id:
+                    created_ids.append(list_id)
+
+            self.default_list_cache.invalidate(user_id)
+            return created_ids
+        except Exception as e:
+            print(f"Error creating default lists: {e}")
+            return []
+
+    async def get_all_list_stats(self, user_id):
+        """Count tasks for every list of a user plus the Important and Completed
+        views, in one aggregation over the user's lists and tasks"""
+        try:
+            cursor = await self.collection.aggregate(
+                self._all_list_stats_pipeline(user_id)
+            )
+            return self._all_list_stats_result(await anext(cursor))
+        except Exception as e:
+            print(f"Error getting all list stats: {e}")
+            return None
+
+    async def get_default_list_ids(self, user_id):
+        """Get a {list name: list ID} map of the user's default lists (cached)"""
+        default_list_ids = self.default_list_cache.get(user_id)
+        if default_list_ids is not None:
+            return default_list_ids
+
+        try:
+            default_list_ids = {
+                task_list["name"]: str(task_list["_id"])
+                async for task_list in self.collection.find(
+                    {"user_id": user_id, "isDefault": True}, {"name": 1}
+                )
+            }
+            self.default_list_cache.set(user_id, default_list_ids)
+            return default_list_ids
+        except Exception as e:
+            print(f"Error getting default list IDs: {e}")
+            return {}
+
+
+class AsyncTelegramUpdateLog(TelegramUpdateLog):
+    async def claim(self, update_id):
+        """Take an update for processing, False if it is a duplicate delivery"""
+        if self.result_cache.get(update_id) is not None:
+            self._count_duplicate()
+            return False
+        try:
+            query, update = self._claim_request(update_id)
+            await self.collection.update_one(query, update, upsert=True)
+            return True
+        except DuplicateKeyError:
+            self._count_duplicate()
+            return False
+        except Exception as e:
+            print(f"Error claiming telegram update: {e}")
+            return True
+
+    async def release(self, update_id):
+        """Drop an unfinished claim so a redelivery is processed again"""
+        try:
+            await self.collection.delete_one(
+                {"_id": update_id, "result": {"$exists": False}}
+            )
+            return True
+        except Exception as e:
+            print(f"Error releasing telegram update: {e}")
+            return False
+
+    async def get_result(self, update_id):
+        """Get the stored extraction result of an already processed update"""
+        try:
+            result = self.result_cache.get(update_id)
+            if result is None:
+                update = await self.collection.find_one(
+                    {"_id": update_id}, {"result": 1}
+                )
+                if update is None or "result" not in update:
+                    return None
+                result = update["result"]
+                self.result_cache.set(update_id, result)
+            return result
+        except Exception as e:
+            print(f"Error getting telegram update: {e}")
+            return None
+
+    async def save_result(self, update_id, result):
+        """Record the extraction result of a processed update"""
+        try:
+            await self.collection.update_one(
+                {"_id": update_id},
+                {
+                    "$set": {"result": result},
+                    "$unset": {"claimed_at": ""},
+                    "$setOnInsert": {"created_at": datetime.utcnow()},
+                },
+                upsert=True,
+            )
+            self.result_cache.set(update_id, result)
+            return True
+        except Exception as e:
+            print(f"Error saving telegram update: {e}")
+            return False
+
+
+async def _aiter(items):
+    for item in items:
+        yield item
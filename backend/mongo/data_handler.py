@@ -1,7 +1,11 @@
 import os
 from pymongo import MongoClient
-from typing import List, Optional, Dict, Any
-from .models import Task, TaskList, User
+from typing import List, Optional, Dict, Any, Iterable
+from .indexes import check_indexes
+from .models import SEARCH_RESULT_LIMIT, Task, TaskList, TelegramUpdateLog, User
+from fuzzy_search import FuzzySearchIndex
+from read_cache import ReadThroughCache, make_backend
+from singleflight import SingleFlight
 from dotenv import load_dotenv
 from datetime import datetime
 from bson import ObjectId
@@ -19,15 +23,49 @@ class DataHandler:
         self.client = MongoClient(connection_string)
         print(self.client)
         self.db = self.client[database_name]
+        # Indexes are built by `python -m mongo.indexes migrate`, only checked here
+        check_indexes(self.db)
 
         # Initialize model classes
         self.user_model = User(self.db)
         self.task_model = Task(self.db)
         self.task_list_model = TaskList(self.db)
+        self.telegram_update_model = TelegramUpdateLog(self.db)
+
+        # In-memory typo-tolerant title index, built per user on first use
+        self.fuzzy_index = FuzzySearchIndex(
+            self.task_model.get_task_titles,
+            max_bytes=int(os.getenv("FUZZY_INDEX_MAX_BYTES", 64 * 1024 * 1024)),
+        )
+
+        # Read-through cache of single tasks, task lists and users
+        read_cache_ttl = int(os.getenv("READ_CACHE_TTL", "30"))
+        self.read_cache = ReadThroughCache(
+            make_backend(os.getenv("READ_CACHE_BACKEND", "local"), ttl=read_cache_ttl),
+            ttl=read_cache_ttl,
+            verify_rate=float(os.getenv("READ_CACHE_VERIFY_RATE", "0")),
+        )
+
+        # Concurrent identical reads share one Mongo query
+        self.single_flight = SingleFlight()
 
     def close_connection(self):
         self.client.close()
 
+    def _cache_version(self, user_id: str) -> Optional[str]:
+        """Data version to key cached task and list reads by, None if uncached"""
+        return self.read_cache.version(
+            user_id, lambda: self.task_model.versions.current(user_id)
+        )
+
+    def _written(self, user_id: str):
+        """Stop reads joining loads from before a write and cache the new version"""
+        self.single_flight.forget(user_id)
+        if self.read_cache.enabled:
+            self.read_cache.set_version(
+                user_id, self.task_model.versions.current(user_id)
+            )
+
     # ==================== USER OPERATIONS ====================
 
     def create_user(self, email: str, password: str) -> Optional[str]:
@@ -37,6 +75,7 @@ class DataHandler:
             if user_id:
                 # Create default lists for the user
                 self.task_list_model.create_default_lists(user_id)
+                self._written(user_id)
                 return user_id
             return None
         except Exception as e:
@@ -54,7 +93,12 @@ class DataHandler:
     def get_user_by_id(self, user_id: str) -> Optional[Dict]:
         """Get user by ID"""
         try:
-            return self.user_model.get_user_by_id(user_id)
+            return self.read_cache.get_or_load(
+                self.read_cache.user_key(user_id),
+                lambda: self.single_flight.do(
+                    user_id, ("user",), lambda: self.user_model.get_user_by_id(user_id)
+                ),
+            )
         except Exception as e:
             print(f"Error getting user: {e}")
             return None
@@ -64,15 +108,54 @@ class DataHandler:
     def create_task(self, task_data: Dict[str, Any]) -> Optional[str]:
         """Create a new task and return its ID"""
         try:
-            return self.task_model.create_task(task_data)
+            task_id = self.task_model.create_task(task_data)
+            if task_id:
+                self._written(task_data["user_id"])
+                self.fuzzy_index.on_task_saved(
+                    task_data["user_id"], task_id, task_data.get("title", "")
+                )
+            return task_id
         except Exception as e:
             print(f"Error creating task: {e}")
             return None
 
-    def get_tasks(self, user_id: str, list_id: Optional[str] = None) -> List[Dict]:
-        """Get all tasks for a user, optionally filtered by list_id"""
+    def create_tasks(self, tasks_data: List[Dict[str, Any]]) -> List[Dict[str, str]]:
+        """Create many tasks, returning a taskId or error entry per task"""
         try:
-            return self.task_model.get_tasks(user_id, list_id)
+            results = self.task_model.create_tasks(tasks_data)
+            for user_id in {task_data["user_id"] for task_data in tasks_data}:
+                self._written(user_id)
+            for task_data, result in zip(tasks_data, results):
+                if "taskId" in result:
+                    self.fuzzy_index.on_task_saved(
+                        task_data["user_id"],
+                        result["taskId"],
+                        task_data.get("title", ""),
+                    )
+            return results
+        except Exception as e:
+            print(f"Error creating tasks: {e}")
+            return [{"error": "Failed to create task"} for _ in tasks_data]
+
+    def get_tasks(
+        self,
+        user_id: str,
+        list_id: Optional[str] = None,
+        limit: Optional[int] = None,
+        after: Optional[Any] = None,
+        sort: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        stream: bool = False,
+    ) -> Iterable[Dict]:
+        """Get all tasks for a user, optionally filtered by list_id and paginated"""
+        try:
+            args = (user_id, list_id, limit, after, sort, fields, stream)
+            if stream:
+                # A cursor can only be consumed once, so streams are never shared
+                return self.task_model.get_tasks(*args)
+            return self.single_flight.do(
+                user_id, ("tasks", args), lambda: self.task_model.get_tasks(*args)
+            )
         except Exception as e:
             print(f"Error getting tasks: {e}")
             return []
@@ -80,52 +163,137 @@ class DataHandler:
     def get_task_by_id(self, task_id: str, user_id: str) -> Optional[Dict]:
         """Get a specific task by ID, ensuring it belongs to the user"""
         try:
-            return self.task_model.get_task_by_id(task_id, user_id)
+            return self.read_cache.get_or_load(
+                self.read_cache.task_key(
+                    user_id, task_id, self._cache_version(user_id)
+                ),
+                lambda: self.single_flight.do(
+                    user_id,
+                    ("task", task_id),
+                    lambda: self.task_model.get_task_by_id(task_id, user_id),
+                ),
+            )
         except Exception as e:
             print(f"Error getting task: {e}")
             return None
 
+    @staticmethod
+    def _normalize_due_date(updates: Dict[str, Any]) -> Dict[str, Any]:
+        """Parse a dueDate in a task update, dropping it if it is invalid"""
+        # Convert datetime fields if needed
+        if "dueDate" in updates and updates["dueDate"]:
+            # Handle different date formats
+            if isinstance(updates["dueDate"], str):
+                try:
+                    # Try to parse ISO format with Z
+                    if updates["dueDate"].endswith("Z"):
+                        updates["dueDate"] = datetime.fromisoformat(
+                            updates["dueDate"].replace("Z", "+00:00")
+                        )
+                    else:
+                        # Try regular ISO format
+                        updates["dueDate"] = datetime.fromisoformat(updates["dueDate"])
+                except ValueError:
+                    # If parsing fails, remove the dueDate to avoid errors
+                    print(f"Invalid date format: {updates['dueDate']}")
+                    updates.pop("dueDate", None)
+            elif isinstance(updates["dueDate"], datetime):
+                # Already a datetime object, keep as is
+                pass
+            else:
+                # Unknown format, remove it
+                updates.pop("dueDate", None)
+        elif "dueDate" in updates and updates["dueDate"] is None:
+            # Explicitly setting to None (clearing due date)
+            updates["dueDate"] = None
+        return updates
+
     def update_task(self, task_id: str, user_id: str, updates: Dict[str, Any]) -> bool:
         """Update a task, ensuring it belongs to the user"""
         try:
-            # Convert datetime fields if needed
-            if "dueDate" in updates and updates["dueDate"]:
-                # Handle different date formats
-                if isinstance(updates["dueDate"], str):
-                    try:
-                        # Try to parse ISO format with Z
-                        if updates["dueDate"].endswith("Z"):
-                            updates["dueDate"] = datetime.fromisoformat(
-                                updates["dueDate"].replace("Z", "+00:00")
-                            )
-                        else:
-                            # Try regular ISO format
-                            updates["dueDate"] = datetime.fromisoformat(
-                                updates["dueDate"]
-                            )
-                    except ValueError:
-                        # If parsing fails, remove the dueDate to avoid errors
-                        print(f"Invalid date format: {updates['dueDate']}")
-                        updates.pop("dueDate", None)
-                elif isinstance(updates["dueDate"], datetime):
-                    # Already a datetime object, keep as is
-                    pass
-                else:
-                    # Unknown format, remove it
-                    updates.pop("dueDate", None)
-            elif "dueDate" in updates and updates["dueDate"] is None:
-                # Explicitly setting to None (clearing due date)
-                updates["dueDate"] = None
-
-            return self.task_model.update_task(task_id, user_id, updates)
+            updates = self._normalize_due_date(updates)
+            success = self.task_model.update_task(task_id, user_id, updates)
+            if success:
+                self._written(user_id)
+            if success and "title" in updates:
+                self.fuzzy_index.on_task_saved(user_id, task_id, updates["title"])
+            return success
         except Exception as e:
             print(f"Error updating task: {e}")
             return False
 
+    def update_tasks_by_filter(
+        self,
+        user_id: str,
+        task_filter: Dict[str, Any],
+        set_fields: Dict[str, Any],
+        add_list_ids: List[str] = (),
+        remove_list_ids: List[str] = (),
+    ) -> Optional[Dict[str, int]]:
+        """Update every task matching a filter, returning matched/modified counts"""
+        try:
+            result = self.task_model.update_tasks_by_filter(
+                user_id, task_filter, set_fields, add_list_ids, remove_list_ids
+            )
+            if result and result["modifiedCount"]:
+                self._written(user_id)
+            return result
+        except Exception as e:
+            print(f"Error updating tasks by filter: {e}")
+            return None
+
+    def apply_mutations(
+        self, user_id: str, mutations: List[Dict[str, Any]]
+    ) -> List[Dict[str, str]]:
+        """Apply an ordered batch of task mutations in a single round trip"""
+        try:
+            results = self.task_model.apply_mutations(user_id, mutations)
+            self._written(user_id)
+            # A batch may create, retitle and delete many tasks at once
+            self.fuzzy_index.invalidate(user_id)
+            return results
+        except Exception as e:
+            print(f"Error applying mutations: {e}")
+            return [{"status": "error", "error": str(e)} for _ in mutations]
+
+    def get_tasks_by_ids(self, task_ids: List[str], user_id: str) -> List[Dict]:
+        """Get several tasks by ID, ensuring they belong to the user"""
+        try:
+            return self.task_model.get_tasks_by_ids(task_ids, user_id)
+        except Exception as e:
+            print(f"Error getting tasks by IDs: {e}")
+            return []
+
+    def get_task_changes(self, user_id: str, since: datetime) -> Optional[Dict]:
+        """Get tasks changed and deleted since a point in time.
+
+        When since is older than the tombstone retention some deletions may
+        have been forgotten, so every task is returned with fullResync set.
+        """
+        try:
+            age = (datetime.utcnow() - since).total_seconds()
+            if age > self.task_model.tombstone_ttl:
+                return {
+                    "fullResync": True,
+                    "tasks": self.task_model.get_tasks(user_id),
+                    "deletedTaskIds": [],
+                }
+            changes = self.task_model.get_changes(user_id, since)
+            if changes is None:
+                return None
+            return {"fullResync": False, **changes}
+        except Exception as e:
+            print(f"Error getting task changes: {e}")
+            return None
+
     def delete_task(self, task_id: str, user_id: str) -> bool:
         """Delete a task, ensuring it belongs to the user"""
         try:
-            return self.task_model.delete_task(task_id, user_id)
+            success = self.task_model.delete_task(task_id, user_id)
+            if success:
+                self._written(user_id)
+                self.fuzzy_index.on_task_deleted(user_id, task_id)
+            return success
         except Exception as e:
             print(f"Error deleting task: {e}")
             return False
@@ -133,7 +301,11 @@ class DataHandler:
     def delete_multiple_tasks(self, task_ids: List[str], user_id: str) -> int:
         """Delete multiple tasks, ensuring they belong to the user"""
         try:
-            return self.task_model.delete_multiple_tasks(task_ids, user_id)
+            deleted_count = self.task_model.delete_multiple_tasks(task_ids, user_id)
+            self._written(user_id)
+            for task_id in task_ids:
+                self.fuzzy_index.on_task_deleted(user_id, task_id)
+            return deleted_count
         except Exception as e:
             print(f"Error deleting multiple tasks: {e}")
             return 0
@@ -142,30 +314,44 @@ class DataHandler:
         self, task_id: str, user_id: str, is_completed: bool = True
     ) -> bool:
         """Mark a task as completed or uncompleted"""
-        return self.task_model.update_task(
-            task_id, user_id, {"isCompleted": is_completed}
-        )
+        return self.update_task(task_id, user_id, {"isCompleted": is_completed})
 
     def mark_task_important(
         self, task_id: str, user_id: str, is_important: bool = True
     ) -> bool:
         """Mark a task as important or not important"""
-        return self.task_model.update_task(
-            task_id, user_id, {"isImportant": is_important}
-        )
+        return self.update_task(task_id, user_id, {"isImportant": is_important})
 
     def add_task_to_list(self, task_id: str, user_id: str, list_id: str) -> bool:
         """Add a task to an additional list"""
         try:
-            return self.task_model.add_task_to_list(task_id, user_id, list_id)
+            success = self.task_model.add_task_to_list(task_id, user_id, list_id)
+            if success:
+                self._written(user_id)
+            return success
         except Exception as e:
             print(f"Error adding task to list: {e}")
             return False
 
+    def add_tasks_to_lists(
+        self, task_ids: List[str], user_id: str, list_ids: List[str]
+    ) -> Optional[Dict[str, int]]:
+        """Add several tasks to one or more lists, returning matched/modified counts"""
+        try:
+            result = self.task_model.add_tasks_to_lists(task_ids, user_id, list_ids)
+            self._written(user_id)
+            return result
+        except Exception as e:
+            print(f"Error adding tasks to lists: {e}")
+            return None
+
     def remove_task_from_list(self, task_id: str, user_id: str, list_id: str) -> bool:
         """Remove a task from a specific list (but keep in other lists)"""
         try:
-            return self.task_model.remove_task_from_list(task_id, user_id, list_id)
+            success = self.task_model.remove_task_from_list(task_id, user_id, list_id)
+            if success:
+                self._written(user_id)
+            return success
         except Exception as e:
             print(f"Error removing task from list: {e}")
             return False
@@ -175,23 +361,56 @@ class DataHandler:
     def create_task_list(self, task_list_data: Dict[str, Any]) -> Optional[str]:
         """Create a new task list and return its ID"""
         try:
-            return self.task_list_model.create_task_list(task_list_data)
+            list_id = self.task_list_model.create_task_list(task_list_data)
+            if list_id:
+                self._written(task_list_data.get("user_id"))
+            return list_id
         except Exception as e:
             print(f"Error creating task list: {e}")
             return None
 
-    def get_task_lists(self, user_id: str, default_only: bool = False) -> List[Dict]:
-        """Get all task lists for a user"""
+    def get_task_lists(
+        self, user_id: str, default_only: bool = False, version: Optional[str] = None
+    ) -> List[Dict]:
+        """Get all task lists for a user, keyed in the cache by version if given"""
         try:
-            return self.task_list_model.get_task_lists(user_id, default_only)
+            version = version or self._cache_version(user_id)
+            return self.read_cache.get_or_load(
+                self.read_cache.task_lists_key(user_id, default_only, version),
+                lambda: self.single_flight.do(
+                    user_id,
+                    ("lists", default_only),
+                    lambda: self.task_list_model.get_task_lists(user_id, default_only),
+                ),
+            )
         except Exception as e:
             print(f"Error getting task lists: {e}")
             return []
 
+    def get_default_list_ids(self, user_id: str) -> Dict[str, str]:
+        """Get a {list name: list ID} map of the user's default lists"""
+        try:
+            return self.task_list_model.get_default_list_ids(user_id)
+        except Exception as e:
+            print(f"Error getting default list IDs: {e}")
+            return {}
+
+    def get_data_version(self, user_id: str) -> Optional[str]:
+        """Get a token that changes whenever the user's tasks or lists change"""
+        try:
+            return self.task_model.versions.current(user_id)
+        except Exception as e:
+            print(f"Error getting data version: {e}")
+            return None
+
     def get_task_list_by_id(self, list_id: str, user_id: str) -> Optional[Dict]:
         """Get a specific task list by ID, ensuring it belongs to the user"""
         try:
-            return self.task_list_model.get_task_list_by_id(list_id, user_id)
+            return self.single_flight.do(
+                user_id,
+                ("list", list_id),
+                lambda: self.task_list_model.get_task_list_by_id(list_id, user_id),
+            )
         except Exception as e:
             print(f"Error getting task list: {e}")
             return None
@@ -201,7 +420,10 @@ class DataHandler:
     ) -> bool:
         """Update a task list, ensuring it belongs to the user"""
         try:
-            return self.task_list_model.update_task_list(list_id, user_id, updates)
+            success = self.task_list_model.update_task_list(list_id, user_id, updates)
+            if success:
+                self._written(user_id)
+            return success
         except Exception as e:
             print(f"Error updating task list: {e}")
             return False
@@ -219,52 +441,170 @@ class DataHandler:
             if success:
                 # Delete all tasks in this list
                 self.task_model.delete_tasks_by_list(list_id, user_id)
+                self._written(user_id)
+                self.fuzzy_index.invalidate(user_id)
             return success
         except Exception as e:
             print(f"Error deleting task list: {e}")
             return False
 
+    # ==================== TELEGRAM OPERATIONS ====================
+
+    def claim_telegram_update(self, update_id: int) -> bool:
+        """Claim a Telegram update for processing, False for a duplicate delivery"""
+        try:
+            return self.telegram_update_model.claim(update_id)
+        except Exception as e:
+            print(f"Error claiming telegram update: {e}")
+            return True
+
+    def release_telegram_update(self, update_id: int) -> bool:
+        """Give up a claim so a redelivery of the update is processed again"""
+        try:
+            return self.telegram_update_model.release(update_id)
+        except Exception as e:
+            print(f"Error releasing telegram update: {e}")
+            return False
+
+    def get_telegram_update_result(self, update_id: int) -> Optional[Dict]:
+        """Get the stored result of an already processed Telegram update"""
+        try:
+            return self.telegram_update_model.get_result(update_id)
+        except Exception as e:
+            print(f"Error getting telegram update: {e}")
+            return None
+
+    def save_telegram_update_result(self, update_id: int, result: Dict) -> bool:
+        """Store the result of a processed Telegram update"""
+        try:
+            return self.telegram_update_model.save_result(update_id, result)
+        except Exception as e:
+            print(f"Error saving telegram update: {e}")
+            return False
+
     # ==================== UTILITY OPERATIONS ====================
 
-    def get_important_tasks(self, user_id: str) -> List[Dict]:
+    def get_important_tasks(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        after: Optional[Any] = None,
+        sort: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        stream: bool = False,
+    ) -> Iterable[Dict]:
         """Get all important tasks for a user"""
         try:
-            return self.task_model.get_important_tasks(user_id)
+            args = (user_id, limit, after, sort, fields, stream)
+            if stream:
+                return self.task_model.get_important_tasks(*args)
+            return self.single_flight.do(
+                user_id,
+                ("important", args),
+                lambda: self.task_model.get_important_tasks(*args),
+            )
         except Exception as e:
             print(f"Error getting important tasks: {e}")
             return []
 
-    def get_completed_tasks(self, user_id: str) -> List[Dict]:
+    def get_completed_tasks(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        after: Optional[Any] = None,
+        sort: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        stream: bool = False,
+    ) -> Iterable[Dict]:
         """Get all completed tasks for a user"""
         try:
-            return self.task_model.get_completed_tasks(user_id)
+            args = (user_id, limit, after, sort, fields, stream)
+            if stream:
+                return self.task_model.get_completed_tasks(*args)
+            return self.single_flight.do(
+                user_id,
+                ("completed", args),
+                lambda: self.task_model.get_completed_tasks(*args),
+            )
         except Exception as e:
             print(f"Error getting completed tasks: {e}")
             return []
 
-    def search_tasks(self, user_id: str, search_term: str) -> List[Dict]:
+    def search_tasks(
+        self,
+        user_id: str,
+        search_term: str,
+        limit: Optional[int] = None,
+        after: Optional[Any] = None,
+        sort: Optional[str] = None,
+        fields: Optional[List[str]] = None,
+        stream: bool = False,
+    ) -> Iterable[Dict]:
         """Search tasks by title for a user"""
         try:
-            return self.task_model.search_tasks(user_id, search_term)
+            args = (user_id, search_term, limit, after, sort, fields, stream)
+            if stream:
+                return self.task_model.search_tasks(*args)
+            return self.single_flight.do(
+                user_id, ("search", args), lambda: self.task_model.search_tasks(*args)
+            )
         except Exception as e:
             print(f"Error searching tasks: {e}")
             return []
 
+    def fuzzy_search_tasks(
+        self, user_id: str, search_term: str, limit: Optional[int] = None
+    ) -> List[Dict]:
+        """Typo-tolerant title search, best matches first"""
+        try:
+            matches = self.fuzzy_index.search(
+                user_id, search_term, limit or SEARCH_RESULT_LIMIT
+            )
+            tasks = {
+                str(task["_id"]): task
+                for task in self.task_model.get_tasks_by_ids(
+                    [task_id for task_id, _ in matches], user_id
+                )
+            }
+            return [
+                {**tasks[task_id], "score": score}
+                for task_id, score in matches
+                if task_id in tasks
+            ]
+        except Exception as e:
+            print(f"Error fuzzy searching tasks: {e}")
+            return []
+
+    def get_cache_stats(self) -> Dict[str, Dict]:
+        """Get hit/miss counters for the in-process caches"""
+        return {
+            "defaultListIds": self.task_list_model.default_list_cache.stats(),
+            "telegramUpdates": self.telegram_update_model.stats(),
+            "fuzzyIndex": self.fuzzy_index.stats(),
+            "readThrough": self.read_cache.stats(),
+            "singleFlight": self.single_flight.stats(),
+        }
+
     def get_list_stats(self, list_id: str, user_id: str) -> Optional[Dict[str, int]]:
         """Get statistics for a specific list"""
         try:
-            tasks = self.get_tasks(user_id, list_id)
-            total_tasks = len(tasks)
-            completed_tasks = len(
-                [task for task in tasks if task.get("isCompleted", False)]
+            return self.single_flight.do(
+                user_id,
+                ("list stats", list_id),
+                lambda: self.task_model.get_list_stats(user_id, list_id),
             )
-            pending_tasks = total_tasks - completed_tasks
-
-            return {
-                "totalTasks": total_tasks,
-                "completedTasks": completed_tasks,
-                "pendingTasks": pending_tasks,
-            }
         except Exception as e:
             print(f"Error getting list stats: {e}")
             return None
+
+    def get_all_list_stats(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Get statistics for every list plus the Important and Completed views"""
+        try:
+            return self.single_flight.do(
+                user_id,
+                ("all list stats",),
+                lambda: self.task_list_model.get_all_list_stats(user_id),
+            )
+        except Exception as e:
+            print(f"Error getting all list stats: {e}")
+            return None
@@ -0,0 +1,354 @@
+"""Declarative index plan for every collection, plus the commands to manage it.
+
+Indexes are built once by an explicit migration instead of on every startup:
+
+    python -m mongo.indexes migrate [--prune]   create missing/changed indexes
+    python -m mongo.indexes verify              list indexes that are out of date
+    python -m mongo.indexes explain             explain every model query
+"""
+
+import argparse
+import os
+import sys
+from datetime import datetime
+
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import ASCENDING, TEXT, IndexModel, MongoClient
+
+from .models import (
+    SEARCH_RESULT_LIMIT,
+    TELEGRAM_UPDATE_TTL_SECONDS,
+    TOMBSTONE_TTL_SECONDS,
+    Task,
+    TaskList,
+)
+from .pagination import MAX_PAGE_SIZE, apply_cursor, sort_spec
+
+# Index options that must match for an existing index to count as up to date
+COMPARED_OPTIONS = ("expireAfterSeconds", "weights")
+
+
+def _keys(*fields):
+    return [(field, ASCENDING) for field in fields]
+
+
+# Every task query filters on user_id first; the trailing _id / updated_at
+# keys let keyset pagination walk the index in sort order, and each compound
+# index also serves its (user_id, field) prefix on its own.
+INDEXES = {
+    "users": [IndexModel("email", unique=True)],
+    "tasks": [
+        IndexModel(_keys("user_id", "_id")),
+        IndexModel(_keys("user_id", "list_ids", "_id")),
+        IndexModel(_keys("user_id", "isImportant", "_id")),
+        IndexModel(_keys("user_id", "isCompleted", "_id")),
+        IndexModel(_keys("user_id", "updated_at", "_id")),
+        IndexModel(_keys("user_id", "list_ids", "updated_at", "_id")),
+        # Per-list stats count completed tasks without fetching documents
+        IndexModel(_keys("user_id", "list_ids", "isCompleted")),
+        # Ranked full-word search and anchored prefix search
+        IndexModel(
+            [("user_id", ASCENDING), ("title", TEXT), ("note", TEXT)],
+            weights={"title": 10, "note": 2},
+            name="task_text_search",
+        ),
+        IndexModel(_keys("user_id", "title_lower", "_id")),
+    ],
+    "task_tombstones": [
+        IndexModel("deleted_at", expireAfterSeconds=TOMBSTONE_TTL_SECONDS),
+        IndexModel(_keys("user_id", "deleted_at")),
+    ],
+    "task_lists": [IndexModel(_keys("user_id", "isDefault"))],
+    # Expire processed updates once Telegram has stopped redelivering them
+    "telegram_updates": [
+        IndexModel("created_at", expireAfterSeconds=TELEGRAM_UPDATE_TTL_SECONDS)
+    ],
+}
+
+
+def _index_problem(spec, existing):
+    """Describe how an existing index differs from its spec, or None if it matches"""
+    if existing is None:
+        return "missing"
+    # Text indexes are stored with internal _fts/_ftsx keys, so only
+    # compare the keys of regular indexes
+    if "weights" not in spec and list(spec["key"].items()) != [
+        (field, direction) for field, direction in existing["key"]
+    ]:
+        return "different keys"
+    if bool(spec.get("unique")) != bool(existing.get("unique")):
+        return "different unique"
+    for option in COMPARED_OPTIONS:
+        if spec.get(option) != existing.get(option):
+            return f"different {option}"
+    return None
+
+
+def _compare(index_information):
+    """Compare {collection: index_information()} with INDEXES"""
+    problems = []
+    extra = []
+    for collection_name, models in INDEXES.items():
+        existing = index_information[collection_name]
+        names = set()
+        for model in models:
+            spec = model.document
+            names.add(spec["name"])
+            problem = _index_problem(spec, existing.get(spec["name"]))
+            if problem:
+                problems.append((collection_name, spec["name"], problem))
+        for name in existing:
+            if name != "_id_" and name not in names:
+                extra.append((collection_name, name))
+    return {"problems": problems, "extra": extra}
+
+
+def verify(db):
+    """Compare the database with INDEXES.
+
+    Returns {"problems": [(collection, index name, problem)],
+    "extra": [(collection, index name)]}.
+    """
+    return _compare({name: db[name].index_information() for name in INDEXES})
+
+
+async def averify(db):
+    """verify() for a pymongo AsyncDatabase"""
+    return _compare({name: await db[name].index_information() for name in INDEXES})
+
+
+def migrate(db, prune=False):
+    """Build missing indexes, rebuild changed ones and backfill derived fields.
+
+    With prune=True, indexes that are no longer in INDEXES are dropped.
+    """
+    report = verify(db)
+    for collection_name, name, problem in report["problems"]:
+        collection = db[collection_name]
+        if problem != "missing":
+            print(f"Dropping {collection_name}.{name} ({problem})")
+            collection.drop_index(name)
+        model = next(m for m in INDEXES[collection_name] if m.document["name"] == name)
+        print(f"Creating {collection_name}.{name}")
+        collection.create_indexes([model])
+    for collection_name, name in report["extra"]:
+        if prune:
+            print(f"Dropping unused index {collection_name}.{name}")
+            db[collection_name].drop_index(name)
+        else:
+            print(f"Unused index {collection_name}.{name} (drop with --prune)")
+
+    backfilled = Task(db).backfill_search_fields()
+    print(f"Backfilled search fields on {backfilled} tasks")
+    return report
+
+
+def _report_problems(problems):
+    for collection_name, name, problem in problems:
+        print(f"Index {collection_name}.{name} is {problem}")
+    if problems:
+        print("Run `python -m mongo.indexes migrate` to build the missing indexes")
+    return not problems
+
+
+def check_indexes(db):
+    """Warn at startup about indexes the migration has not built yet"""
+    try:
+        return _report_problems(verify(db)["problems"])
+    except Exception as e:
+        print(f"Error verifying indexes: {e}")
+        return False
+
+
+async def acheck_indexes(db):
+    """check_indexes() for a pymongo AsyncDatabase"""
+    try:
+        return _report_problems((await averify(db))["problems"])
+    except Exception as e:
+        print(f"Error verifying indexes: {e}")
+        return False
+
+
+def _find(collection_name, query, sort=None, projection=None, limit=None):
+    command = {"find": collection_name, "filter": query}
+    if sort:
+        command["sort"] = dict(sort)
+    if projection:
+        command["projection"] = projection
+    if limit:
+        command["limit"] = limit
+    return command
+
+
+def _aggregate(collection_name, pipeline):
+    return {"aggregate": collection_name, "pipeline": pipeline, "cursor": {}}
+
+
+def _paged_finds(name, query, unpaged=True):
+    """query unpaged, then its first and a later page in every sort order"""
+    cursors = {"_id": ObjectId(), "updated_at": (datetime.utcnow(), ObjectId())}
+    commands = [(name, _find("tasks", query))] if unpaged else []
+    for sort, after in cursors.items():
+        for page, cursor in (("first page", None), ("next page", after)):
+            commands.append(
+                (
+                    f"{name} by {sort} {page}",
+                    _find(
+                        "tasks",
+                        apply_cursor(query, sort, cursor),
+                        sort_spec(sort),
+                        limit=MAX_PAGE_SIZE,
+                    ),
+                )
+            )
+    return commands
+
+
+def model_queries(user_id="000000000000000000000000", list_id="my-tasks"):
+    """(name, find or aggregate command) for every query shape the models run.
+
+    Queries are built with the same helpers the models use, so keyset
+    pagination, search and aggregation pipelines are explained as they run.
+    """
+    since = datetime.utcnow()
+    user = {"user_id": user_id}
+    text_query, prefix_query = Task._search_queries(user_id, "milk")
+    score = {"score": {"$meta": "textScore"}}
+    completed_in_list = {"listId": list_id, "isCompleted": True}
+    task_ids = [str(ObjectId()), str(ObjectId())]
+    return [
+        ("User.get_user_by_email", _find("users", {"email": "user@example.com"})),
+        (
+            "Task.get_task_by_id",
+            _find("tasks", {"_id": ObjectId(), "user_id": user_id}),
+        ),
+        *_paged_finds("Task.get_tasks", Task._filter_query(user_id, {})),
+        *_paged_finds(
+            "Task.get_tasks list", Task._filter_query(user_id, {"listId": list_id})
+        ),
+        *_paged_finds(
+            "Task.get_important_tasks",
+            Task._filter_query(user_id, {"isImportant": True}),
+        ),
+        *_paged_finds(
+            "Task.get_completed_tasks",
+            Task._filter_query(user_id, {"isCompleted": True}),
+        ),
+        (
+            "Task.search_tasks ranked",
+            _find("tasks", text_query, score, score, SEARCH_RESULT_LIMIT),
+        ),
+        (
+            "Task.search_tasks prefix",
+            _find("tasks", prefix_query, limit=SEARCH_RESULT_LIMIT),
+        ),
+        *_paged_finds(
+            "Task.search_tasks",
+            Task._paged_search_query(user_id, "milk"),
+            unpaged=False,
+        ),
+        (
+            "Task.update_tasks_by_filter list",
+            _find("tasks", Task._filter_query(user_id, completed_in_list)),
+        ),
+        (
+            "Task.update_tasks_by_filter ids",
+            _find("tasks", Task._filter_query(user_id, {"taskIds": task_ids})),
+        ),
+        (
+            "Task.apply_mutations targets",
+            _find(
+                "tasks",
+                Task._mutation_targets_query(
+                    user_id, [{"taskId": task_id} for task_id in task_ids]
+                ),
+            ),
+        ),
+        (
+            "Task.get_list_stats",
+            _aggregate("tasks", Task._list_stats_pipeline(user_id, list_id)),
+        ),
+        (
+            "TaskList.get_all_list_stats",
+            _aggregate("task_lists", TaskList._all_list_stats_pipeline(user_id)),
+        ),
+        (
+            "Task.get_changes",
+            _find("tasks", {**user, "updated_at": {"$gte": since}}),
+        ),
+        (
+            "Task.get_changes tombstones",
+            _find("task_tombstones", {**user, "deleted_at": {"$gte": since}}),
+        ),
+        (
+            "Task.delete_tasks_by_list",
+            _find("tasks", {"list_id": list_id, "user_id": user_id}),
+        ),
+        ("TaskList.get_task_lists", _find("task_lists", user)),
+        (
+            "TaskList.get_default_list_ids",
+            _find("task_lists", {**user, "isDefault": True}),
+        ),
+    ]
+
+
+def _plan_stages(plan):
+    """Yield every winning stage name in an explain document, including those
+    of aggregation cursors and $unionWith sub-pipelines"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for key, value in plan.items():
+            if key != "rejectedPlans":
+                yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from _plan_stages(value)
+
+
+def explain(db):
+    """Explain every model query, returning [(name, stages, is_collection_scan)]"""
+    report = []
+    for name, command in model_queries():
+        plan = db.command("explain", command, verbosity="queryPlanner")
+        stages = list(_plan_stages(plan))
+        report.append((name, stages, "COLLSCAN" in stages))
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage MongoDB indexes")
+    parser.add_argument("command", choices=["migrate", "verify", "explain"])
+    parser.add_argument(
+        "--prune", action="store_true", help="drop indexes not in the plan"
+    )
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGO_URL"))
+    db = client[os.getenv("DATABASE_NAME", "todo_app")]
+    try:
+        if args.command == "migrate":
+            migrate(db, prune=args.prune)
+            return 0
+        if args.command == "verify":
+            report = verify(db)
+            for collection_name, name, problem in report["problems"]:
+                print(f"{collection_name}.{name}: {problem}")
+            for collection_name, name in report["extra"]:
+                print(f"{collection_name}.{name}: not in the index plan")
+            return 1 if report["problems"] else 0
+
+        collection_scans = 0
+        for name, stages, is_collection_scan in explain(db):
+            flag = "COLLSCAN" if is_collection_scan else "ok"
+            print(f"{flag:<9} {name}: {' > '.join(stages)}")
+            collection_scans += is_collection_scan
+        return 1 if collection_scans else 0
+    finally:
+        client.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
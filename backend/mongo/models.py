@@ -1,15 +1,120 @@
-from datetime import datetime
+import re
+import threading
+from datetime import datetime, timedelta
 from typing import Optional
 from bson import ObjectId
 import bcrypt
-from pymongo import MongoClient
+from pymongo import DeleteOne, MongoClient, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from cache import LRUTTLCache
+from .pagination import (
+    DEFAULT_SORT,
+    apply_cursor,
+    build_projection,
+    is_paginated,
+    sort_spec,
+)
+
+# Documents fetched per round trip when streaming large task listings
+STREAM_BATCH_SIZE = 200
+# Documents sent per insert_many call for bulk task creation
+BULK_CHUNK_SIZE = 500
+# How long deletions are remembered for delta sync
+TOMBSTONE_TTL_SECONDS = 30 * 24 * 3600
+# Results returned by a ranked search when no limit is given
+SEARCH_RESULT_LIMIT = 50
+# How long processed Telegram updates are remembered for deduplication
+TELEGRAM_UPDATE_TTL_SECONDS = 86400
+# Claims older than this are presumed abandoned by a crashed worker
+TELEGRAM_CLAIM_TIMEOUT_SECONDS = 300
+
+# Lists every user starts with
+DEFAULT_LISTS = [
+    {
+        "name": "My Day",
+        "icon": "wb_sunny_outlined",
+        "iconColor": 0xFFFFB900,
+        "isDefault": True,
+    },
+    {
+        "name": "Important",
+        "icon": "star_border",
+        "iconColor": 0xFFD13438,
+        "isDefault": True,
+    },
+    {
+        "name": "Tasks",
+        "icon": "home_outlined",
+        "iconColor": 0xFF0078D4,
+        "isDefault": True,
+    },
+]
+
+# Indexes are declared in mongo/indexes.py and built by its migrate command
+
+
+def normalize_title(title):
+    """Lowercase and collapse whitespace, as stored in title_lower for prefix search"""
+    return " ".join(str(title or "").lower().split())
+
+
+def to_stats(total_tasks, completed_tasks):
+    return {
+        "totalTasks": total_tasks,
+        "completedTasks": completed_tasks,
+        "pendingTasks": total_tasks - completed_tasks,
+    }
+
+
+class DataVersion:
+    """Per-user counter bumped after every task and task list write.
+
+    Callers read it before querying, so data returned alongside a version is
+    never older than that version. The epoch changes whenever the counter
+    document is recreated, so versions are never reused.
+    """
+
+    def __init__(self, db):
+        self.collection = db.data_versions
+
+    @staticmethod
+    def _token(doc):
+        return f"{doc['epoch']}.{doc['version']}"
+
+    def current(self, user_id):
+        """Opaque version token for the user's tasks and lists, None on error"""
+        try:
+            doc = self.collection.find_one({"_id": user_id})
+            if doc is None:
+                doc = self.collection.find_one_and_update(
+                    {"_id": user_id},
+                    {"$setOnInsert": {"version": 0, "epoch": str(ObjectId())}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+            return self._token(doc)
+        except Exception as e:
+            print(f"Error getting data version: {e}")
+            return None
+
+    def bump(self, user_id):
+        try:
+            self.collection.update_one(
+                {"_id": user_id},
+                {
+                    "$inc": {"version": 1},
+                    "$setOnInsert": {"epoch": str(ObjectId())},
+                },
+                upsert=True,
+            )
+        except Exception as e:
+            print(f"Error bumping data version: {e}")
 
 
 class User:
     def __init__(self, db):
         self.collection = db.users
-        # Create unique index on email
-        self.collection.create_index("email", unique=True)
 
     def create_user(self, email, password, name=None):
         """Create a new user with hashed password"""
@@ -47,7 +152,6 @@ class User:
         try:
             user = self.collection.find_one({"_id": ObjectId(user_id)})
             if user:
-                user["_id"] = str(user["_id"])
                 # Remove password from response
                 user.pop("password", None)
                 return user
@@ -61,7 +165,6 @@ class User:
         try:
             user = self.collection.find_one({"email": email.lower().strip()})
             if user:
-                user["_id"] = str(user["_id"])
                 user.pop("password", None)
                 return user
             return None
@@ -71,60 +174,139 @@ class User:
 
 
 class Task:
-    def __init__(self, db):
+    version_class = DataVersion
+
+    def __init__(self, db, tombstone_ttl=TOMBSTONE_TTL_SECONDS):
         self.collection = db.tasks
-        # Create indexes for better performance
-        self.collection.create_index("user_id")
-        self.collection.create_index("list_id")
+        self.versions = self.version_class(db)
+        # Deleted task IDs, kept long enough for clients to pick up deletions
+        self.tombstones = db.task_tombstones
+        self.tombstone_ttl = tombstone_ttl
+
+    @staticmethod
+    def _prepare_task(task_data):
+        """Fill in timestamps, defaults and the list_ids array of a new task"""
+        task_data["created_at"] = datetime.utcnow()
+        task_data["updated_at"] = datetime.utcnow()
+
+        task_data["title_lower"] = normalize_title(task_data.get("title"))
+
+        # Ensure required fields
+        if "isCompleted" not in task_data:
+            task_data["isCompleted"] = False
+        if "isImportant" not in task_data:
+            task_data["isImportant"] = False
+
+        # Handle list_ids as array - ensure it's always an array
+        if "list_id" in task_data:
+            # Convert single list_id to array for backward compatibility
+            task_data["list_ids"] = [task_data["list_id"]]
+            del task_data["list_id"]
+        elif "list_ids" not in task_data:
+            # Default to 'my-tasks' if no list specified
+            task_data["list_ids"] = ["my-tasks"]
+        elif not isinstance(task_data["list_ids"], list):
+            # Ensure list_ids is always an array
+            task_data["list_ids"] = [task_data["list_ids"]]
+        return task_data
 
     def create_task(self, task_data):
         """Create a new task with user_id"""
         try:
-            task_data["created_at"] = datetime.utcnow()
-            task_data["updated_at"] = datetime.utcnow()
-
-            # Ensure required fields
-            if "isCompleted" not in task_data:
-                task_data["isCompleted"] = False
-            if "isImportant" not in task_data:
-                task_data["isImportant"] = False
-
-            # Handle list_ids as array - ensure it's always an array
-            if "list_id" in task_data:
-                # Convert single list_id to array for backward compatibility
-                task_data["list_ids"] = [task_data["list_id"]]
-                del task_data["list_id"]
-            elif "list_ids" not in task_data:
-                # Default to 'my-tasks' if no list specified
-                task_data["list_ids"] = ["my-tasks"]
-            elif not isinstance(task_data["list_ids"], list):
-                # Ensure list_ids is always an array
-                task_data["list_ids"] = [task_data["list_ids"]]
-
-            result = self.collection.insert_one(task_data)
+            result = self.collection.insert_one(self._prepare_task(task_data))
+            self.versions.bump(task_data.get("user_id"))
             return str(result.inserted_id)
         except Exception as e:
             print(f"Error creating task: {e}")
             return None
 
-    def get_tasks(self, user_id, list_id=None):
+    def create_tasks(self, tasks_data, chunk_size=BULK_CHUNK_SIZE):
+        """Insert many tasks in unordered insert_many chunks.
+
+        Returns one {"taskId": ...} or {"error": ...} entry per input task.
+        """
+        results = []
+        for start in range(0, len(tasks_data), chunk_size):
+            chunk = [
+                self._prepare_task(dict(task_data, _id=ObjectId()))
+                for task_data in tasks_data[start : start + chunk_size]
+            ]
+            chunk_results = [{"taskId": str(task["_id"])} for task in chunk]
+            try:
+                self.collection.insert_many(chunk, ordered=False)
+            except BulkWriteError as e:
+                for error in e.details.get("writeErrors", []):
+                    chunk_results[error["index"]] = {"error": error["errmsg"]}
+            except Exception as e:
+                print(f"Error creating tasks: {e}")
+                chunk_results = [{"error": str(e)} for _ in chunk]
+            results.extend(chunk_results)
+        for user_id in self._created_user_ids(tasks_data, results):
+            self.versions.bump(user_id)
+        return results
+
+    @staticmethod
+    def _created_user_ids(tasks_data, results):
+        """Users that gained at least one task in a create_tasks call"""
+        return {
+            task_data.get("user_id")
+            for task_data, result in zip(tasks_data, results)
+            if "taskId" in result
+        }
+
+    @staticmethod
+    def _normalize_task(task, fill_lists=True):
+        """Drop internal fields and add the backward compatible list_id field"""
+        task.pop("title_lower", None)
+        if "list_ids" in task and task["list_ids"]:
+            task["list_id"] = task["list_ids"][0]
+        elif "list_id" not in task and fill_lists:
+            task["list_id"] = "my-tasks"
+            task["list_ids"] = ["my-tasks"]
+        return task
+
+    def _find_tasks(
+        self, query, limit=None, after=None, sort=None, fields=None, stream=False
+    ):
+        """Run a task query with optional keyset pagination and field projection.
+
+        With stream=True a generator is returned that normalizes documents as
+        the cursor fetches them, instead of materializing the whole result.
+        """
+        projection = build_projection(fields, sort or DEFAULT_SORT)
+        if is_paginated(limit, after, sort):
+            sort = sort or DEFAULT_SORT
+            cursor = self.collection.find(
+                apply_cursor(query, sort, after), projection
+            ).sort(sort_spec(sort))
+            if limit:
+                cursor = cursor.limit(limit)
+        else:
+            cursor = self.collection.find(query, projection)
+        fill_lists = not fields or "list_ids" in fields
+        if stream:
+            cursor = cursor.batch_size(STREAM_BATCH_SIZE)
+            return (self._normalize_task(task, fill_lists) for task in cursor)
+        return [self._normalize_task(task, fill_lists) for task in cursor]
+
+    def get_tasks(
+        self,
+        user_id,
+        list_id=None,
+        limit=None,
+        after=None,
+        sort=None,
+        fields=None,
+        stream=False,
+    ):
         """Get tasks for a user, optionally filtered by list_id"""
         try:
             query = {"user_id": user_id}
             if list_id:
                 # Check if list_id is in the list_ids array
-                query["list_ids"] = {"$in": [list_id]}
-
-            tasks = list(self.collection.find(query))
-            for task in tasks:
-                task["_id"] = str(task["_id"])
-                # Ensure backward compatibility - add list_id field from first list_ids entry
-                if "list_ids" in task and task["list_ids"]:
-                    task["list_id"] = task["list_ids"][0]
-                elif "list_id" not in task:
-                    task["list_id"] = "my-tasks"
-                    task["list_ids"] = ["my-tasks"]
-            return tasks
+                query["list_ids"] = list_id
+
+            return self._find_tasks(query, limit, after, sort, fields, stream)
         except Exception as e:
             print(f"Error getting tasks: {e}")
             return []
@@ -136,39 +318,41 @@ class Task:
                 {"_id": ObjectId(task_id), "user_id": user_id}
             )
             if task:
-                task["_id"] = str(task["_id"])
-                # Ensure backward compatibility
-                if "list_ids" in task and task["list_ids"]:
-                    task["list_id"] = task["list_ids"][0]
-                elif "list_id" not in task:
-                    task["list_id"] = "my-tasks"
-                    task["list_ids"] = ["my-tasks"]
-                return task
+                return self._normalize_task(task)
             return None
         except Exception as e:
             print(f"Error getting task: {e}")
             return None
 
+    @staticmethod
+    def _prepare_update(update_data):
+        """Fill in updated_at and derived fields of a task update"""
+        update_data["updated_at"] = datetime.utcnow()
+        if "title" in update_data:
+            update_data["title_lower"] = normalize_title(update_data["title"])
+
+        # Handle list_ids updates
+        if "list_id" in update_data:
+            # Convert single list_id to array for backward compatibility
+            if "list_ids" not in update_data:
+                update_data["list_ids"] = [update_data["list_id"]]
+            del update_data["list_id"]
+        elif "list_ids" in update_data and not isinstance(
+            update_data["list_ids"], list
+        ):
+            # Ensure list_ids is always an array
+            update_data["list_ids"] = [update_data["list_ids"]]
+        return update_data
+
     def update_task(self, task_id, user_id, update_data):
         """Update a task"""
         try:
-            update_data["updated_at"] = datetime.utcnow()
-
-            # Handle list_ids updates
-            if "list_id" in update_data:
-                # Convert single list_id to array for backward compatibility
-                if "list_ids" not in update_data:
-                    update_data["list_ids"] = [update_data["list_id"]]
-                del update_data["list_id"]
-            elif "list_ids" in update_data and not isinstance(
-                update_data["list_ids"], list
-            ):
-                # Ensure list_ids is always an array
-                update_data["list_ids"] = [update_data["list_ids"]]
-
             result = self.collection.update_one(
-                {"_id": ObjectId(task_id), "user_id": user_id}, {"$set": update_data}
+                {"_id": ObjectId(task_id), "user_id": user_id},
+                {"$set": self._prepare_update(update_data)},
             )
+            if result.modified_count > 0:
+                self.versions.bump(user_id)
             return result.modified_count > 0
         except Exception as e:
             print(f"Error updating task: {e}")
@@ -180,6 +364,9 @@ class Task:
             result = self.collection.delete_one(
                 {"_id": ObjectId(task_id), "user_id": user_id}
             )
+            if result.deleted_count > 0:
+                self._record_tombstones([ObjectId(task_id)], user_id)
+                self.versions.bump(user_id)
             return result.deleted_count > 0
         except Exception as e:
             print(f"Error deleting task: {e}")
@@ -192,6 +379,9 @@ class Task:
             result = self.collection.delete_many(
                 {"_id": {"$in": object_ids}, "user_id": user_id}
             )
+            if result.deleted_count > 0:
+                self._record_tombstones(object_ids, user_id)
+                self.versions.bump(user_id)
             return result.deleted_count
         except Exception as e:
             print(f"Error deleting multiple tasks: {e}")
@@ -201,14 +391,322 @@ class Task:
         """Add a task to an additional list"""
         try:
             result = self.collection.update_one(
-                {"_id": ObjectId(task_id), "user_id": user_id},
-                {"$addToSet": {"list_ids": list_id}},
+                {
+                    "_id": ObjectId(task_id),
+                    "user_id": user_id,
+                    "list_ids": {"$ne": list_id},
+                },
+                {
+                    "$addToSet": {"list_ids": list_id},
+                    "$set": {"updated_at": datetime.utcnow()},
+                },
             )
+            if result.modified_count > 0:
+                self.versions.bump(user_id)
             return result.modified_count > 0
         except Exception as e:
             print(f"Error adding task to list: {e}")
             return False
 
+    def add_tasks_to_lists(self, task_ids, user_id, list_ids):
+        """Add several tasks to one or more lists with a single update"""
+        if not task_ids or not list_ids:
+            return {"matchedCount": 0, "modifiedCount": 0}
+        # The pipeline update only bumps updated_at on tasks that gain a list
+        return self.update_tasks_by_filter(
+            user_id, {"taskIds": task_ids}, {}, add_list_ids=list_ids
+        )
+
+    @staticmethod
+    def _filter_query(user_id, task_filter):
+        """Build a task query from a listId/isCompleted/isImportant/taskIds filter"""
+        query = {"user_id": user_id}
+        if task_filter.get("listId"):
+            query["list_ids"] = task_filter["listId"]
+        if "isCompleted" in task_filter:
+            query["isCompleted"] = task_filter["isCompleted"]
+        if "isImportant" in task_filter:
+            query["isImportant"] = task_filter["isImportant"]
+        if "taskIds" in task_filter:
+            query["_id"] = {
+                "$in": [
+                    ObjectId(task_id)
+                    for task_id in task_filter["taskIds"]
+                    if ObjectId.is_valid(task_id)
+                ]
+            }
+        return query
+
+    @staticmethod
+    def _filter_update_pipeline(set_fields, add_list_ids=(), remove_list_ids=()):
+        """Build the update_many pipeline for update_tasks_by_filter, or None if
+        there is nothing to change"""
+        list_ids = {"$ifNull": ["$list_ids", []]}
+        if remove_list_ids:
+            list_ids = {
+                "$filter": {
+                    "input": list_ids,
+                    "as": "listId",
+                    "cond": {
+                        "$not": {
+                            "$in": ["$$listId", {"$literal": list(remove_list_ids)}]
+                        }
+                    },
+                }
+            }
+        if add_list_ids:
+            list_ids = {
+                "$concatArrays": [
+                    list_ids,
+                    {
+                        "$filter": {
+                            "input": {"$literal": list(add_list_ids)},
+                            "as": "listId",
+                            "cond": {"$not": {"$in": ["$$listId", list_ids]}},
+                        }
+                    },
+                ]
+            }
+        # Never leave a task without any list
+        list_ids = {"$cond": [{"$eq": [{"$size": list_ids}, 0]}, "$list_ids", list_ids]}
+
+        new_values = {field: {"$literal": value} for field, value in set_fields.items()}
+        if add_list_ids or remove_list_ids:
+            new_values["list_ids"] = list_ids
+
+        if not new_values:
+            return None
+
+        changed = {
+            "$or": [
+                {"$ne": [f"${field}", value]} for field, value in new_values.items()
+            ]
+        }
+        return [
+            {"$set": {"_changed": changed}},
+            {
+                "$set": {
+                    **new_values,
+                    "updated_at": {
+                        "$cond": ["$_changed", datetime.utcnow(), "$updated_at"]
+                    },
+                }
+            },
+            {"$project": {"_changed": 0}},
+        ]
+
+    def update_tasks_by_filter(
+        self, user_id, task_filter, set_fields, add_list_ids=(), remove_list_ids=()
+    ):
+        """Apply one restricted update to every task matching a filter.
+
+        Runs as a single pipeline update_many so list membership can be moved
+        in the same write. updated_at is only bumped on tasks that change, so
+        modifiedCount reflects real changes.
+        """
+        try:
+            pipeline = self._filter_update_pipeline(
+                set_fields, add_list_ids, remove_list_ids
+            )
+            if pipeline is None:
+                return {"matchedCount": 0, "modifiedCount": 0}
+            result = self.collection.update_many(
+                self._filter_query(user_id, task_filter), pipeline
+            )
+            if result.modified_count > 0:
+                self.versions.bump(user_id)
+            return {
+                "matchedCount": result.matched_count,
+                "modifiedCount": result.modified_count,
+            }
+        except Exception as e:
+            print(f"Error updating tasks by filter: {e}")
+            return None
+
+    def _mutation_request(self, user_id, mutation):
+        """Translate one validated sync mutation into a bulk_write request"""
+        op = mutation["op"]
+        if op == "create":
+            # An upsert rather than an insert, so retrying a batch whose
+            # response was lost does not fail on the client's _id
+            task = self._prepare_task(mutation["task"])
+            return UpdateOne(
+                {"_id": task["_id"], "user_id": user_id},
+                {
+                    "$setOnInsert": {
+                        key: value
+                        for key, value in task.items()
+                        if key not in ("_id", "user_id")
+                    }
+                },
+                upsert=True,
+            )
+
+        task_filter = {"_id": ObjectId(mutation["taskId"]), "user_id": user_id}
+        if op == "delete":
+            return DeleteOne(task_filter)
+
+        update = {"$set": {"updated_at": datetime.utcnow()}}
+        if op == "update":
+            update["$set"].update(mutation["changes"])
+            if "title" in mutation["changes"]:
+                update["$set"]["title_lower"] = normalize_title(
+                    mutation["changes"]["title"]
+                )
+        elif op == "complete":
+            update["$set"]["isCompleted"] = mutation["value"]
+        elif op == "important":
+            update["$set"]["isImportant"] = mutation["value"]
+            if mutation.get("listId"):
+                list_op = "$addToSet" if mutation["value"] else "$pull"
+                update[list_op] = {"list_ids": mutation["listId"]}
+        elif op == "addToList":
+            update["$addToSet"] = {"list_ids": mutation["listId"]}
+        elif op == "removeFromList":
+            # Don't remove the only list - would orphan the task
+            task_filter["list_ids.1"] = {"$exists": True}
+            update["$pull"] = {"list_ids": mutation["listId"]}
+        else:
+            raise ValueError(f"Unknown mutation: {op}")
+        return UpdateOne(task_filter, update)
+
+    @staticmethod
+    def _failed_mutation_statuses(error, count):
+        """Per-mutation statuses after an ordered bulk_write stopped on error"""
+        statuses = [{"status": "applied"} for _ in range(count)]
+        write_errors = error.details.get("writeErrors", [])
+        failed = write_errors[0]["index"] if write_errors else 0
+        statuses[failed] = {
+            "status": "error",
+            "error": write_errors[0]["errmsg"] if write_errors else str(error),
+        }
+        for index in range(failed + 1, count):
+            statuses[index] = {"status": "skipped"}
+        return statuses
+
+    @staticmethod
+    def _mutation_targets_query(user_id, mutations):
+        return {
+            "_id": {"$in": [ObjectId(mutation["taskId"]) for mutation in mutations]},
+            "user_id": user_id,
+        }
+
+    def _mutation_targets(self, user_id, mutations):
+        """{task ID: list_ids} of the user's tasks a batch refers to"""
+        return {
+            str(task["_id"]): task.get("list_ids", [])
+            for task in self.collection.find(
+                self._mutation_targets_query(user_id, mutations), {"list_ids": 1}
+            )
+        }
+
+    @staticmethod
+    def _unmatched_mutations(mutations, targets):
+        """Replay a batch over its targets, returning per mutation None if its
+        write will match a task, or the status to report instead"""
+        tasks = {task_id: list(list_ids) for task_id, list_ids in targets.items()}
+        unmatched = []
+        for mutation in mutations:
+            op = mutation["op"]
+            list_ids = tasks.get(mutation["taskId"])
+            if op == "create":
+                if list_ids is None:
+                    tasks[mutation["taskId"]] = list(mutation["task"]["list_ids"])
+                unmatched.append(None)
+                continue
+            if list_ids is None:
+                unmatched.append({"status": "notFound"})
+                continue
+            if op == "removeFromList" and len(list_ids) < 2:
+                unmatched.append(
+                    {
+                        "status": "error",
+                        "error": "Cannot remove a task from its only list",
+                    }
+                )
+                continue
+
+            if op == "delete":
+                del tasks[mutation["taskId"]]
+            elif op == "addToList" or (
+                op == "important" and mutation.get("listId") and mutation["value"]
+            ):
+                if mutation["listId"] not in list_ids:
+                    list_ids.append(mutation["listId"])
+            elif op == "removeFromList" or (
+                op == "important" and mutation.get("listId")
+            ):
+                list_ids[:] = [
+                    list_id for list_id in list_ids if list_id != mutation["listId"]
+                ]
+            unmatched.append(None)
+        return unmatched
+
+    @staticmethod
+    def _matched_statuses(statuses, unmatched):
+        return [
+            miss if miss is not None and status["status"] == "applied" else status
+            for status, miss in zip(statuses, unmatched)
+        ]
+
+    @staticmethod
+    def _deleted_ids(mutations, statuses):
+        return [
+            ObjectId(mutation["taskId"])
+            for mutation, status in zip(mutations, statuses)
+            if mutation["op"] == "delete" and status["status"] == "applied"
+        ]
+
+    def apply_mutations(self, user_id, mutations):
+        """Apply an ordered batch of validated mutations with one ordered bulk_write.
+
+        Returns one {"status": "applied" | "notFound" | "error" | "skipped"}
+        entry per mutation; everything after the first failing write is skipped.
+        bulk_write only reports totals, so whether each write matched a task is
+        worked out by replaying the batch over its targets read just before it.
+        """
+        if not mutations:
+            return []
+        statuses = [{"status": "applied"} for _ in mutations]
+        unmatched = [None for _ in mutations]
+        try:
+            requests = [
+                self._mutation_request(user_id, mutation) for mutation in mutations
+            ]
+            unmatched = self._unmatched_mutations(
+                mutations, self._mutation_targets(user_id, mutations)
+            )
+            self.collection.bulk_write(requests, ordered=True)
+        except BulkWriteError as e:
+            statuses = self._failed_mutation_statuses(e, len(mutations))
+        except Exception as e:
+            print(f"Error applying mutations: {e}")
+            statuses = [{"status": "error", "error": str(e)} for _ in mutations]
+        statuses = self._matched_statuses(statuses, unmatched)
+
+        deleted_ids = self._deleted_ids(mutations, statuses)
+        if deleted_ids:
+            self._record_tombstones(deleted_ids, user_id)
+        if any(status["status"] == "applied" for status in statuses):
+            self.versions.bump(user_id)
+        return statuses
+
+    def get_tasks_by_ids(self, task_ids, user_id):
+        """Get the tasks with the given IDs that belong to the user"""
+        try:
+            object_ids = [
+                ObjectId(task_id) for task_id in task_ids if ObjectId.is_valid(task_id)
+            ]
+            return [
+                self._normalize_task(task)
+                for task in self.collection.find(
+                    {"_id": {"$in": object_ids}, "user_id": user_id}
+                )
+            ]
+        except Exception as e:
+            print(f"Error getting tasks by IDs: {e}")
+            return []
+
     def remove_task_from_list(self, task_id, user_id, list_id):
         """Remove a task from a specific list (but keep in other lists)"""
         try:
@@ -223,75 +721,266 @@ class Task:
                 return False
 
             result = self.collection.update_one(
-                {"_id": ObjectId(task_id), "user_id": user_id},
-                {"$pull": {"list_ids": list_id}},
+                {"_id": ObjectId(task_id), "user_id": user_id, "list_ids": list_id},
+                {
+                    "$pull": {"list_ids": list_id},
+                    "$set": {"updated_at": datetime.utcnow()},
+                },
             )
+            if result.modified_count > 0:
+                self.versions.bump(user_id)
             return result.modified_count > 0
         except Exception as e:
             print(f"Error removing task from list: {e}")
             return False
 
-    def get_important_tasks(self, user_id):
+    def get_important_tasks(
+        self, user_id, limit=None, after=None, sort=None, fields=None, stream=False
+    ):
         """Get all important tasks for a user"""
         try:
-            tasks = list(
-                self.collection.find({"user_id": user_id, "isImportant": True})
+            return self._find_tasks(
+                {"user_id": user_id, "isImportant": True},
+                limit,
+                after,
+                sort,
+                fields,
+                stream,
             )
-            for task in tasks:
-                task["_id"] = str(task["_id"])
-            return tasks
         except Exception as e:
             print(f"Error getting important tasks: {e}")
             return []
 
-    def get_completed_tasks(self, user_id):
+    def get_completed_tasks(
+        self, user_id, limit=None, after=None, sort=None, fields=None, stream=False
+    ):
         """Get all completed tasks for a user"""
         try:
-            tasks = list(
-                self.collection.find({"user_id": user_id, "isCompleted": True})
+            return self._find_tasks(
+                {"user_id": user_id, "isCompleted": True},
+                limit,
+                after,
+                sort,
+                fields,
+                stream,
             )
-            for task in tasks:
-                task["_id"] = str(task["_id"])
-            return tasks
         except Exception as e:
             print(f"Error getting completed tasks: {e}")
             return []
 
-    def search_tasks(self, user_id, search_term):
-        """Search tasks by title for a user"""
+    @staticmethod
+    def _search_queries(user_id, search_term):
+        """Build the (full-word text, title prefix) queries for a search term"""
+        text_query = {"user_id": user_id, "$text": {"$search": search_term}}
+        prefix_query = {
+            "user_id": user_id,
+            "title_lower": {"$regex": "^" + re.escape(normalize_title(search_term))},
+        }
+        return text_query, prefix_query
+
+    @classmethod
+    def _paged_search_query(cls, user_id, search_term):
+        """Query matching both kinds of search hit, for paging in key order"""
+        text_query, prefix_query = cls._search_queries(user_id, search_term)
+        return {"user_id": user_id, "$or": [text_query, prefix_query]}
+
+    @classmethod
+    def _merge_ranked(cls, ranked, prefix_matches, limit, fields=None):
+        """Append prefix matches missing from the text results, up to limit"""
+        seen = {task["_id"] for task in ranked}
+        for task in prefix_matches:
+            if task["_id"] not in seen and len(ranked) < limit:
+                seen.add(task["_id"])
+                ranked.append(task)
+
+        fill_lists = not fields or "list_ids" in fields
+        tasks = []
+        for task in ranked:
+            task.pop("score", None)
+            tasks.append(cls._normalize_task(task, fill_lists))
+        return tasks
+
+    def search_tasks(
+        self,
+        user_id,
+        search_term,
+        limit=None,
+        after=None,
+        sort=None,
+        fields=None,
+        stream=False,
+    ):
+        """Search tasks by title and note for a user.
+
+        Without sort/after, results are ranked: full-word text index matches
+        by score, followed by tasks whose title merely starts with the term.
+        With sort/after, both kinds of match are paged in key order instead.
+        """
         try:
-            tasks = list(
+            text_query, prefix_query = self._search_queries(user_id, search_term)
+            if after is not None or sort is not None:
+                query = self._paged_search_query(user_id, search_term)
+                return self._find_tasks(query, limit, after, sort, fields, stream)
+
+            limit = limit or SEARCH_RESULT_LIMIT
+            projection = build_projection(fields) or {}
+            ranked = list(
                 self.collection.find(
-                    {
-                        "user_id": user_id,
-                        "title": {"$regex": search_term, "$options": "i"},
-                    }
+                    text_query, {**projection, "score": {"$meta": "textScore"}}
                 )
+                .sort([("score", {"$meta": "textScore"})])
+                .limit(limit)
             )
-            for task in tasks:
-                task["_id"] = str(task["_id"])
-            return tasks
+            prefix_matches = []
+            if len(ranked) < limit:
+                prefix_matches = list(
+                    self.collection.find(prefix_query, projection or None).limit(limit)
+                )
+
+            tasks = self._merge_ranked(ranked, prefix_matches, limit, fields)
+            return iter(tasks) if stream else tasks
         except Exception as e:
             print(f"Error searching tasks: {e}")
             return []
 
+    def get_task_titles(self, user_id):
+        """Yield (task_id, title) for every task of a user, for the fuzzy index"""
+        cursor = self.collection.find(
+            {"user_id": user_id}, {"title": 1}, batch_size=STREAM_BATCH_SIZE
+        )
+        for task in cursor:
+            yield str(task["_id"]), task.get("title", "")
+
+    def backfill_search_fields(self, chunk_size=BULK_CHUNK_SIZE):
+        """Populate title_lower on tasks created before it existed"""
+        try:
+            # Normalized in Python rather than with $toLower/$trim, so inner
+            # whitespace collapses exactly as in normalize_title
+            modified = 0
+            requests = []
+            for task in self.collection.find(
+                {"title_lower": {"$exists": False}}, {"title": 1}
+            ):
+                requests.append(
+                    UpdateOne(
+                        {"_id": task["_id"]},
+                        {"$set": {"title_lower": normalize_title(task.get("title"))}},
+                    )
+                )
+                if len(requests) == chunk_size:
+                    modified += self.collection.bulk_write(
+                        requests, ordered=False
+                    ).modified_count
+                    requests = []
+            if requests:
+                modified += self.collection.bulk_write(
+                    requests, ordered=False
+                ).modified_count
+            return modified
+        except Exception as e:
+            print(f"Error backfilling search fields: {e}")
+            return 0
+
+    @staticmethod
+    def _list_stats_pipeline(user_id, list_id):
+        return [
+            {"$match": {"user_id": user_id, "list_ids": list_id}},
+            {
+                "$group": {
+                    "_id": None,
+                    "totalTasks": {"$sum": 1},
+                    "completedTasks": {
+                        "$sum": {"$cond": [{"$eq": ["$isCompleted", True]}, 1, 0]}
+                    },
+                }
+            },
+        ]
+
+    def get_list_stats(self, user_id, list_id):
+        """Count total and completed tasks in a list with a single aggregation"""
+        try:
+            pipeline = self._list_stats_pipeline(user_id, list_id)
+            result = next(self.collection.aggregate(pipeline), None)
+            if result is None:
+                return to_stats(0, 0)
+            return to_stats(result["totalTasks"], result["completedTasks"])
+        except Exception as e:
+            print(f"Error getting list stats: {e}")
+            return None
+
     def delete_tasks_by_list(self, list_id, user_id):
         """Delete all tasks in a specific list for a user"""
         try:
+            query = {"list_id": list_id, "user_id": user_id}
+            object_ids = [
+                task["_id"] for task in self.collection.find(query, {"_id": 1})
+            ]
+            if not object_ids:
+                return 0
             result = self.collection.delete_many(
-                {"list_id": list_id, "user_id": user_id}
+                {"_id": {"$in": object_ids}, "user_id": user_id}
             )
+            self._record_tombstones(object_ids, user_id)
+            self.versions.bump(user_id)
             return result.deleted_count
         except Exception as e:
             print(f"Error deleting tasks by list: {e}")
             return 0
 
+    @staticmethod
+    def _tombstone_requests(object_ids, user_id):
+        deleted_at = datetime.utcnow()
+        return [
+            UpdateOne(
+                {"_id": object_id},
+                {"$set": {"user_id": user_id, "deleted_at": deleted_at}},
+                upsert=True,
+            )
+            for object_id in object_ids
+        ]
+
+    def _record_tombstones(self, object_ids, user_id):
+        """Remember deleted task IDs so delta sync can propagate deletions"""
+        try:
+            self.tombstones.bulk_write(
+                self._tombstone_requests(object_ids, user_id), ordered=False
+            )
+        except Exception as e:
+            print(f"Error recording tombstones: {e}")
+
+    def get_changes(self, user_id, since):
+        """Get tasks changed and task IDs deleted at or after since"""
+        try:
+            tasks = [
+                self._normalize_task(task)
+                for task in self.collection.find(
+                    {"user_id": user_id, "updated_at": {"$gte": since}}
+                )
+            ]
+            deleted_task_ids = [
+                str(tombstone["_id"])
+                for tombstone in self.tombstones.find(
+                    {"user_id": user_id, "deleted_at": {"$gte": since}}, {"_id": 1}
+                )
+            ]
+            return {"tasks": tasks, "deletedTaskIds": deleted_task_ids}
+        except Exception as e:
+            print(f"Error getting task changes: {e}")
+            return None
+
 
 class TaskList:
-    def __init__(self, db):
+    version_class = DataVersion
+
+    def __init__(
+        self, db, default_list_cache_size=10000, default_list_cache_ttl=300
+    ):
         self.collection = db.task_lists
-        # Create index for better performance
-        self.collection.create_index("user_id")
+        self.versions = self.version_class(db)
+        # Per-user {list name: list ID} map of the default lists
+        self.default_list_cache = LRUTTLCache(
+            maxsize=default_list_cache_size, ttl=default_list_cache_ttl
+        )
 
     def create_task_list(self, list_data):
         """Create a new task list with user_id"""
@@ -304,6 +993,9 @@ class TaskList:
                 list_data["isDefault"] = False
 
             result = self.collection.insert_one(list_data)
+            if list_data["isDefault"]:
+                self.default_list_cache.invalidate(list_data.get("user_id"))
+            self.versions.bump(list_data.get("user_id"))
             return str(result.inserted_id)
         except Exception as e:
             print(f"Error creating task list: {e}")
@@ -316,10 +1008,7 @@ class TaskList:
             if default_only:
                 query["isDefault"] = True
 
-            lists = list(self.collection.find(query))
-            for task_list in lists:
-                task_list["_id"] = str(task_list["_id"])
-            return lists
+            return list(self.collection.find(query))
         except Exception as e:
             print(f"Error getting task lists: {e}")
             return []
@@ -327,13 +1016,9 @@ class TaskList:
     def get_task_list_by_id(self, list_id, user_id):
         """Get a specific task list by ID and user_id"""
         try:
-            task_list = self.collection.find_one(
+            return self.collection.find_one(
                 {"_id": ObjectId(list_id), "user_id": user_id}
             )
-            if task_list:
-                task_list["_id"] = str(task_list["_id"])
-                return task_list
-            return None
         except Exception as e:
             print(f"Error getting task list: {e}")
             return None
@@ -345,6 +1030,9 @@ class TaskList:
             result = self.collection.update_one(
                 {"_id": ObjectId(list_id), "user_id": user_id}, {"$set": update_data}
             )
+            self.default_list_cache.invalidate(user_id)
+            if result.modified_count > 0:
+                self.versions.bump(user_id)
             return result.modified_count > 0
         except Exception as e:
             print(f"Error updating task list: {e}")
@@ -365,6 +1053,9 @@ class TaskList:
                     "isDefault": {"$ne": True},  # Extra safety check
                 }
             )
+            self.default_list_cache.invalidate(user_id)
+            if result.deleted_count > 0:
+                self.versions.bump(user_id)
             return result.deleted_count > 0
         except Exception as e:
             print(f"Error deleting task list: {e}")
@@ -373,37 +1064,224 @@ class TaskList:
     def create_default_lists(self, user_id):
         """Create default lists for a new user"""
         try:
-            default_lists = [
-                {
-                    "name": "My Day",
-                    "icon": "wb_sunny_outlined",
-                    "iconColor": 0xFFFFB900,
-                    "isDefault": True,
-                    "user_id": user_id,
-                },
-                {
-                    "name": "Important",
-                    "icon": "star_border",
-                    "iconColor": 0xFFD13438,
-                    "isDefault": True,
-                    "user_id": user_id,
-                },
-                {
-                    "name": "Tasks",
-                    "icon": "home_outlined",
-                    "iconColor": 0xFF0078D4,
-                    "isDefault": True,
-                    "user_id": user_id,
-                },
-            ]
-
             created_ids = []
-            for list_data in default_lists:
-                list_id = self.create_task_list(list_data)
+            for list_data in DEFAULT_LISTS:
+                list_id = self.create_task_list(dict(list_data, user_id=user_id))
                 if list_id:
                     created_ids.append(list_id)
 
+            self.default_list_cache.invalidate(user_id)
             return created_ids
         except Exception as e:
             print(f"Error creating default lists: {e}")
             return []
+
+    @staticmethod
+    def _all_list_stats_pipeline(user_id):
+        completed_sum = {"$sum": {"$cond": [{"$eq": ["$isCompleted", True]}, 1, 0]}}
+        return [
+            {"$match": {"user_id": user_id}},
+            # One marker document per list so that empty lists are reported too
+            {
+                "$project": {
+                    "_id": 0,
+                    "list_ids": [{"$toString": "$_id"}],
+                    "isList": {"$literal": True},
+                }
+            },
+            {
+                "$unionWith": {
+                    "coll": "tasks",
+                    "pipeline": [
+                        {"$match": {"user_id": user_id}},
+                        {
+                            "$project": {
+                                "_id": 0,
+                                "list_ids": 1,
+                                "isCompleted": 1,
+                                "isImportant": 1,
+                            }
+                        },
+                    ],
+                }
+            },
+            {
+                "$facet": {
+                    "lists": [
+                        {"$unwind": "$list_ids"},
+                        {
+                            "$group": {
+                                "_id": "$list_ids",
+                                "isList": {"$max": "$isList"},
+                                "totalTasks": {"$sum": {"$cond": ["$isList", 0, 1]}},
+                                "completedTasks": completed_sum,
+                            }
+                        },
+                        {"$match": {"isList": True}},
+                    ],
+                    "important": [
+                        {"$match": {"isImportant": True}},
+                        {
+                            "$group": {
+                                "_id": None,
+                                "totalTasks": {"$sum": 1},
+                                "completedTasks": completed_sum,
+                            }
+                        },
+                    ],
+                    "completed": [
+                        {"$match": {"isCompleted": True}},
+                        {"$count": "totalTasks"},
+                    ],
+                }
+            },
+        ]
+
+    @staticmethod
+    def _all_list_stats_result(result):
+        important = result["important"][0] if result["important"] else {}
+        completed = result["completed"][0] if result["completed"] else {}
+        return {
+            "lists": {
+                group["_id"]: to_stats(group["totalTasks"], group["completedTasks"])
+                for group in result["lists"]
+            },
+            "important": to_stats(
+                important.get("totalTasks", 0), important.get("completedTasks", 0)
+            ),
+            "completed": to_stats(
+                completed.get("totalTasks", 0), completed.get("totalTasks", 0)
+            ),
+        }
+
+    def get_all_list_stats(self, user_id):
+        """Count tasks for every list of a user plus the Important and Completed
+        views, in one aggregation over the user's lists and tasks"""
+        try:
+            pipeline = self._all_list_stats_pipeline(user_id)
+            result = next(self.collection.aggregate(pipeline))
+            return self._all_list_stats_result(result)
+        except Exception as e:
+            print(f"Error getting all list stats: {e}")
+            return None
+
+    def get_default_list_ids(self, user_id):
+        """Get a {list name: list ID} map of the user's default lists (cached)"""
+        default_list_ids = self.default_list_cache.get(user_id)
+        if default_list_ids is not None:
+            return default_list_ids
+
+        try:
+            default_list_ids = {
+                task_list["name"]: str(task_list["_id"])
+                for task_list in self.collection.find(
+                    {"user_id": user_id, "isDefault": True}, {"name": 1}
+                )
+            }
+            self.default_list_cache.set(user_id, default_list_ids)
+            return default_list_ids
+        except Exception as e:
+            print(f"Error getting default list IDs: {e}")
+            return {}
+
+
+class TelegramUpdateLog:
+    """Telegram updates by update_id, so redeliveries are extracted only once.
+
+    A delivery claims its update_id before extracting, and only the claimant
+    calls the LLM; other deliveries get the stored result, or None while the
+    claimant is still working on it.
+    """
+
+    def __init__(self, db, ttl_seconds=TELEGRAM_UPDATE_TTL_SECONDS, cache_size=10000):
+        self.collection = db.telegram_updates
+        # In-memory front for the hot redelivery window
+        self.result_cache = LRUTTLCache(maxsize=cache_size, ttl=ttl_seconds)
+        self._lock = threading.Lock()
+        self.duplicates = 0
+
+    def _count_duplicate(self):
+        with self._lock:
+            self.duplicates += 1
+
+    @staticmethod
+    def _claim_request(update_id):
+        """Upsert that inserts a claim, or takes over an abandoned one.
+
+        For an update already processed or freshly claimed the filter matches
+        nothing, so the upsert's insert fails on the duplicate _id.
+        """
+        now = datetime.utcnow()
+        stale = now - timedelta(seconds=TELEGRAM_CLAIM_TIMEOUT_SECONDS)
+        return (
+            {
+                "_id": update_id,
+                "result": {"$exists": False},
+                "claimed_at": {"$lt": stale},
+            },
+            {"$set": {"claimed_at": now}, "$setOnInsert": {"created_at": now}},
+        )
+
+    def claim(self, update_id):
+        """Take an update for processing, False if it is a duplicate delivery"""
+        if self.result_cache.get(update_id) is not None:
+            self._count_duplicate()
+            return False
+        try:
+            query, update = self._claim_request(update_id)
+            self.collection.update_one(query, update, upsert=True)
+            return True
+        except DuplicateKeyError:
+            self._count_duplicate()
+            return False
+        except Exception as e:
+            # Rather extract twice than drop the update
+            print(f"Error claiming telegram update: {e}")
+            return True
+
+    def release(self, update_id):
+        """Drop an unfinished claim so a redelivery is processed again"""
+        try:
+            self.collection.delete_one({"_id": update_id, "result": {"$exists": False}})
+            return True
+        except Exception as e:
+            print(f"Error releasing telegram update: {e}")
+            return False
+
+    def get_result(self, update_id):
+        """Get the stored extraction result of an already processed update"""
+        try:
+            result = self.result_cache.get(update_id)
+            if result is None:
+                update = self.collection.find_one({"_id": update_id}, {"result": 1})
+                if update is None or "result" not in update:
+                    return None
+                result = update["result"]
+                self.result_cache.set(update_id, result)
+            return result
+        except Exception as e:
+            print(f"Error getting telegram update: {e}")
+            return None
+
+    def save_result(self, update_id, result):
+        """Record the extraction result of a processed update"""
+        try:
+            self.collection.update_one(
+                {"_id": update_id},
+                {
+                    "$set": {"result": result},
+                    "$unset": {"claimed_at": ""},
+                    "$setOnInsert": {"created_at": datetime.utcnow()},
+                },
+                upsert=True,
+            )
+            self.result_cache.set(update_id, result)
+            return True
+        except Exception as e:
+            print(f"Error saving telegram update: {e}")
+            return False
+
+    def stats(self):
+        with self._lock:
+            duplicates = self.duplicates
+        return {"duplicates": duplicates, "cache": self.result_cache.stats()}
@@ -0,0 +1,114 @@
+import base64
+import re
+from datetime import datetime
+from bson import ObjectId
+
+# Sort key -> direction. "_id" pages in creation order, "updated_at" pages
+# most recently changed first. Both are tie-broken on _id so keys are unique.
+SORT_FIELDS = {"_id": 1, "updated_at": -1}
+DEFAULT_SORT = "_id"
+MAX_PAGE_SIZE = 500
+
+_FIELD_NAME = re.compile(r"^[A-Za-z][A-Za-z0-9_]*$")
+
+
+def parse_page_args(args):
+    """Parse limit/after/sort/fields query arguments, raising ValueError on bad input"""
+    page = {"limit": None, "after": None, "sort": None, "fields": None}
+
+    sort = args.get("sort")
+    if sort:
+        if sort not in SORT_FIELDS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_FIELDS)}")
+        page["sort"] = sort
+
+    limit = args.get("limit")
+    if limit:
+        try:
+            page["limit"] = int(limit)
+        except ValueError:
+            raise ValueError("limit must be an integer")
+        if not 1 <= page["limit"] <= MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {MAX_PAGE_SIZE}")
+
+    after = args.get("after")
+    if after:
+        page["after"] = decode_cursor(after, page["sort"] or DEFAULT_SORT)
+
+    fields = args.get("fields")
+    if fields:
+        page["fields"] = [field.strip() for field in fields.split(",") if field.strip()]
+        for field in page["fields"]:
+            if not _FIELD_NAME.match(field):
+                raise ValueError(f"Invalid field name: {field}")
+
+    return page
+
+
+def is_paginated(limit=None, after=None, sort=None):
+    return limit is not None or after is not None or sort is not None
+
+
+def build_projection(fields, sort=None):
+    """Build a find() projection, always keeping _id and the sort key"""
+    if not fields:
+        return None
+    projection = {field: 1 for field in fields}
+    if sort and sort != "_id":
+        projection[sort] = 1
+    return projection
+
+
+def sort_spec(sort):
+    direction = SORT_FIELDS[sort]
+    if sort == "_id":
+        return [("_id", direction)]
+    return [(sort, direction), ("_id", direction)]
+
+
+def apply_cursor(query, sort, after):
+    """Restrict query to documents strictly after the decoded cursor"""
+    if after is None:
+        return query
+    op = "$gt" if SORT_FIELDS[sort] == 1 else "$lt"
+    if sort == "_id":
+        keyset = {"_id": {op: after}}
+    else:
+        value, last_id = after
+        keyset = {
+            "$or": [
+                {sort: {op: value}},
+                {sort: value, "_id": {op: last_id}},
+            ]
+        }
+    return {"$and": [query, keyset]}
+
+
+def encode_cursor(doc, sort):
+    """Build the opaque cursor pointing just after doc"""
+    if sort == "_id":
+        raw = str(doc["_id"])
+    else:
+        raw = f"{doc[sort].isoformat()}|{doc['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        if sort == "_id":
+            return ObjectId(raw)
+        value, last_id = raw.split("|")
+        return datetime.fromisoformat(value), ObjectId(last_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def next_page_info(docs, limit=None, after=None, sort=None, fields=None):
+    """Response fields describing the next page, empty when not paginating"""
+    if limit is None:
+        return {}
+    next_cursor = None
+    if len(docs) == limit:
+        next_cursor = encode_cursor(docs[-1], sort or DEFAULT_SORT)
+    return {"nextCursor": next_cursor}
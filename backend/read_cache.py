@@ -0,0 +1,289 @@
+import os
+import random
+import threading
+import time
+
+import bson
+
+from cache import LRUTTLCache
+
+
+class LRUBackend:
+    """In-process backend: an LRU with a fixed TTL, private to one worker"""
+
+    def __init__(self, maxsize=10000, ttl=30):
+        self._cache = LRUTTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        return self._cache.get(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._cache.get(key) is not None:
+                return None
+            self._cache.set(key, value)
+            return True
+
+    def delete(self, *keys):
+        for key in keys:
+            self._cache.invalidate(key)
+
+
+class InMemoryRedis:
+    """Local stand-in for a Redis client, implementing the get/set/delete
+    subset ReadThroughCache uses, so the Redis code path runs without a server
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            return None
+        return value
+
+    def get(self, key):
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key, value, ex=None, nx=False):
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return None
+            expires_at = time.monotonic() + ex if ex else None
+            self._data[key] = (value, expires_at)
+            return True
+
+    def delete(self, *keys):
+        with self._lock:
+            return sum(self._data.pop(key, None) is not None for key in keys)
+
+
+def make_backend(name, ttl=30, maxsize=10000):
+    """Build a backend from READ_CACHE_BACKEND: local, redis, memory-redis or none"""
+    if name == "none":
+        return None
+    if name == "redis":
+        # Optional dependency, only needed when a shared cache is configured
+        import redis
+
+        return redis.Redis.from_url(os.getenv("REDIS_URL", "redis://localhost:6379"))
+    if name == "memory-redis":
+        return InMemoryRedis()
+    return LRUBackend(maxsize=maxsize, ttl=ttl)
+
+
+class ReadThroughCache:
+    """Per-user read-through cache of Mongo documents over a pluggable backend.
+
+    Values are stored BSON encoded, so ObjectIds and datetimes survive a Redis
+    round trip and callers never share a cached object. Task and list keys
+    include the user's data version, read before the lookup, so a write bumps
+    the version and makes every older entry unreachable. An entry can hold
+    data newer than its version but never older, which keeps cached bodies
+    valid for their ETags.
+
+    The version itself is cached too, so a hit costs no Mongo round trip.
+    Writes store the new version with set_version(); a shared backend sees it
+    on every worker at once, a private one only once its copy of the version
+    expires after ttl seconds.
+
+    verify_rate re-reads that share of hits from Mongo to measure how often a
+    hit was stale anyway.
+
+    With backend None, or no version, every key is None and reads go straight
+    to load().
+    """
+
+    def __init__(self, backend, ttl=30, verify_rate=0.0, prefix="rc:"):
+        self.backend = backend
+        self.ttl = ttl
+        self.verify_rate = verify_rate
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.verified = 0
+        self.stale = 0
+        self.version_hits = 0
+        self.version_loads = 0
+        self._hit_age_total = 0.0
+        self._hit_age_max = 0.0
+
+    # Keys
+
+    @property
+    def enabled(self):
+        return self.backend is not None
+
+    def task_key(self, user_id, task_id, version):
+        if self.backend is None or version is None:
+            return None
+        return f"{self.prefix}{user_id}:{version}:task:{task_id}"
+
+    def task_lists_key(self, user_id, default_only, version):
+        if self.backend is None or version is None:
+            return None
+        return f"{self.prefix}{user_id}:{version}:lists:{int(bool(default_only))}"
+
+    def version_key(self, user_id):
+        return f"{self.prefix}{user_id}:version"
+
+    def user_key(self, user_id):
+        if self.backend is None:
+            return None
+        return f"{self.prefix}{user_id}:user"
+
+    # Versions
+
+    def _cached_version(self, user_id):
+        version = self.backend.get(self.version_key(user_id))
+        if isinstance(version, bytes):
+            version = version.decode()
+        with self._lock:
+            if version is None:
+                self.version_loads += 1
+            else:
+                self.version_hits += 1
+        return version
+
+    def _store_version(self, user_id, version):
+        if version is not None:
+            # Only if absent: a version read before a concurrent write must not
+            # replace the one that write stored
+            self.backend.set(self.version_key(user_id), version, ex=self.ttl, nx=True)
+        return version
+
+    def version(self, user_id, load):
+        """The user's data version, load()ed from Mongo only when not cached.
+
+        None when caching is disabled.
+        """
+        if self.backend is None:
+            return None
+        version = self._cached_version(user_id)
+        if version is None:
+            version = self._store_version(user_id, load())
+        return version
+
+    async def aversion(self, user_id, load):
+        """version() for a coroutine function load"""
+        if self.backend is None:
+            return None
+        version = self._cached_version(user_id)
+        if version is None:
+            version = self._store_version(user_id, await load())
+        return version
+
+    def set_version(self, user_id, version):
+        """Store the version a write has just produced"""
+        if self.backend is None:
+            return
+        if version is None:
+            self.backend.delete(self.version_key(user_id))
+        else:
+            self.backend.set(self.version_key(user_id), version, ex=self.ttl)
+
+    # Reads
+
+    def _record_hit(self, stored_at):
+        age = time.time() - stored_at
+        with self._lock:
+            self.hits += 1
+            self._hit_age_total += age
+            self._hit_age_max = max(self._hit_age_max, age)
+
+    def _store(self, key, value):
+        payload = bson.encode({"value": value, "storedAt": time.time()})
+        self.backend.set(key, payload, ex=self.ttl)
+
+    def _cached(self, key):
+        """Return (found, value, stored_at) for key"""
+        payload = self.backend.get(key)
+        if payload is None:
+            return False, None, None
+        document = bson.decode(payload)
+        return True, document["value"], document["storedAt"]
+
+    def _should_verify(self):
+        return self.verify_rate > 0 and random.random() < self.verify_rate
+
+    def _verify(self, key, cached, fresh):
+        with self._lock:
+            self.verified += 1
+            if fresh != cached:
+                self.stale += 1
+        if fresh != cached:
+            if fresh:
+                self._store(key, fresh)
+            else:
+                self.backend.delete(key)
+
+    def get_or_load(self, key, load):
+        """Return the cached value for key, or load() it and cache it if truthy"""
+        if key is None:
+            return load()
+        found, value, stored_at = self._cached(key)
+        if found:
+            self._record_hit(stored_at)
+            if self._should_verify():
+                fresh = load()
+                self._verify(key, value, fresh)
+                return fresh
+            return value
+
+        with self._lock:
+            self.misses += 1
+        value = load()
+        # Empty results are also what the models return on errors
+        if value:
+            self._store(key, value)
+        return value
+
+    async def aget_or_load(self, key, load):
+        """get_or_load() for a coroutine function load"""
+        if key is None:
+            return await load()
+        found, value, stored_at = self._cached(key)
+        if found:
+            self._record_hit(stored_at)
+            if self._should_verify():
+                fresh = await load()
+                self._verify(key, value, fresh)
+                return fresh
+            return value
+
+        with self._lock:
+            self.misses += 1
+        value = await load()
+        if value:
+            self._store(key, value)
+        return value
+
+    def stats(self):
+        """Hit ratio and staleness of cached reads"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": type(self.backend).__name__,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+                "avgHitAgeMs": (
+                    self._hit_age_total / self.hits * 1000 if self.hits else 0.0
+                ),
+                "maxHitAgeMs": self._hit_age_max * 1000,
+                "verifyRate": self.verify_rate,
+                "verified": self.verified,
+                "stale": self.stale,
+                "staleRate": self.stale / self.verified if self.verified else 0.0,
+                "versionHits": self.version_hits,
+                "versionLoads": self.version_loads,
+            }
@@ -0,0 +1,246 @@
+from datetime import datetime, timedelta
+from bson import ObjectId
+
+# Request parsing shared by the WSGI (server.py) and ASGI (server_async.py) apps
+
+def build_task_data(data, user_id, tasks_list_id=None):
+    """Build the task document for a create request, raising ValueError if invalid"""
+    if not isinstance(data, dict) or "title" not in data:
+        raise ValueError("Task title is required")
+
+    # Handle list_ids - ensure task appears in both the specific list and "Tasks" list
+    list_ids = []
+    if "listId" in data and data["listId"]:
+        list_ids.append(data["listId"])
+    elif "list_ids" in data and data["list_ids"]:
+        list_ids = (
+            data["list_ids"]
+            if isinstance(data["list_ids"], list)
+            else [data["list_ids"]]
+        )
+
+    if tasks_list_id and tasks_list_id not in list_ids:
+        list_ids.append(tasks_list_id)
+
+    # If no list specified, default to Tasks list
+    if not list_ids:
+        list_ids = ["my-tasks"]
+
+    due_date = data.get("dueDate")
+    if due_date:
+        try:
+            due_date = datetime.fromisoformat(due_date.replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            raise ValueError("Invalid dueDate format")
+
+    # Create task data with user_id and list_ids
+    return {
+        "title": data["title"],
+        "user_id": user_id,
+        "list_ids": list_ids,
+        "isCompleted": data.get("isCompleted", False),
+        "isImportant": data.get("isImportant", False),
+        "note": data.get("note"),
+        "dueDate": due_date or None,
+    }
+
+
+def parse_bulk_update(data, important_list_id=None):
+    """Validate a PATCH /tasks/bulk body, raising ValueError if invalid.
+
+    Returns (task_filter, set_fields, add_list_ids, remove_list_ids).
+    """
+    if not isinstance(data, dict):
+        raise ValueError("No data provided")
+    task_filter = data.get("filter")
+    update = data.get("update")
+    if not isinstance(task_filter, dict) or not isinstance(update, dict):
+        raise ValueError("filter and update objects are required")
+
+    unknown = set(task_filter) - {"listId", "isCompleted", "isImportant", "taskIds"}
+    if unknown:
+        raise ValueError(f"Unsupported filter fields: {', '.join(sorted(unknown))}")
+    if not task_filter:
+        raise ValueError("filter must not be empty")
+    for field in ("isCompleted", "isImportant"):
+        if field in task_filter and not isinstance(task_filter[field], bool):
+            raise ValueError(f"filter.{field} must be a boolean")
+    if "listId" in task_filter and not isinstance(task_filter["listId"], str):
+        raise ValueError("filter.listId must be a string")
+    if "taskIds" in task_filter and not isinstance(task_filter["taskIds"], list):
+        raise ValueError("filter.taskIds must be an array")
+
+    allowed = {
+        "isCompleted",
+        "isImportant",
+        "dueDate",
+        "moveToList",
+        "addToList",
+        "removeFromList",
+    }
+    unknown = set(update) - allowed
+    if unknown:
+        raise ValueError(f"Unsupported update fields: {', '.join(sorted(unknown))}")
+
+    set_fields = {}
+    add_list_ids = []
+    remove_list_ids = []
+    for field in ("isCompleted", "isImportant"):
+        if field in update:
+            if not isinstance(update[field], bool):
+                raise ValueError(f"update.{field} must be a boolean")
+            set_fields[field] = update[field]
+
+    if "dueDate" in update:
+        due_date = update["dueDate"]
+        if due_date is not None:
+            try:
+                due_date = datetime.fromisoformat(due_date.replace("Z", "+00:00"))
+            except (AttributeError, ValueError):
+                raise ValueError("Invalid dueDate format")
+        set_fields["dueDate"] = due_date
+
+    for field in ("moveToList", "addToList", "removeFromList"):
+        if field in update and not isinstance(update[field], str):
+            raise ValueError(f"update.{field} must be a string")
+    if "moveToList" in update:
+        if not task_filter.get("listId"):
+            raise ValueError("moveToList requires filter.listId")
+        remove_list_ids.append(task_filter["listId"])
+        add_list_ids.append(update["moveToList"])
+    if "addToList" in update:
+        add_list_ids.append(update["addToList"])
+    if "removeFromList" in update:
+        remove_list_ids.append(update["removeFromList"])
+
+    # Keep the Important list in step with the flag, like the single-task route
+    if important_list_id and "isImportant" in set_fields:
+        if set_fields["isImportant"]:
+            add_list_ids.append(important_list_id)
+        else:
+            remove_list_ids.append(important_list_id)
+
+    return task_filter, set_fields, add_list_ids, remove_list_ids
+
+
+SYNC_OPS = {
+    "create",
+    "update",
+    "complete",
+    "important",
+    "delete",
+    "addToList",
+    "removeFromList",
+}
+SYNC_UPDATE_FIELDS = {"title", "note", "dueDate", "isCompleted", "isImportant"}
+
+
+def parse_sync_op(op, user_id, id_map, default_list_ids):
+    """Validate one POST /sync mutation, raising ValueError if invalid.
+
+    Creates register their clientId in id_map so later mutations in the same
+    batch can refer to the new task by it.
+    """
+    if not isinstance(op, dict):
+        raise ValueError("Mutation must be an object")
+    kind = op.get("op")
+    if kind not in SYNC_OPS:
+        raise ValueError(f"Unknown op: {kind}")
+
+    if kind == "create":
+        client_id = op.get("clientId")
+        if not isinstance(client_id, str) or not client_id:
+            raise ValueError("clientId is required")
+        task = build_task_data(op.get("task"), user_id, default_list_ids.get("Tasks"))
+        # Clients may generate ObjectIds themselves, otherwise we assign one
+        task["_id"] = (
+            ObjectId(client_id) if ObjectId.is_valid(client_id) else ObjectId()
+        )
+        id_map[client_id] = str(task["_id"])
+        return {"op": kind, "taskId": str(task["_id"]), "task": task}
+
+    task_id = id_map.get(op.get("taskId"), op.get("taskId"))
+    if not isinstance(task_id, str) or not ObjectId.is_valid(task_id):
+        raise ValueError("Valid taskId is required")
+    mutation = {"op": kind, "taskId": task_id}
+
+    if kind == "delete":
+        pass
+    elif kind == "update":
+        changes = op.get("changes")
+        if not isinstance(changes, dict) or not changes:
+            raise ValueError("changes object is required")
+        unknown = set(changes) - SYNC_UPDATE_FIELDS
+        if unknown:
+            raise ValueError(f"Unsupported fields: {', '.join(sorted(unknown))}")
+        changes = dict(changes)
+        if changes.get("dueDate"):
+            try:
+                changes["dueDate"] = datetime.fromisoformat(
+                    changes["dueDate"].replace("Z", "+00:00")
+                )
+            except (AttributeError, ValueError):
+                raise ValueError("Invalid dueDate format")
+        mutation["changes"] = changes
+    elif kind in ("complete", "important"):
+        if not isinstance(op.get("value"), bool):
+            raise ValueError("value must be a boolean")
+        mutation["value"] = op["value"]
+        if kind == "important":
+            mutation["listId"] = default_list_ids.get("Important")
+    elif kind in ("addToList", "removeFromList"):
+        if not isinstance(op.get("listId"), str) or not op["listId"]:
+            raise ValueError("listId is required")
+        mutation["listId"] = op["listId"]
+    return mutation
+
+
+NDJSON_MIMETYPE = "application/x-ndjson"
+MAX_BULK_TASKS = 5000
+MAX_SYNC_OPS = 1000
+SYNC_WATERMARK_MARGIN = timedelta(seconds=5)
+EPOCH = datetime(1970, 1, 1)
+
+
+def sync_watermark():
+    """Watermark for GET /tasks/changes, taken before querying and minus a
+    margin for writes still in flight, so nothing committed after the call
+    is missed (repeats are harmless)"""
+    now = datetime.utcnow()
+    return (now - SYNC_WATERMARK_MARGIN - EPOCH) // timedelta(milliseconds=1)
+
+
+def parse_since(since):
+    """Parse a since watermark in milliseconds, raising ValueError if invalid"""
+    if not since:
+        return EPOCH
+    try:
+        return EPOCH + timedelta(milliseconds=int(since))
+    except (OverflowError, ValueError):
+        raise ValueError("Invalid since watermark")
+
+
+def finish_sync_results(results, mutations, mutation_indexes, statuses, tasks):
+    """Merge bulk_write statuses into the POST /sync results.
+
+    Applied mutations whose task no longer exists, and was not deleted by
+    this batch, are reported as notFound. Returns the deleted task IDs.
+    """
+    for index, status in zip(mutation_indexes, statuses):
+        results[index].update(status)
+
+    found_ids = {str(task["_id"]) for task in tasks}
+    deleted_ids = {
+        mutation["taskId"]
+        for mutation, status in zip(mutations, statuses)
+        if mutation["op"] == "delete" and status["status"] == "applied"
+    } - found_ids
+    for index in mutation_indexes:
+        result = results[index]
+        if (
+            result["status"] == "applied"
+            and result["taskId"] not in found_ids
+            and result["taskId"] not in deleted_ids
+        ):
+            result["status"] = "notFound"
+    return deleted_ids
@@ -0,0 +1,43 @@
+import base64
+
+import orjson
+from bson import ObjectId
+from flask.json.provider import JSONProvider
+
+# Stored datetimes are naive UTC, so tag them as such in the output
+ORJSON_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_NON_STR_KEYS
+
+
+def _default(obj):
+    """Encode the types orjson does not handle itself"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode("ascii")
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode(obj):
+    """Serialize Mongo documents straight to JSON bytes.
+
+    ObjectIds become hex strings, datetimes ISO 8601 in UTC and bytes base64.
+    """
+    return orjson.dumps(obj, default=_default, option=ORJSON_OPTIONS)
+
+
+class OrjsonProvider(JSONProvider):
+    """JSON provider for app.json, used by jsonify and request.get_json"""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj, **kwargs):
+        return encode(obj).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(encode(obj), mimetype=self.mimetype)
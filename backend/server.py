@@ -1,19 +1,42 @@
-import json
-from flask import Flask, request, jsonify
+from functools import partial
+from flask import Flask, Response, request, jsonify, make_response, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 from bson import ObjectId
 
-from core import inboundTelegramHandler
+from ai_model import extraction_cache
+from compression import ResponseCompressor, route_name
+from core import extraction_pipeline, inboundTelegramBatchHandler
+from ingest import IngestQueue
+from request_parsing import (
+    MAX_BULK_TASKS,
+    MAX_SYNC_OPS,
+    NDJSON_MIMETYPE,
+    build_task_data,
+    finish_sync_results,
+    parse_bulk_update,
+    parse_since,
+    parse_sync_op,
+    sync_watermark,
+)
+from serialization import OrjsonProvider, encode
+from utils import is_textless_update, parse_update
 from mongo.data_handler import DataHandler
 from mongo.models import Task, TaskList
+from mongo.pagination import (
+    DEFAULT_SORT,
+    encode_cursor,
+    next_page_info,
+    parse_page_args,
+)
 
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 CORS(app)
 
@@ -22,6 +45,46 @@ CONNECTION_STRING = os.getenv("MONGO_URL")
 DATABASE_NAME = os.getenv("DATABASE_NAME", "todo_app")
 data_handler = DataHandler(CONNECTION_STRING, DATABASE_NAME)
 
+# Telegram updates are acknowledged immediately and processed in the background
+telegram_queue = IngestQueue(
+    partial(inboundTelegramBatchHandler, data_handler=data_handler),
+    workers=int(os.getenv("TELEGRAM_WORKERS", "4")),
+    maxsize=int(os.getenv("TELEGRAM_QUEUE_SIZE", "1000")),
+    name="telegram",
+    # Queued updates are extracted together, in one parallel Gemini batch
+    batch_size=int(os.getenv("TELEGRAM_BATCH_SIZE", "8")),
+)
+telegram_queue.start()
+
+
+# Compress JSON and NDJSON bodies for clients that accept zstd or gzip
+compressor = ResponseCompressor(
+    min_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+)
+
+
+@app.after_request
+def compress_response(response):
+    """Compress the body according to Accept-Encoding"""
+    if response.direct_passthrough or not compressor.compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = compressor.choose(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    route = route_name(request)
+    if response.is_streamed:
+        response.response = compressor.stream(response.iter_encoded(), encoding, route)
+        response.headers.pop("Content-Length", None)
+    else:
+        body = response.get_data()
+        if len(body) < compressor.min_size:
+            return response
+        response.set_data(compressor.compress(body, encoding, route))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
 
 # Helper function to validate user_id
 def get_user_id_from_headers():
@@ -37,6 +100,78 @@ def get_user_id_from_headers():
         return None
 
 
+def wants_ndjson():
+    """Check whether the client asked for a streamed NDJSON response"""
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def tasks_response(tasks, page, stream=False):
+    """Build a task listing response.
+
+    Streamed responses carry one task per line, followed by a
+    {"nextCursor": ...} line when a page limit was requested. A stream that
+    fails part way ends with an {"error": ...} line instead, which is why
+    streams are sent uncacheable and without an ETag.
+    """
+    if not stream:
+        return (
+            jsonify(
+                {"success": True, "tasks": tasks, **next_page_info(tasks, **page)}
+            ),
+            200,
+        )
+
+    def generate():
+        last_task = None
+        count = 0
+        try:
+            for task in tasks:
+                last_task = task
+                count += 1
+                yield encode(task) + b"\n"
+        except Exception as e:
+            print(f"Stream tasks error: {e}")
+            # The 200 status is already sent, so say so in the body instead
+            yield encode({"error": "Failed to stream tasks"}) + b"\n"
+            return
+        if page["limit"] is not None:
+            next_cursor = None
+            if count == page["limit"]:
+                next_cursor = encode_cursor(last_task, page["sort"] or DEFAULT_SORT)
+            yield encode({"nextCursor": next_cursor}) + b"\n"
+
+    response = Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
+    # A stream that fails part way is still a 200, so it must never be reused
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def data_etag(user_id, version):
+    """ETag for a data version of the user, None if the version is unavailable.
+
+    The version is read before querying, so the body sent with it is never
+    older than it.
+    """
+    if version is None:
+        return None
+    return f"{user_id}.{version}"
+
+
+def not_modified(etag):
+    """Check whether the client's If-None-Match already holds etag"""
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+def with_etag(response, etag):
+    """Attach a weak ETag and make clients revalidate before reusing the body"""
+    response = make_response(response)
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
 # Authentication endpoints
 @app.route("/auth/register", methods=["POST"])
 def register():
@@ -151,12 +286,50 @@ def home():
     return "Hello automator !"
 
 
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    """Get in-process cache, queue, extraction and compression counters"""
+    caches = {
+        **data_handler.get_cache_stats(),
+        "extraction": extraction_cache.stats(),
+    }
+    queues = {"telegram": telegram_queue.stats()}
+    return (
+        jsonify(
+            {
+                "success": True,
+                "caches": caches,
+                "queues": queues,
+                "extraction": extraction_pipeline.stats(),
+                "compression": compressor.stats(),
+            }
+        ),
+        200,
+    )
+
+
 @app.route("/inboundTelegram", methods=["POST"])
 def inbound_telegram():
-    data = request.json
-    if isinstance(data, str):
-        data = json.loads(data)
-    return inboundTelegramHandler(data)
+    body = request.get_data()
+    update = parse_update(body)
+    if update is None:
+        # Some senders post the update double-encoded as a JSON string
+        data = request.get_json(silent=True)
+        if isinstance(data, str):
+            body = data
+            update = parse_update(data)
+
+    if update is None:
+        if is_textless_update(body):
+            # Nothing to extract, but a 4xx would make Telegram redeliver it
+            return jsonify({"success": True, "message": "Update ignored"}), 200
+        return jsonify({"success": False, "message": "Invalid update"}), 400
+
+    if not telegram_queue.submit(update):
+        # Queue is full, Telegram will redeliver the update later
+        return jsonify({"success": False, "message": "Server busy"}), 503
+
+    return jsonify({"success": True, "message": "Update queued"}), 200
 
 
 # ==================== TASK ROUTES ====================
@@ -175,49 +348,13 @@ def create_task():
 
         data = request.get_json()
 
-        if not data or "title" not in data:
-            return jsonify({"success": False, "message": "Task title is required"}), 400
-
-        # Handle list_ids - ensure task appears in both the specific list and "Tasks" list
-        list_ids = []
-        if "listId" in data and data["listId"]:
-            list_ids.append(data["listId"])
-        elif "list_ids" in data and data["list_ids"]:
-            list_ids = (
-                data["list_ids"]
-                if isinstance(data["list_ids"], list)
-                else [data["list_ids"]]
-            )
-
         # Always add to the main "Tasks" list (find the actual ID for the Tasks list)
-        tasks_lists = data_handler.get_task_lists(user_id)
-        tasks_list_id = None
-        for task_list in tasks_lists:
-            if task_list.get("name") == "Tasks" or task_list.get("id") == "my-tasks":
-                tasks_list_id = task_list.get("_id") or task_list.get("id")
-                break
-
-        if tasks_list_id and tasks_list_id not in list_ids:
-            list_ids.append(tasks_list_id)
-
-        # If no list specified, default to Tasks list
-        if not list_ids:
-            list_ids = ["my-tasks"]
-
-        # Create task data with user_id and list_ids
-        task_data = {
-            "title": data["title"],
-            "user_id": user_id,
-            "list_ids": list_ids,
-            "isCompleted": data.get("isCompleted", False),
-            "isImportant": data.get("isImportant", False),
-            "note": data.get("note"),
-            "dueDate": (
-                datetime.fromisoformat(data["dueDate"].replace("Z", "+00:00"))
-                if data.get("dueDate")
-                else None
-            ),
-        }
+        tasks_list_id = data_handler.get_default_list_ids(user_id).get("Tasks")
+
+        try:
+            task_data = build_task_data(data, user_id, tasks_list_id)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
         task_id = data_handler.create_task(task_data)
 
@@ -243,6 +380,153 @@ def create_task():
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
 
+@app.route("/tasks/bulk", methods=["POST"])
+def create_tasks_bulk():
+    """Create many tasks in one request"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = request.get_json()
+        if not data or "tasks" not in data or not isinstance(data["tasks"], list):
+            return (
+                jsonify({"success": False, "message": "Tasks must be an array"}),
+                400,
+            )
+
+        if len(data["tasks"]) > MAX_BULK_TASKS:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": f"At most {MAX_BULK_TASKS} tasks per request",
+                    }
+                ),
+                400,
+            )
+
+        # Resolve the default lists once for the whole batch
+        tasks_list_id = data_handler.get_default_list_ids(user_id).get("Tasks")
+
+        results = [None] * len(data["tasks"])
+        valid_indexes = []
+        tasks_data = []
+        for index, task in enumerate(data["tasks"]):
+            try:
+                tasks_data.append(build_task_data(task, user_id, tasks_list_id))
+                valid_indexes.append(index)
+            except ValueError as e:
+                results[index] = {"index": index, "error": str(e)}
+
+        for index, result in zip(valid_indexes, data_handler.create_tasks(tasks_data)):
+            results[index] = {"index": index, **result}
+
+        created_count = sum(1 for result in results if "taskId" in result)
+
+        return (
+            jsonify(
+                {
+                    "success": created_count > 0,
+                    "message": f"{created_count} tasks created",
+                    "createdCount": created_count,
+                    "results": results,
+                }
+            ),
+            201 if created_count else 400,
+        )
+
+    except Exception as e:
+        print(f"Create tasks bulk error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/bulk", methods=["PATCH"])
+def update_tasks_bulk():
+    """Update every task matching a filter"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        important_list_id = data_handler.get_default_list_ids(user_id).get(
+            "Important"
+        )
+
+        try:
+            task_filter, set_fields, add_list_ids, remove_list_ids = (
+                parse_bulk_update(request.get_json(), important_list_id)
+            )
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        counts = data_handler.update_tasks_by_filter(
+            user_id, task_filter, set_fields, add_list_ids, remove_list_ids
+        )
+
+        if counts is None:
+            return (
+                jsonify({"success": False, "message": "Failed to update tasks"}),
+                500,
+            )
+
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "message": f"{counts['modifiedCount']} tasks updated",
+                    **counts,
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        print(f"Update tasks bulk error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/changes", methods=["GET"])
+def get_task_changes():
+    """Get tasks changed or deleted since a watermark from a previous call"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        watermark = sync_watermark()
+        try:
+            since = parse_since(request.args.get("since"))
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        changes = data_handler.get_task_changes(user_id, since)
+
+        if changes is None:
+            return (
+                jsonify({"success": False, "message": "Failed to get changes"}),
+                500,
+            )
+
+        return (
+            jsonify({"success": True, "watermark": str(watermark), **changes}),
+            200,
+        )
+
+    except Exception as e:
+        print(f"Get task changes error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
 @app.route("/tasks/<task_id>", methods=["GET"])
 def get_task(task_id):
     """Get a specific task"""
@@ -285,12 +569,23 @@ def get_tasks():
 
         list_id = request.args.get("listId")
 
-        tasks = data_handler.get_tasks(user_id, list_id)
+        try:
+            page = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-        return (
-            jsonify({"success": True, "tasks": tasks}),
-            200,
-        )
+        if wants_ndjson():
+            tasks = data_handler.get_tasks(user_id, list_id, **page, stream=True)
+            return tasks_response(tasks, page, stream=True)
+
+        version = data_handler.get_data_version(user_id)
+        etag = data_etag(user_id, version)
+        if not_modified(etag):
+            return with_etag(Response(status=304), etag)
+
+        tasks = data_handler.get_tasks(user_id, list_id, **page)
+
+        return with_etag(tasks_response(tasks, page), etag)
 
     except Exception as e:
         print(f"Get tasks error: {e}")
@@ -491,12 +786,9 @@ def toggle_task_importance(task_id):
 
         if success:
             # Find the Important list ID
-            task_lists = data_handler.get_task_lists(user_id)
-            important_list_id = None
-            for task_list in task_lists:
-                if task_list.get("name") == "Important" and task_list.get("isDefault"):
-                    important_list_id = task_list.get("_id")
-                    break
+            important_list_id = data_handler.get_default_list_ids(user_id).get(
+                "Important"
+            )
 
             if important_list_id:
                 if is_important:
@@ -567,18 +859,21 @@ def add_tasks_to_lists():
                 400,
             )
 
-        success_count = 0
-        for task_id in task_ids:
-            for list_id in list_ids:
-                if data_handler.add_task_to_list(task_id, user_id, list_id):
-                    success_count += 1
+        counts = data_handler.add_tasks_to_lists(task_ids, user_id, list_ids)
+
+        if counts is None:
+            return (
+                jsonify({"success": False, "message": "Failed to add tasks to lists"}),
+                500,
+            )
 
         return (
             jsonify(
                 {
                     "success": True,
                     "message": f"Successfully added tasks to lists",
-                    "addedCount": success_count,
+                    "addedCount": counts["modifiedCount"],
+                    **counts,
                 }
             ),
             200,
@@ -589,6 +884,72 @@ def add_tasks_to_lists():
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
 
+@app.route("/sync", methods=["POST"])
+def sync():
+    """Apply an ordered batch of client mutations and return the resulting state"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = request.get_json()
+        if not data or not isinstance(data.get("ops"), list):
+            return jsonify({"success": False, "message": "ops must be an array"}), 400
+
+        if len(data["ops"]) > MAX_SYNC_OPS:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": f"At most {MAX_SYNC_OPS} ops per request",
+                    }
+                ),
+                400,
+            )
+
+        default_list_ids = data_handler.get_default_list_ids(user_id)
+        id_map = {}
+        results = []
+        mutations = []
+        mutation_indexes = []
+        for index, op in enumerate(data["ops"]):
+            try:
+                mutation = parse_sync_op(op, user_id, id_map, default_list_ids)
+            except ValueError as e:
+                results.append({"index": index, "status": "error", "error": str(e)})
+                continue
+            results.append({"index": index, "taskId": mutation["taskId"]})
+            mutations.append(mutation)
+            mutation_indexes.append(index)
+
+        statuses = data_handler.apply_mutations(user_id, mutations)
+        touched_ids = {mutation["taskId"] for mutation in mutations}
+        tasks = data_handler.get_tasks_by_ids(list(touched_ids), user_id)
+        deleted_ids = finish_sync_results(
+            results, mutations, mutation_indexes, statuses, tasks
+        )
+
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "results": results,
+                    "idMap": id_map,
+                    "tasks": tasks,
+                    "deletedTaskIds": sorted(deleted_ids),
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        print(f"Sync error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
 # ==================== TASK LIST ROUTES ====================
 
 
@@ -686,11 +1047,16 @@ def get_task_lists():
 
         default_only = request.args.get("defaultOnly", "false").lower() == "true"
 
-        task_lists = data_handler.get_task_lists(user_id, default_only)
+        version = data_handler.get_data_version(user_id)
+        etag = data_etag(user_id, version)
+        if not_modified(etag):
+            return with_etag(Response(status=304), etag)
 
-        return (
-            jsonify({"success": True, "taskLists": task_lists}),
-            200,
+        # Keyed by the version just read, instead of reading it again
+        task_lists = data_handler.get_task_lists(user_id, default_only, version)
+
+        return with_etag(
+            (jsonify({"success": True, "taskLists": task_lists}), 200), etag
         )
 
     except Exception as e:
@@ -790,12 +1156,15 @@ def get_important_tasks():
                 401,
             )
 
-        tasks = data_handler.get_important_tasks(user_id)
+        try:
+            page = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-        return (
-            jsonify({"success": True, "tasks": tasks}),
-            200,
-        )
+        stream = wants_ndjson()
+        tasks = data_handler.get_important_tasks(user_id, **page, stream=stream)
+
+        return tasks_response(tasks, page, stream)
 
     except Exception as e:
         print(f"Get important tasks error: {e}")
@@ -813,12 +1182,15 @@ def get_completed_tasks():
                 401,
             )
 
-        tasks = data_handler.get_completed_tasks(user_id)
+        try:
+            page = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
 
-        return (
-            jsonify({"success": True, "tasks": tasks}),
-            200,
-        )
+        stream = wants_ndjson()
+        tasks = data_handler.get_completed_tasks(user_id, **page, stream=stream)
+
+        return tasks_response(tasks, page, stream)
 
     except Exception as e:
         print(f"Get completed tasks error: {e}")
@@ -827,7 +1199,7 @@ def get_completed_tasks():
 
 @app.route("/tasks/search", methods=["GET"])
 def search_tasks():
-    """Search tasks by title for the user"""
+    """Search tasks by title and note for the user"""
     try:
         user_id = get_user_id_from_headers()
         if not user_id:
@@ -844,18 +1216,68 @@ def search_tasks():
                 400,
             )
 
-        tasks = data_handler.search_tasks(user_id, search_term)
-
-        return (
-            jsonify({"success": True, "tasks": tasks}),
-            200,
-        )
+        try:
+            page = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        stream = wants_ndjson()
+        if request.args.get("fuzzy", "false").lower() == "true":
+            # Typo-tolerant ranked matches from the in-memory trigram index
+            if page["after"] is not None or page["sort"] is not None:
+                return (
+                    jsonify(
+                        {
+                            "success": False,
+                            "message": "Fuzzy search does not support sort or after",
+                        }
+                    ),
+                    400,
+                )
+            tasks = data_handler.fuzzy_search_tasks(user_id, search_term, page["limit"])
+            return tasks_response(tasks, {**page, "limit": None}, stream)
+
+        tasks = data_handler.search_tasks(user_id, search_term, **page, stream=stream)
+
+        if page["after"] is None and page["sort"] is None:
+            # Ranked results are not keyset paginated, so there is no cursor
+            return tasks_response(tasks, {**page, "limit": None}, stream)
+        return tasks_response(tasks, page, stream)
 
     except Exception as e:
         print(f"Search tasks error: {e}")
         return jsonify({"success": False, "message": "Internal server error"}), 500
 
 
+@app.route("/task-lists/stats", methods=["GET"])
+def get_all_list_stats():
+    """Get statistics for every task list of the user in one request"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        stats = data_handler.get_all_list_stats(user_id)
+
+        if stats is not None:
+            return (
+                jsonify({"success": True, **stats}),
+                200,
+            )
+        else:
+            return (
+                jsonify({"success": False, "message": "Failed to get list stats"}),
+                500,
+            )
+
+    except Exception as e:
+        print(f"Get all list stats error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
 @app.route("/task-lists/<list_id>/stats", methods=["GET"])
 def get_list_stats(list_id):
     """Get statistics for a specific task list"""
@@ -0,0 +1,1336 @@
+from functools import partial
+from quart import Quart, Response, request, jsonify, make_response
+from quart.wrappers.response import IterableBody
+from quart_cors import cors
+from datetime import datetime
+import os
+from dotenv import load_dotenv
+from bson import ObjectId
+
+from ai_model import extraction_cache
+from compression import ResponseCompressor, route_name
+from core import ainboundTelegramBatchHandler, extraction_pipeline
+from ingest import AsyncIngestQueue
+from request_parsing import (
+    MAX_BULK_TASKS,
+    MAX_SYNC_OPS,
+    NDJSON_MIMETYPE,
+    build_task_data,
+    finish_sync_results,
+    parse_bulk_update,
+    parse_since,
+    parse_sync_op,
+    sync_watermark,
+)
+from serialization import OrjsonProvider, encode
+from utils import is_textless_update, parse_update
+from mongo.async_data_handler import AsyncDataHandler
+from mongo.pagination import (
+    DEFAULT_SORT,
+    encode_cursor,
+    next_page_info,
+    parse_page_args,
+)
+
+# ASGI variant of server.py with the same routes. Requests wait on Mongo and
+# Gemini without holding a thread, so one process can serve thousands of
+# concurrent connections:
+#     hypercorn server_async:app --bind 0.0.0.0:8000
+
+# Load environment variables
+load_dotenv()
+
+app = cors(Quart(__name__))
+app.json = OrjsonProvider(app)
+
+# Initialize data handler
+CONNECTION_STRING = os.getenv("MONGO_URL")
+DATABASE_NAME = os.getenv("DATABASE_NAME", "todo_app")
+data_handler = AsyncDataHandler(CONNECTION_STRING, DATABASE_NAME)
+
+# Telegram updates are acknowledged immediately and processed in the background
+telegram_queue = AsyncIngestQueue(
+    partial(ainboundTelegramBatchHandler, data_handler=data_handler),
+    workers=int(os.getenv("TELEGRAM_WORKERS", "4")),
+    maxsize=int(os.getenv("TELEGRAM_QUEUE_SIZE", "1000")),
+    name="telegram",
+    # Queued updates are extracted together, in one parallel Gemini batch
+    batch_size=int(os.getenv("TELEGRAM_BATCH_SIZE", "8")),
+)
+
+
+# Compress JSON and NDJSON bodies for clients that accept zstd or gzip
+compressor = ResponseCompressor(
+    min_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+)
+
+
+@app.after_request
+async def compress_response(response):
+    """Compress the body according to Accept-Encoding"""
+    if not compressor.compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = compressor.choose(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    route = route_name(request)
+    if isinstance(response.response, IterableBody):
+        response.response = IterableBody(
+            compressor.astream(response.response, encoding, route)
+        )
+        response.headers.pop("Content-Length", None)
+    else:
+        body = await response.get_data()
+        if len(body) < compressor.min_size:
+            return response
+        response.set_data(compressor.compress(body, encoding, route))
+    response.headers["Content-Encoding"] = encoding
+    return response
+
+
+@app.before_serving
+async def startup():
+    await data_handler.check_indexes()
+    telegram_queue.start()
+
+
+@app.after_serving
+async def shutdown():
+    await telegram_queue.stop()
+    await data_handler.close_connection()
+
+
+# Helper function to validate user_id
+def get_user_id_from_headers():
+    """Extract user_id from request headers"""
+    user_id = request.headers.get("X-User-ID")
+    if not user_id or not ObjectId.is_valid(user_id):
+        return None
+    return user_id
+
+
+def wants_ndjson():
+    """Check whether the client asked for a streamed NDJSON response"""
+    best = request.accept_mimetypes.best_match(["application/json", NDJSON_MIMETYPE])
+    return best == NDJSON_MIMETYPE
+
+
+def tasks_response(tasks, page, stream=False):
+    """Build a task listing response.
+
+    tasks is a list, or an async iterator when streaming. Streamed responses
+    carry one task per line, followed by a {"nextCursor": ...} line when a
+    page limit was requested. A stream that fails part way ends with an
+    {"error": ...} line instead, which is why streams are sent uncacheable and
+    without an ETag.
+    """
+    if not stream:
+        return (
+            jsonify(
+                {"success": True, "tasks": tasks, **next_page_info(tasks, **page)}
+            ),
+            200,
+        )
+
+    async def generate():
+        last_task = None
+        count = 0
+        try:
+            if isinstance(tasks, list):
+                for task in tasks:
+                    last_task = task
+                    count += 1
+                    yield encode(task) + b"\n"
+            else:
+                async for task in tasks:
+                    last_task = task
+                    count += 1
+                    yield encode(task) + b"\n"
+        except Exception as e:
+            print(f"Stream tasks error: {e}")
+            # The 200 status is already sent, so say so in the body instead
+            yield encode({"error": "Failed to stream tasks"}) + b"\n"
+            return
+        if page["limit"] is not None:
+            next_cursor = None
+            if count == page["limit"]:
+                next_cursor = encode_cursor(last_task, page["sort"] or DEFAULT_SORT)
+            yield encode({"nextCursor": next_cursor}) + b"\n"
+
+    response = Response(generate(), mimetype=NDJSON_MIMETYPE)
+    # A stream that fails part way is still a 200, so it must never be reused
+    response.headers["Cache-Control"] = "no-store"
+    return response
+
+
+def data_etag(user_id, version):
+    """ETag for a data version of the user, None if the version is unavailable.
+
+    The version is read before querying, so the body sent with it is never
+    older than it.
+    """
+    if version is None:
+        return None
+    return f"{user_id}.{version}"
+
+
+def not_modified(etag):
+    """Check whether the client's If-None-Match already holds etag"""
+    return etag is not None and request.if_none_match.contains_weak(etag)
+
+
+async def with_etag(response, etag):
+    """Attach a weak ETag and make clients revalidate before reusing the body"""
+    response = await make_response(response)
+    if etag is not None:
+        response.set_etag(etag, weak=True)
+        response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# Authentication endpoints
+@app.route("/auth/register", methods=["POST"])
+async def register():
+    """Register a new user"""
+    try:
+        data = await request.get_json()
+
+        if not data or "email" not in data or "password" not in data:
+            return (
+                jsonify(
+                    {"success": False, "message": "Email and password are required"}
+                ),
+                400,
+            )
+
+        email = data["email"].strip()
+        password = data["password"].strip()
+
+        if not email or not password:
+            return (
+                jsonify(
+                    {"success": False, "message": "Email and password cannot be empty"}
+                ),
+                400,
+            )
+
+        if len(password) < 6:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "Password must be at least 6 characters long",
+                    }
+                ),
+                400,
+            )
+
+        user_id = await data_handler.create_user(email, password)
+
+        if user_id:
+            return (
+                jsonify(
+                    {
+                        "success": True,
+                        "message": "User registered successfully",
+                        "userId": user_id,
+                    }
+                ),
+                201,
+            )
+        else:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "User already exists or registration failed",
+                    }
+                ),
+                409,
+            )
+
+    except Exception as e:
+        print(f"Registration error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/auth/login", methods=["POST"])
+async def login():
+    """Authenticate user login"""
+    try:
+        data = await request.get_json()
+
+        if not data or "email" not in data or "password" not in data:
+            return (
+                jsonify(
+                    {"success": False, "message": "Email and password are required"}
+                ),
+                400,
+            )
+
+        email = data["email"].strip()
+        password = data["password"].strip()
+
+        user_id = await data_handler.authenticate_user(email, password)
+
+        if user_id:
+            user = await data_handler.get_user_by_id(user_id)
+            return (
+                jsonify(
+                    {
+                        "success": True,
+                        "message": "Login successful",
+                        "userId": user_id,
+                        "email": user["email"],
+                    }
+                ),
+                200,
+            )
+        else:
+            return (
+                jsonify({"success": False, "message": "Invalid email or password"}),
+                401,
+            )
+
+    except Exception as e:
+        print(f"Login error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/")
+async def home():
+    return "Hello automator !"
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    """Get in-process cache, queue, extraction and compression counters"""
+    caches = {
+        **data_handler.get_cache_stats(),
+        "extraction": extraction_cache.stats(),
+    }
+    queues = {"telegram": telegram_queue.stats()}
+    return (
+        jsonify(
+            {
+                "success": True,
+                "caches": caches,
+                "queues": queues,
+                "extraction": extraction_pipeline.stats(),
+                "compression": compressor.stats(),
+            }
+        ),
+        200,
+    )
+
+
+@app.route("/inboundTelegram", methods=["POST"])
+async def inbound_telegram():
+    body = await request.get_data()
+    update = parse_update(body)
+    if update is None:
+        # Some senders post the update double-encoded as a JSON string
+        data = await request.get_json(silent=True)
+        if isinstance(data, str):
+            body = data
+            update = parse_update(data)
+
+    if update is None:
+        if is_textless_update(body):
+            # Nothing to extract, but a 4xx would make Telegram redeliver it
+            return jsonify({"success": True, "message": "Update ignored"}), 200
+        return jsonify({"success": False, "message": "Invalid update"}), 400
+
+    if not telegram_queue.submit(update):
+        # Queue is full, Telegram will redeliver the update later
+        return jsonify({"success": False, "message": "Server busy"}), 503
+
+    return jsonify({"success": True, "message": "Update queued"}), 200
+
+
+# ==================== TASK ROUTES ====================
+
+
+@app.route("/tasks", methods=["POST"])
+async def create_task():
+    """Create a new task"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = await request.get_json()
+
+        # Always add to the main "Tasks" list (find the actual ID for the Tasks list)
+        default_list_ids = await data_handler.get_default_list_ids(user_id)
+        tasks_list_id = default_list_ids.get("Tasks")
+
+        try:
+            task_data = build_task_data(data, user_id, tasks_list_id)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        task_id = await data_handler.create_task(task_data)
+
+        if task_id:
+            return (
+                jsonify(
+                    {
+                        "success": True,
+                        "message": "Task created successfully",
+                        "taskId": task_id,
+                    }
+                ),
+                201,
+            )
+        else:
+            return (
+                jsonify({"success": False, "message": "Failed to create task"}),
+                500,
+            )
+
+    except Exception as e:
+        print(f"Create task error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/bulk", methods=["POST"])
+async def create_tasks_bulk():
+    """Create many tasks in one request"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = await request.get_json()
+        if not data or "tasks" not in data or not isinstance(data["tasks"], list):
+            return (
+                jsonify({"success": False, "message": "Tasks must be an array"}),
+                400,
+            )
+
+        if len(data["tasks"]) > MAX_BULK_TASKS:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": f"At most {MAX_BULK_TASKS} tasks per request",
+                    }
+                ),
+                400,
+            )
+
+        # Resolve the default lists once for the whole batch
+        default_list_ids = await data_handler.get_default_list_ids(user_id)
+        tasks_list_id = default_list_ids.get("Tasks")
+
+        results = [None] * len(data["tasks"])
+        valid_indexes = []
+        tasks_data = []
+        for index, task in enumerate(data["tasks"]):
+            try:
+                tasks_data.append(build_task_data(task, user_id, tasks_list_id))
+                valid_indexes.append(index)
+            except ValueError as e:
+                results[index] = {"index": index, "error": str(e)}
+
+        created = await data_handler.create_tasks(tasks_data)
+        for index, result in zip(valid_indexes, created):
+            results[index] = {"index": index, **result}
+
+        created_count = sum(1 for result in results if "taskId" in result)
+
+        return (
+            jsonify(
+                {
+                    "success": created_count > 0,
+                    "message": f"{created_count} tasks created",
+                    "createdCount": created_count,
+                    "results": results,
+                }
+            ),
+            201 if created_count else 400,
+        )
+
+    except Exception as e:
+        print(f"Create tasks bulk error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/bulk", methods=["PATCH"])
+async def update_tasks_bulk():
+    """Update every task matching a filter"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        default_list_ids = await data_handler.get_default_list_ids(user_id)
+        important_list_id = default_list_ids.get("Important")
+
+        try:
+            task_filter, set_fields, add_list_ids, remove_list_ids = (
+                parse_bulk_update(await request.get_json(), important_list_id)
+            )
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        counts = await data_handler.update_tasks_by_filter(
+            user_id, task_filter, set_fields, add_list_ids, remove_list_ids
+        )
+
+        if counts is None:
+            return (
+                jsonify({"success": False, "message": "Failed to update tasks"}),
+                500,
+            )
+
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "message": f"{counts['modifiedCount']} tasks updated",
+                    **counts,
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        print(f"Update tasks bulk error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/changes", methods=["GET"])
+async def get_task_changes():
+    """Get tasks changed or deleted since a watermark from a previous call"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        watermark = sync_watermark()
+        try:
+            since = parse_since(request.args.get("since"))
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        changes = await data_handler.get_task_changes(user_id, since)
+
+        if changes is None:
+            return (
+                jsonify({"success": False, "message": "Failed to get changes"}),
+                500,
+            )
+
+        return (
+            jsonify({"success": True, "watermark": str(watermark), **changes}),
+            200,
+        )
+
+    except Exception as e:
+        print(f"Get task changes error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/<task_id>", methods=["GET"])
+async def get_task(task_id):
+    """Get a specific task"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        task = await data_handler.get_task_by_id(task_id, user_id)
+
+        if task:
+            return (
+                jsonify({"success": True, "task": task}),
+                200,
+            )
+        else:
+            return (
+                jsonify({"success": False, "message": "Task not found"}),
+                404,
+            )
+
+    except Exception as e:
+        print(f"Get task error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks", methods=["GET"])
+async def get_tasks():
+    """Get all tasks for the user, optionally filtered by list_id"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        list_id = request.args.get("listId")
+
+        try:
+            page = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        if wants_ndjson():
+            tasks = await data_handler.get_tasks(user_id, list_id, **page, stream=True)
+            return tasks_response(tasks, page, stream=True)
+
+        version = await data_handler.get_data_version(user_id)
+        etag = data_etag(user_id, version)
+        if not_modified(etag):
+            return await with_etag(Response(status=304), etag)
+
+        tasks = await data_handler.get_tasks(user_id, list_id, **page)
+
+        return await with_etag(tasks_response(tasks, page), etag)
+
+    except Exception as e:
+        print(f"Get tasks error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/<task_id>", methods=["PUT"])
+async def update_task(task_id):
+    """Update a task"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = await request.get_json()
+
+        if not data:
+            return jsonify({"success": False, "message": "No data provided"}), 400
+
+        # Convert dueDate if provided
+        if "dueDate" in data and data["dueDate"]:
+            data["dueDate"] = datetime.fromisoformat(
+                data["dueDate"].replace("Z", "+00:00")
+            )
+
+        success = await data_handler.update_task(task_id, user_id, data)
+
+        if success:
+            return (
+                jsonify({"success": True, "message": "Task updated successfully"}),
+                200,
+            )
+        else:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "Failed to update task or task not found",
+                    }
+                ),
+                404,
+            )
+
+    except Exception as e:
+        print(f"Update task error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/<task_id>", methods=["DELETE"])
+async def delete_task(task_id):
+    """Delete a task"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        success = await data_handler.delete_task(task_id, user_id)
+
+        if success:
+            return (
+                jsonify({"success": True, "message": "Task deleted successfully"}),
+                200,
+            )
+        else:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "Failed to delete task or task not found",
+                    }
+                ),
+                404,
+            )
+
+    except Exception as e:
+        print(f"Delete task error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/bulk-delete", methods=["DELETE"])
+async def delete_multiple_tasks():
+    """Delete multiple tasks"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = await request.get_json()
+        if not data or "taskIds" not in data or not data["taskIds"]:
+            return jsonify({"success": False, "message": "Task IDs are required"}), 400
+
+        task_ids = data["taskIds"]
+        if not isinstance(task_ids, list):
+            return (
+                jsonify({"success": False, "message": "Task IDs must be an array"}),
+                400,
+            )
+
+        deleted_count = await data_handler.delete_multiple_tasks(task_ids, user_id)
+
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "message": f"{deleted_count} tasks deleted successfully",
+                    "deletedCount": deleted_count,
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        print(f"Delete multiple tasks error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/<task_id>/complete", methods=["PUT"])
+async def toggle_task_completion(task_id):
+    """Toggle task completion status"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = await request.get_json()
+
+        if not data or "isCompleted" not in data:
+            return (
+                jsonify({"success": False, "message": "isCompleted field is required"}),
+                400,
+            )
+
+        is_completed = data["isCompleted"]
+
+        success = await data_handler.mark_task_completed(task_id, user_id, is_completed)
+
+        if success:
+            return (
+                jsonify(
+                    {
+                        "success": True,
+                        "message": f"Task marked as {'completed' if is_completed else 'incomplete'}",
+                    }
+                ),
+                200,
+            )
+        else:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "Failed to update task or task not found",
+                    }
+                ),
+                404,
+            )
+
+    except Exception as e:
+        print(f"Toggle task completion error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/<task_id>/important", methods=["PUT"])
+async def toggle_task_importance(task_id):
+    """Toggle task importance status"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = await request.get_json()
+
+        if not data or "isImportant" not in data:
+            return (
+                jsonify({"success": False, "message": "isImportant field is required"}),
+                400,
+            )
+
+        is_important = data["isImportant"]
+
+        # Update the task's importance status
+        success = await data_handler.mark_task_important(task_id, user_id, is_important)
+
+        if success:
+            # Find the Important list ID
+            default_list_ids = await data_handler.get_default_list_ids(user_id)
+            important_list_id = default_list_ids.get("Important")
+
+            if important_list_id:
+                if is_important:
+                    # Add task to Important list
+                    await data_handler.add_task_to_list(
+                        task_id, user_id, important_list_id
+                    )
+                else:
+                    # Remove task from Important list (but keep in other lists)
+                    await data_handler.remove_task_from_list(
+                        task_id, user_id, important_list_id
+                    )
+
+            return (
+                jsonify(
+                    {
+                        "success": True,
+                        "message": f"Task marked as {'important' if is_important else 'not important'}",
+                    }
+                ),
+                200,
+            )
+        else:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "Failed to update task or task not found",
+                    }
+                ),
+                404,
+            )
+
+    except Exception as e:
+        print(f"Toggle task importance error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/add-to-lists", methods=["POST"])
+async def add_tasks_to_lists():
+    """Add multiple tasks to one or more lists"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = await request.get_json()
+        if not data or "taskIds" not in data or "listIds" not in data:
+            return (
+                jsonify(
+                    {"success": False, "message": "Task IDs and List IDs are required"}
+                ),
+                400,
+            )
+
+        task_ids = data["taskIds"]
+        list_ids = data["listIds"]
+
+        if not isinstance(task_ids, list) or not isinstance(list_ids, list):
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "Task IDs and List IDs must be arrays",
+                    }
+                ),
+                400,
+            )
+
+        counts = await data_handler.add_tasks_to_lists(task_ids, user_id, list_ids)
+
+        if counts is None:
+            return (
+                jsonify({"success": False, "message": "Failed to add tasks to lists"}),
+                500,
+            )
+
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "message": f"Successfully added tasks to lists",
+                    "addedCount": counts["modifiedCount"],
+                    **counts,
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        print(f"Add tasks to lists error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/sync", methods=["POST"])
+async def sync():
+    """Apply an ordered batch of client mutations and return the resulting state"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = await request.get_json()
+        if not data or not isinstance(data.get("ops"), list):
+            return jsonify({"success": False, "message": "ops must be an array"}), 400
+
+        if len(data["ops"]) > MAX_SYNC_OPS:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": f"At most {MAX_SYNC_OPS} ops per request",
+                    }
+                ),
+                400,
+            )
+
+        default_list_ids = await data_handler.get_default_list_ids(user_id)
+        id_map = {}
+        results = []
+        mutations = []
+        mutation_indexes = []
+        for index, op in enumerate(data["ops"]):
+            try:
+                mutation = parse_sync_op(op, user_id, id_map, default_list_ids)
+            except ValueError as e:
+                results.append({"index": index, "status": "error", "error": str(e)})
+                continue
+            results.append({"index": index, "taskId": mutation["taskId"]})
+            mutations.append(mutation)
+            mutation_indexes.append(index)
+
+        statuses = await data_handler.apply_mutations(user_id, mutations)
+        touched_ids = {mutation["taskId"] for mutation in mutations}
+        tasks = await data_handler.get_tasks_by_ids(list(touched_ids), user_id)
+        deleted_ids = finish_sync_results(
+            results, mutations, mutation_indexes, statuses, tasks
+        )
+
+        return (
+            jsonify(
+                {
+                    "success": True,
+                    "results": results,
+                    "idMap": id_map,
+                    "tasks": tasks,
+                    "deletedTaskIds": sorted(deleted_ids),
+                }
+            ),
+            200,
+        )
+
+    except Exception as e:
+        print(f"Sync error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+# ==================== TASK LIST ROUTES ====================
+
+
+@app.route("/task-lists", methods=["POST"])
+async def create_task_list():
+    """Create a new task list"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = await request.get_json()
+
+        if not data or "name" not in data:
+            return (
+                jsonify({"success": False, "message": "Task list name is required"}),
+                400,
+            )
+
+        # Create task list data with user_id
+        list_data = {
+            "name": data["name"],
+            "user_id": user_id,
+            "icon": data.get("icon", "list"),
+            "iconColor": data.get("iconColor", 0xFF0078D4),
+            "isDefault": data.get("isDefault", False),
+        }
+
+        list_id = await data_handler.create_task_list(list_data)
+
+        if list_id:
+            return (
+                jsonify(
+                    {
+                        "success": True,
+                        "message": "Task list created successfully",
+                        "listId": list_id,
+                    }
+                ),
+                201,
+            )
+        else:
+            return (
+                jsonify({"success": False, "message": "Failed to create task list"}),
+                500,
+            )
+
+    except Exception as e:
+        print(f"Create task list error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/task-lists/<list_id>", methods=["GET"])
+async def get_task_list(list_id):
+    """Get a specific task list"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        task_list = await data_handler.get_task_list_by_id(list_id, user_id)
+
+        if task_list:
+            return (
+                jsonify({"success": True, "taskList": task_list}),
+                200,
+            )
+        else:
+            return (
+                jsonify({"success": False, "message": "Task list not found"}),
+                404,
+            )
+
+    except Exception as e:
+        print(f"Get task list error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/task-lists", methods=["GET"])
+async def get_task_lists():
+    """Get all task lists for the user"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        default_only = request.args.get("defaultOnly", "false").lower() == "true"
+
+        version = await data_handler.get_data_version(user_id)
+        etag = data_etag(user_id, version)
+        if not_modified(etag):
+            return await with_etag(Response(status=304), etag)
+
+        # Keyed by the version just read, instead of reading it again
+        task_lists = await data_handler.get_task_lists(user_id, default_only, version)
+
+        return await with_etag(
+            (jsonify({"success": True, "taskLists": task_lists}), 200), etag
+        )
+
+    except Exception as e:
+        print(f"Get task lists error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/task-lists/<list_id>", methods=["PUT"])
+async def update_task_list(list_id):
+    """Update a task list"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        data = await request.get_json()
+
+        if not data:
+            return jsonify({"success": False, "message": "No data provided"}), 400
+
+        success = await data_handler.update_task_list(list_id, user_id, data)
+
+        if success:
+            return (
+                jsonify({"success": True, "message": "Task list updated successfully"}),
+                200,
+            )
+        else:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "Failed to update task list or list not found",
+                    }
+                ),
+                404,
+            )
+
+    except Exception as e:
+        print(f"Update task list error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/task-lists/<list_id>", methods=["DELETE"])
+async def delete_task_list(list_id):
+    """Delete a task list and all its tasks"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        success = await data_handler.delete_task_list(list_id, user_id)
+
+        if success:
+            return (
+                jsonify(
+                    {
+                        "success": True,
+                        "message": "Task list and all its tasks deleted successfully",
+                    }
+                ),
+                200,
+            )
+        else:
+            return (
+                jsonify(
+                    {
+                        "success": False,
+                        "message": "Failed to delete task list, list not found, or cannot delete default list",
+                    }
+                ),
+                400,
+            )
+
+    except Exception as e:
+        print(f"Delete task list error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+# ==================== UTILITY ROUTES ====================
+
+
+@app.route("/tasks/important", methods=["GET"])
+async def get_important_tasks():
+    """Get all important tasks for the user"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        try:
+            page = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        stream = wants_ndjson()
+        tasks = await data_handler.get_important_tasks(user_id, **page, stream=stream)
+
+        return tasks_response(tasks, page, stream)
+
+    except Exception as e:
+        print(f"Get important tasks error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/completed", methods=["GET"])
+async def get_completed_tasks():
+    """Get all completed tasks for the user"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        try:
+            page = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        stream = wants_ndjson()
+        tasks = await data_handler.get_completed_tasks(user_id, **page, stream=stream)
+
+        return tasks_response(tasks, page, stream)
+
+    except Exception as e:
+        print(f"Get completed tasks error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/tasks/search", methods=["GET"])
+async def search_tasks():
+    """Search tasks by title and note for the user"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        search_term = request.args.get("q")
+
+        if not search_term:
+            return (
+                jsonify({"success": False, "message": "Search term is required"}),
+                400,
+            )
+
+        try:
+            page = parse_page_args(request.args)
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        stream = wants_ndjson()
+        if request.args.get("fuzzy", "false").lower() == "true":
+            # Typo-tolerant ranked matches from the in-memory trigram index
+            if page["after"] is not None or page["sort"] is not None:
+                return (
+                    jsonify(
+                        {
+                            "success": False,
+                            "message": "Fuzzy search does not support sort or after",
+                        }
+                    ),
+                    400,
+                )
+            tasks = await data_handler.fuzzy_search_tasks(
+                user_id, search_term, page["limit"]
+            )
+            return tasks_response(tasks, {**page, "limit": None}, stream)
+
+        tasks = await data_handler.search_tasks(
+            user_id, search_term, **page, stream=stream
+        )
+
+        if page["after"] is None and page["sort"] is None:
+            # Ranked results are not keyset paginated, so there is no cursor
+            return tasks_response(tasks, {**page, "limit": None}, stream)
+        return tasks_response(tasks, page, stream)
+
+    except Exception as e:
+        print(f"Search tasks error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/task-lists/stats", methods=["GET"])
+async def get_all_list_stats():
+    """Get statistics for every task list of the user in one request"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        stats = await data_handler.get_all_list_stats(user_id)
+
+        if stats is not None:
+            return (
+                jsonify({"success": True, **stats}),
+                200,
+            )
+        else:
+            return (
+                jsonify({"success": False, "message": "Failed to get list stats"}),
+                500,
+            )
+
+    except Exception as e:
+        print(f"Get all list stats error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+@app.route("/task-lists/<list_id>/stats", methods=["GET"])
+async def get_list_stats(list_id):
+    """Get statistics for a specific task list"""
+    try:
+        user_id = get_user_id_from_headers()
+        if not user_id:
+            return (
+                jsonify({"success": False, "message": "User authentication required"}),
+                401,
+            )
+
+        stats = await data_handler.get_list_stats(list_id, user_id)
+
+        if stats is not None:
+            return (
+                jsonify({"success": True, "stats": stats}),
+                200,
+            )
+        else:
+            return (
+                jsonify({"success": False, "message": "Task list not found"}),
+                404,
+            )
+
+    except Exception as e:
+        print(f"Get list stats error: {e}")
+        return jsonify({"success": False, "message": "Internal server error"}), 500
+
+
+if __name__ == "__main__":
+    app.run(debug=True)
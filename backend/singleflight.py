@@ -0,0 +1,101 @@
+import asyncio
+import threading
+
+
+class _Call:
+    """One in-flight load that followers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce identical concurrent reads into one in-flight load.
+
+    Callers passing the same user ID and key while a load is running wait for
+    it and share its result (or exception) instead of starting their own. Keys
+    are compared by repr, so they may hold lists and dicts. Results are shared
+    objects, so callers must not mutate them. Writes call forget(user_id) so
+    reads arriving after them never join a load that may have started before
+    the write.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {user_id: {key: _Call or asyncio.Task}}
+        self._calls = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _join(self, user_id, key, start):
+        """Return (call, is_leader), registering start() as the leader if idle"""
+        with self._lock:
+            calls = self._calls.setdefault(user_id, {})
+            call = calls.get(key)
+            if call is not None:
+                self.coalesced += 1
+                return call, False
+            call = calls[key] = start()
+            self.leaders += 1
+            return call, True
+
+    def _finish(self, user_id, key, call):
+        with self._lock:
+            calls = self._calls.get(user_id)
+            # forget() may have dropped the entry, or a newer load replaced it
+            if calls is not None and calls.get(key) is call:
+                del calls[key]
+                if not calls:
+                    del self._calls[user_id]
+
+    def do(self, user_id, key, load):
+        """Return load(), sharing one call among concurrent identical callers"""
+        key = repr(key)
+        call, leader = self._join(user_id, key, _Call)
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = load()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            self._finish(user_id, key, call)
+            call.done.set()
+        return call.result
+
+    async def ado(self, user_id, key, load):
+        """do() for a coroutine function load"""
+        key = repr(key)
+
+        def start():
+            # Run the load as its own task so a cancelled caller does not
+            # cancel it for everyone else
+            task = asyncio.ensure_future(load())
+            task.add_done_callback(lambda _: self._finish(user_id, key, task))
+            return task
+
+        task, _ = self._join(user_id, key, start)
+        return await asyncio.shield(task)
+
+    def forget(self, user_id):
+        """Stop later reads of user_id from joining loads already in flight"""
+        with self._lock:
+            self._calls.pop(user_id, None)
+
+    def stats(self):
+        """Loads started and calls that joined one instead"""
+        with self._lock:
+            total = self.leaders + self.coalesced
+            return {
+                "loads": self.leaders,
+                "coalesced": self.coalesced,
+                "coalescedRate": self.coalesced / total if total else 0.0,
+                "inFlight": sum(len(calls) for calls in self._calls.values()),
+            }
@@ -0,0 +1,58 @@
+from datetime import date
+
+import pytest
+
+from extractors import extract_activities_fast
+
+TODAY = date(2026, 10, 17)
+
+
+def fast(message):
+    return extract_activities_fast(message, today=TODAY)
+
+
+@pytest.mark.parametrize(
+    "message, activity, activity_date",
+    [
+        ("buy milk", "milk", "18-10-26"),
+        ("call mom tomorrow", "mom", "18-10-26"),
+        ("dentist on 20/10", "dentist", "20-10-26"),
+        ("dentist 20-10", "dentist", "20-10-26"),
+        # A bare dd-mm that has passed means next year
+        ("dentist 01-02", "dentist", "01-02-27"),
+        ("dentist on 5-11-2026", "dentist", "05-11-26"),
+        ("don't forget to buy milk", "milk", "18-10-26"),
+    ],
+)
+def test_simple_messages(message, activity, activity_date):
+    assert fast(message) == {
+        "activities": [{"activity": activity, "date": activity_date}]
+    }
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        # Quantities, ranges and decimals are not dates
+        "buy 2.5 kg rice",
+        "read 1-2 chapters",
+        "read chapter 3.2",
+        "buy 2-3 apples tomorrow",
+        # Negated or cancelled plans
+        "no gym tomorrow",
+        "cancel dentist tomorrow",
+        "skip gym tomorrow",
+        "not doing laundry today",
+        "don't call bob tomorrow",
+        # Chit-chat and verbless messages without a date
+        "hello",
+        "thanks",
+        "dentist",
+        # Impossible dates
+        "dentist on 31-02",
+        # Anything compound
+        "buy milk and eggs",
+    ],
+)
+def test_left_to_the_llm(message):
+    assert fast(message) is None
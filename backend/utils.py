@@ -1,60 +1,89 @@
-def validate_object(obj):
-    if not isinstance(obj, dict):
-        return False
+from typing import Any, Dict, List, Optional
 
-    if set(obj.keys()) != {"update_id", "message"}:
-        return False
+from pydantic import BaseModel, ConfigDict, Field, ValidationError, model_validator
 
-    if not isinstance(obj["update_id"], int):
-        return False
 
-    message = obj["message"]
+# ==================== COMPILED TELEGRAM SCHEMA ====================
+# Validated in a single pass by pydantic-core, straight from the raw body.
+# Unknown fields are ignored so real updates carrying entities, usernames
+# or edits are accepted.
 
-    if set(message.keys()) != {"message_id", "from", "chat", "date", "text"}:
-        return False
 
-    if not isinstance(message["message_id"], int):
-        return False
+class _TelegramObject(BaseModel):
+    model_config = ConfigDict(strict=True, extra="ignore", populate_by_name=True)
 
-    from_obj = message["from"]
-    if set(from_obj.keys()) != {
-        "id",
-        "is_bot",
-        "first_name",
-        "last_name",
-        "language_code",
-    }:
-        return False
 
-    if (
-        not isinstance(from_obj["id"], int)
-        or not isinstance(from_obj["is_bot"], bool)
-        or not isinstance(from_obj["first_name"], str)
-        or not isinstance(from_obj["last_name"], str)
-        or not isinstance(from_obj["language_code"], str)
-    ):
-        return False
+class TelegramUser(_TelegramObject):
+    id: int
+    is_bot: bool
+    first_name: str
+    last_name: Optional[str] = None
+    username: Optional[str] = None
+    language_code: Optional[str] = None
 
-    chat_obj = message["chat"]
-    if set(chat_obj.keys()) != {"id", "first_name", "last_name", "type"}:
-        return False
 
-    if (
-        not isinstance(chat_obj["id"], int)
-        or not isinstance(chat_obj["first_name"], str)
-        or not isinstance(chat_obj["last_name"], str)
-        or not isinstance(chat_obj["type"], str)
-    ):
-        return False
+class TelegramChat(_TelegramObject):
+    id: int
+    type: str
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    username: Optional[str] = None
+    title: Optional[str] = None
 
-    if not isinstance(message["date"], int):
-        return False
 
-    if not isinstance(message["text"], str):
-        return False
+class TelegramMessage(_TelegramObject):
+    message_id: int
+    from_user: Optional[TelegramUser] = Field(default=None, alias="from")
+    chat: TelegramChat
+    date: int
+    text: str
+    entities: Optional[List[Dict[str, Any]]] = None
+    edit_date: Optional[int] = None
 
-    return True
 
+class TelegramUpdate(_TelegramObject):
+    update_id: int
+    message: Optional[TelegramMessage] = None
+    edited_message: Optional[TelegramMessage] = None
 
-def extract_text_from_object(data):
-    return data["message"]["text"]
+    @model_validator(mode="after")
+    def _require_message(self):
+        if self.message is None and self.edited_message is None:
+            raise ValueError("update carries no text message")
+        return self
+
+    @property
+    def text(self):
+        return (self.message or self.edited_message).text
+
+
+class _TelegramEnvelope(_TelegramObject):
+    """Any well-formed update, whatever it carries"""
+
+    update_id: int
+    message: Optional[Dict[str, Any]] = None
+    edited_message: Optional[Dict[str, Any]] = None
+
+
+def _validate(model, data):
+    try:
+        if isinstance(data, (bytes, str)):
+            return model.model_validate_json(data)
+        return model.model_validate(data)
+    except ValidationError:
+        return None
+
+
+def parse_update(data):
+    """Validate a Telegram update given as raw JSON (bytes/str) or a decoded dict"""
+    return _validate(TelegramUpdate, data)
+
+
+def is_textless_update(data):
+    """Check whether data is a well-formed update without a text message, e.g.
+    a photo, sticker or member change, which is acknowledged and ignored"""
+    envelope = _validate(_TelegramEnvelope, data)
+    if envelope is None:
+        return False
+    messages = (envelope.message, envelope.edited_message)
+    return not any(message and "text" in message for message in messages)